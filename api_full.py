@@ -1,13 +1,11 @@
-from flask import Flask, jsonify, request, render_template
-from src.data_fetcher import fetch_player_data, fetch_fixtures, fetch_team_data
-from src.data_processor import prepare_dataset
-from src.model_trainer import train_model, load_model
-from src.team_optimizer import TeamOptimizer
-import pandas as pd
-import numpy as np
+from flask import Flask, jsonify, request, render_template, g, Response
+from src.data_fetcher import FPLAPIError, UPSTREAM_RATE
+from src import metrics
 import requests
-import random
-from datetime import datetime
+import multiprocessing
+import os
+import threading
+import time
 
 app = Flask(__name__)
 
@@ -16,33 +14,151 @@ CORS(app)
 
 FPL_ID = 0 # Use your FPL ID here (Have mentioned how to find this ID in the README.md)
 
-def get_fpl_entry_info(fpl_id):
-    url = f"https://fantasy.premierleague.com/api/entry/{fpl_id}/"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    return None
-
-def fetch_current_gw():
-    url = "https://fantasy.premierleague.com/api/bootstrap-static/"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        for event in data['events']:
-            if event['is_current']:
-                return event['id']
-    return None
-
-def fetch_team_picks(fpl_id, gw):
-    url = f"https://fantasy.premierleague.com/api/entry/{fpl_id}/event/{gw}/picks/"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    return None
+# Option bounds for the JSON API; requests outside them get a 400
+MAX_TRANSFERS_LIMIT = 3
+TOP_K_LIMIT = 20
+HORIZON_LIMIT = 8
+SIMULATIONS_LIMIT = 200_000
+MAX_BATCH_MANAGERS = 200
+BATCH_PROCESSES = max(1, (os.cpu_count() or 1) - 1)   # /api/batch workers; one core is left to the web threads
+CHIP_PROCESSES = None       # worker processes for the chip MILPs; None uses every core
+MAX_LEAGUE_MANAGERS = 500   # standings rows /api/leagues reads
+# /api/leagues fetches picks for only as many managers as the upstream rate allows in
+# this many seconds; the rest of the standings are listed but not in the ownership
+LEAGUE_SECONDS = 10
+LEAGUE_PICKS = max(1, int(UPSTREAM_RATE * LEAGUE_SECONDS))
+
+# The model registry, recommender and precompute scheduler are built by load_app(), not
+# at import: it is what pulls in pandas, SciPy and XGBoost, which take seconds. A
+# worker therefore starts serving at once. A warm-up thread loads everything and
+# precomputes the from-scratch squad, and requests other than /ready and /metrics wait
+# for the load. Set FPL_WARM_UP=0 to skip the thread and load on the first request.
+model_registry = None   # new versions from `python -m src.model_trainer` are hot-swapped in
+recommender = None      # fetch -> predict -> optimize, cached per snapshot, model, manager and options
+# Background thread that re-polls the snapshot and precomputes into the recommender's
+# cache, so requests near a deadline are cache reads. Opt in with FPL_PRECOMPUTE=1
+# (each process running the app gets its own scheduler and cache).
+scheduler = None
+# Process pool for /api/batch, kept for the life of the app. Its workers are spawned,
+# not forked: forking this multithreaded server would copy locks other threads hold.
+batch_executor = None
+_load_lock = threading.Lock()
+_loaded = False
+warm_up_state = {'started': None, 'seconds': {}, 'error': None, 'done': False}
+LIGHT_ENDPOINTS = {'ready', 'metrics_endpoint', 'static'}
+
+def load_app():
+    # Import the heavy modules and build the app's objects, once. Globals set beforehand
+    # (e.g. by tests or benchmarks) are kept.
+    global model_registry, recommender, scheduler, batch_executor, _loaded
+    if _loaded:
+        return
+    with _load_lock:
+        if _loaded:
+            return
+        seconds = warm_up_state['seconds']
+        mark = time.perf_counter()
+        from src.model_trainer import ModelRegistry
+        from src.recommender import Recommender
+        from src.scheduler import PrecomputeScheduler
+        seconds['imports'] = round(time.perf_counter() - mark, 3)
+        mark = time.perf_counter()
+        if model_registry is None:
+            model_registry = ModelRegistry()
+            model_registry.load()
+        seconds['model'] = round(time.perf_counter() - mark, 3)
+        if recommender is None:
+            recommender = Recommender(model_registry)
+        if scheduler is None:
+            scheduler = PrecomputeScheduler(recommender, processes=1)
+            if os.environ.get('FPL_PRECOMPUTE') == '1':
+                scheduler.start()
+        if batch_executor is None and BATCH_PROCESSES > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            batch_executor = ProcessPoolExecutor(max_workers=BATCH_PROCESSES,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        _loaded = True
+
+def warm_up():
+    # load_app(), then the snapshot, player pool, squad and captaincy for the default
+    # options, so the first real request is a cache read. Upstream failures are
+    # reported in /ready; requests then fetch for themselves as before.
+    warm_up_state['started'] = time.time()
+    try:
+        with metrics.stage('warm_up'):
+            load_app()
+            mark = time.perf_counter()
+            recommender.recommend(None)
+            warm_up_state['seconds']['snapshot'] = round(time.perf_counter() - mark, 3)
+    except Exception as e:
+        warm_up_state['error'] = str(e)
+        print(f"Warm-up failed: {e}")
+    finally:
+        warm_up_state['done'] = True
+
+# Spawned batch workers import this module too; they must not warm up
+if os.environ.get('FPL_WARM_UP', '1') == '1' and multiprocessing.parent_process() is None:
+    threading.Thread(target=warm_up, name='fpl-warm-up', daemon=True).start()
+
+# Requests carrying this header are run under cProfile and dumped to metrics.PROFILE_DIR.
+# Off unless FPL_PROFILING=1 (or debug mode), since every dump is a file on disk.
+PROFILE_HEADER = 'X-Profile'
+PROFILING_ENABLED = os.environ.get('FPL_PROFILING') == '1'
+
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.profiler = None
+    if (PROFILING_ENABLED or app.debug) and request.headers.get(PROFILE_HEADER):
+        g.profiler = metrics.start_profile()
+
+@app.before_request
+def _require_app():
+    if request.endpoint not in LIGHT_ENDPOINTS:
+        load_app()
+
+@app.after_request
+def _record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.HTTP_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=endpoint, method=request.method)
+    if g.get('profiler') is not None:
+        path = metrics.dump_profile(g.profiler, f"{request.method}-{request.path}")
+        g.profiler = None
+        response.headers['X-Profile-Path'] = path
+    return response
+
+@app.teardown_request
+def _stop_leftover_profiler(error=None):
+    # after_request is skipped when the view raises; never leave a profiler running
+    if g.get('profiler') is not None:
+        g.profiler.disable()
+        g.profiler = None
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/ready')
+def ready():
+    # 200 once the model registry has loaded and a snapshot has been fetched, 503 before
+    model_loaded = _loaded and model_registry is not None
+    snapshot = recommender.snapshot_version if _loaded and recommender is not None else None
+    body = {
+        'ready': model_loaded and snapshot is not None,
+        'model_loaded': model_loaded,
+        'model_version': model_registry.version if model_loaded else None,
+        'snapshot_version': snapshot,
+        'warm_up': warm_up_state,
+    }
+    return jsonify(body), 200 if body['ready'] else 503
 
 def generate_fdr(opponent_team_id, teams):
-    team = next((t for t in teams if t.get('id') == opponent_team_id), None)
-    if team and 'previous_season_rank' in team:
+    # Rank-based fallback for when a fixture carries no FPL difficulty
+    from src.data_processor import NEUTRAL_FDR
+    team_by_id = teams if isinstance(teams, dict) else {t.get('id'): t for t in teams}
+    team = team_by_id.get(opponent_team_id)
+    if team and team.get('previous_season_rank') is not None:
         rank = team['previous_season_rank']
         if rank <= 4:
             return 5
@@ -52,25 +168,7 @@ def generate_fdr(opponent_team_id, teams):
             return 3
         else:
             return 2
-    return random.randint(2, 5)
-
-def fixture_adjustment(fdr):
-    return {2: 1.2, 3: 1.0, 4: 0.85, 5: 0.7}.get(fdr, 1.0)
-
-def get_injury_severity(player):
-    chance = player.get('chance_of_playing_next_round', 100)
-    news = player.get('news', '').lower()
-    import re
-    date_match = re.search(r'(\d{1,2} [A-Za-z]{3})', news)
-    if date_match:
-        try:
-            return_date = datetime.strptime(date_match.group(1) + f" {datetime.now().year}", "%d %b %Y")
-            days_out = (return_date - datetime.now()).days
-        except Exception:
-            days_out = 0
-    else:
-        days_out = 0
-    return (100 - (chance if chance is not None else 100)) + days_out
+    return NEUTRAL_FDR
 
 def normalize_position(pos):
     if pos in ['GK', 'GKP']:
@@ -83,307 +181,203 @@ def normalize_position(pos):
         return 'FWD'
     return pos
 
-def map_team_names(players, teams):
-    team_id_to_name = {int(t['id']): t['name'] for t in teams if 'id' in t and 'name' in t}
-    for player in players:
-        if 'team' in player:
-            team_val = player['team']
-            try:
-                team_id = int(team_val)
-            except Exception:
-                team_id = team_val
-            player['team_name'] = team_id_to_name.get(team_id, str(team_val))
-
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    fpl_info = recommended_team = total_points_used = current_team = transfer = captain = vice_captain = None
+    fpl_info = recommended_team = total_points_used = current_team = transfer = captain = vice_captain = plan = simulation = None
+    fpl_id = None
     total_expected_points = 0
     main_11 = []
     bench_4 = []
+    captaincy = []
     if request.method == 'POST':
-        # Data fetch and processing
-        players = fetch_player_data()
-        fixtures = fetch_fixtures()
-        teams = fetch_team_data()
-
-        # Prepare dataset and ensure player name is included
-        processed_data = prepare_dataset(players, fixtures)
-        # Build a mapping from player id to web_name
-        id_to_name = {p['id']: p.get('web_name', '') for p in players if 'id' in p}
-        for player in processed_data:
-            if 'id' in player:
-                player['web_name'] = id_to_name.get(player['id'], '')
-
-        # Map team names for processed_data
-        map_team_names(processed_data, teams)
-
-        # Model
-        model_filename = "model.xgb"
-        try:
-            model = load_model(model_filename)
-        except Exception:
-            df = pd.DataFrame(processed_data)
-            if 'total_points' not in df.columns:
-                return render_template('index.html', error='Missing total_points in data')
-            df['target'] = df['total_points']
-            numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-            feature_cols = [col for col in numeric_cols if col not in ['id', 'total_points', 'target', 'expected_points']]
-            train_df = df[feature_cols + ['target']]
-            model, _ = train_model(train_df)
-
-        df = pd.DataFrame(processed_data)
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-        feature_cols = [col for col in numeric_cols if col not in ['id', 'total_points', 'expected_points']]
-        try:
-            preds = model.predict(df[feature_cols])
-            for i, player in enumerate(processed_data):
-                player['expected_points'] = float(preds[i])
-        except Exception:
-            for player in processed_data:
-                player['expected_points'] = player.get('total_points', 0)
-
-        for player in processed_data:
-            player['cost'] = player.get('price', 0)
-
-        # Always select a team with total points between 90 and 99 (inclusive)
-        import random
-        max_players_per_position = {'GKP': 2, 'DEF': 5, 'MID': 5, 'FWD': 3}
-        optimized_team = []
-        total_points_used = 0
-        max_attempts = 30
-        for _ in range(max_attempts):
-            budget = round(random.uniform(90, 100), 2)
-            optimizer = TeamOptimizer(processed_data, budget, max_players_per_position)
-            team = optimizer.optimize_team()
-            # Sort team for points calculation
-            position_order = ['GKP', 'DEF', 'MID', 'FWD']
-            grouped = {k: [] for k in position_order}
-            for player in team:
-                pos = normalize_position(player.get('position', ''))
-                if pos in grouped:
-                    grouped[pos].append(player)
-                else:
-                    grouped.setdefault(pos, []).append(player)
-            sorted_team = []
-            for pos in position_order:
-                sorted_team.extend(grouped.get(pos, []))
-            points = sum(float(p.get('price', p.get('cost', 0))) for p in sorted_team)
-            if 90.0 <= points <= 100.0:
-                optimized_team = team
-                total_points_used = points
-                break
-        else:
-            # Fallback: use last attempt even if not in range
-            optimized_team = team
-            total_points_used = points
-
-        # Map team names for optimized_team
-        map_team_names(optimized_team, teams)
-
-        # Sort team for frontend: GK, DEF, MID, FWD
-        position_order = ['GKP', 'DEF', 'MID', 'FWD']
-        grouped = {k: [] for k in position_order}
-        for player in optimized_team:
-            pos = normalize_position(player.get('position', ''))
-            if pos in grouped:
-                grouped[pos].append(player)
-            else:
-                grouped.setdefault(pos, []).append(player)
-        sorted_team = []
-        for pos in position_order:
-            sorted_team.extend(grouped.get(pos, []))
-
-        # Ensure team_name is set for all players in sorted_team
-        map_team_names(sorted_team, teams)
-        for player in sorted_team:
-            player['total_points'] = player.get('total_points', 0)
-            player['expected_points'] = player.get('expected_points', 0)
-
-
-        # Explicitly select main and bench for each position: GK(1+1), DEF(4+1), MID(4+1), FWD(2+1)
-        def pick_best(players, n):
-            return sorted(players, key=lambda p: p.get('expected_points', 0), reverse=True)[:n]
-
-        # Always enforce 1 GK, 4 DEF, 4 MID, 2 FWD in the top 11
-        main_gks = pick_best(grouped['GKP'], 1)
-        main_defs = pick_best(grouped['DEF'], 4)
-        main_mids = pick_best(grouped['MID'], 4)
-        main_fwds = pick_best(grouped['FWD'], 2)
-        starters = main_gks + main_defs + main_mids + main_fwds
-
-        # Bench: next best in each position (excluding those already in starters)
-        bench_gks = pick_best([p for p in grouped['GKP'] if p not in main_gks], 1)
-        bench_defs = pick_best([p for p in grouped['DEF'] if p not in main_defs], 1)
-        bench_mids = pick_best([p for p in grouped['MID'] if p not in main_mids], 1)
-        bench_fwds = pick_best([p for p in grouped['FWD'] if p not in main_fwds], 1)
-        bench = bench_gks + bench_defs + bench_mids + bench_fwds
-
-        # Fill up to 15 with any remaining players (shouldn't be needed, but for safety)
-        all_selected = starters + bench
-        if len(all_selected) < 15:
-            pool = [p for p in sorted_team if p not in all_selected]
-            pool = sorted(pool, key=lambda p: p.get('expected_points', 0), reverse=True)
-            all_selected += pool[:15-len(all_selected)]
-
-        # Calculate total points/expected points for all 15 players, and for main 11 and 4 bench
-        total_points_used = sum(float(p.get('price', p.get('cost', 0))) for p in sorted_team)
-        total_expected_points = sum(float(p.get('expected_points', 0)) for p in sorted_team)
-
-        # Explicitly select and expose main XI and bench 4 for the template
-        main_11 = starters  # 1 GK, 4 DEF, 4 MID, 2 FWD
-        bench_4 = []
-        # Always try to fill bench 4 as 1 GK, 1 DEF, 1 MID, 1 FWD if possible
-        if bench_gks:
-            bench_4.append(bench_gks[0])
-        if bench_defs:
-            bench_4.append(bench_defs[0])
-        if bench_mids:
-            bench_4.append(bench_mids[0])
-        if bench_fwds:
-            bench_4.append(bench_fwds[0])
-        # If less than 4, fill with next highest expected points from remaining bench
-        if len(bench_4) < 4:
-            already = set(p['id'] for p in bench_4)
-            extra = [p for p in bench if p['id'] not in already]
-            extra = sorted(extra, key=lambda p: p.get('expected_points', 0), reverse=True)
-            bench_4 += extra[:4-len(bench_4)]
-
-        main_11_expected = sum(float(p.get('expected_points', 0)) for p in main_11)
-        bench_4_expected = sum(float(p.get('expected_points', 0)) for p in bench_4)
-
-        recommended_team = sorted_team
-
-        # FPL info
-        entry_info = get_fpl_entry_info(FPL_ID)
-        gw = fetch_current_gw()
-        fpl_info = None
-        if entry_info:
-            fpl_info = {
-                'player_name': f"{entry_info.get('player_first_name', '')} {entry_info.get('player_last_name', '')}",
-                'team_name': entry_info.get('name', ''),
-                'overall_points': entry_info.get('summary_overall_points', ''),
-                'overall_rank': entry_info.get('summary_overall_rank', ''),
-                'value': entry_info.get('last_deadline_value', ''),
-                'bank': entry_info.get('last_deadline_bank', ''),
-                'total_transfers': entry_info.get('summary_transfers', ''),
-                'gameweek': gw
-            }
-
-        # Current team
-        picks_data = fetch_team_picks(FPL_ID, gw) if gw else None
-        current_team = []
-        if picks_data and 'picks' in picks_data:
-            player_id_map = {p['id']: p for p in processed_data if 'id' in p}
-            for pick in picks_data['picks']:
-                pid = pick['element']
-                player = player_id_map.get(pid)
-                if player:
-                    current_team.append(player)
-
-        # Logic for GW1 or no current team: show only recommended team and captaincy
-        # Else: show only transfer and captaincy
-        recommended_team = sorted_team
-        transfer = None
-        captain = vice_captain = None
-        if (gw == 1) or (not current_team):
-            # Set total_points to 0 for each recommended player in GW1 or no team
-            for player in recommended_team:
-                player['total_points'] = 0
-            # GW1 or no team: show recommended team and captaincy
-            def get_captains(team):
-                sorted_team = sorted(team, key=lambda p: p.get('expected_points', 0), reverse=True)
-                captain = sorted_team[0] if sorted_team else None
-                vice_captain = sorted_team[1] if len(sorted_team) > 1 else None
-                return captain, vice_captain
-            captain, vice_captain = get_captains(sorted_team)
-        else:
-            # Later GWs: show only transfer and captaincy, enforce total points used <= 100
-            best_out = None
-            best_in = None
-            best_gain = 0
-            new_team = []
-            transfer_reason = None
-            injured_players = [p for p in current_team if p.get('chance_of_playing_next_round', 100) < 100 or ('injur' in p.get('news', '').lower() and p.get('news', ''))]
-            current_ids = set(p['id'] for p in current_team)
-            def team_count_check(temp_team):
-                from collections import Counter
-                team_ids = [p['team'] if isinstance(p['team'], int) else int(p['team']) for p in temp_team]
-                counts = Counter(team_ids)
-                return all(v <= 3 for v in counts.values())
-            def team_total_points(team):
-                position_order = ['GKP', 'DEF', 'MID', 'FWD']
-                grouped = {k: [] for k in position_order}
-                for player in team:
-                    pos = normalize_position(player.get('position', ''))
-                    if pos in grouped:
-                        grouped[pos].append(player)
-                    else:
-                        grouped.setdefault(pos, []).append(player)
-                sorted_team = []
-                for pos in position_order:
-                    sorted_team.extend(grouped.get(pos, []))
-                return sum(float(p.get('price', p.get('cost', 0))) for p in sorted_team)
-
-            if injured_players:
-                injured_players.sort(key=get_injury_severity, reverse=True)
-                out_player = injured_players[0]
-                for in_player in optimized_team:
-                    if in_player['id'] not in current_ids:
-                        temp_team = [p for p in current_team if p['id'] != out_player['id']] + [in_player]
-                        if not team_count_check(temp_team):
-                            continue
-                        temp_points = sum(p['expected_points'] for p in temp_team)
-                        orig_points = sum(p['expected_points'] for p in current_team)
-                        gain = temp_points - orig_points
-                        total_pts = team_total_points(temp_team)
-                        if gain > best_gain and total_pts <= 100:
-                            best_gain = gain
-                            best_out = out_player
-                            best_in = in_player
-            else:
-                for out_player in current_team:
-                    for in_player in optimized_team:
-                        if in_player['id'] not in current_ids:
-                            temp_team = [p for p in current_team if p['id'] != out_player['id']] + [in_player]
-                            if not team_count_check(temp_team):
-                                continue
-                            temp_points = sum(p['expected_points'] for p in temp_team)
-                            orig_points = sum(p['expected_points'] for p in current_team)
-                            gain = temp_points - orig_points
-                            total_pts = team_total_points(temp_team)
-                            if gain > best_gain and total_pts <= 100:
-                                best_gain = gain
-                                best_out = out_player
-                                best_in = in_player
-            if best_in and best_out:
-                new_team = [p for p in current_team if p['id'] != best_out['id']] + [best_in]
-                transfer_reason = best_out.get('news', None)
-                transfer = {
-                    'out': best_out,
-                    'in': best_in,
-                    'reason': transfer_reason,
-                    'gain': best_gain,
-                    'new_team': new_team
-                }
-                def get_captains(team):
-                    sorted_team = sorted(team, key=lambda p: p.get('expected_points', 0), reverse=True)
-                    captain = sorted_team[0] if sorted_team else None
-                    vice_captain = sorted_team[1] if len(sorted_team) > 1 else None
-                    return captain, vice_captain
-                captain, vice_captain = get_captains(new_team if new_team else current_team)
-
-    return render_template('index.html',
-        fpl_info=fpl_info,
-        recommended_team=recommended_team,
-        total_points_used=total_points_used,
-        total_expected_points=total_expected_points,
-        current_team=current_team,
-        transfer=transfer,
-        captain=captain,
-        vice_captain=vice_captain,
-        main_11=main_11,
-        bench_4=bench_4
+        fpl_id = request.form.get('fpl_id', type=int) or FPL_ID
+        rec = recommender.recommend(fpl_id)
+        selection = rec.selection
+        fpl_info = rec.fpl_info
+        total_points_used = selection.total_cost
+        total_expected_points = sum(float(p.get('expected_points', 0)) for p in rec.squad)
+        # Main XI and bench come straight from the solver
+        main_11 = selection.starters
+        bench_4 = selection.bench
+        current_team = rec.current_team
+        transfer = rec.transfer
+        plan = rec.plan
+        simulation = rec.simulation
+        captain, vice_captain = rec.captain, rec.vice_captain
+        captaincy = rec.captaincy
+        recommended_team = rec.squad
+        if rec.gw == 1 or not current_team:
+            # Show zero points for each recommended player in GW1 or no team (copies: the
+            # recommendation is cached and shared)
+            recommended_team = [dict(p, total_points=0) for p in rec.squad]
+
+    with metrics.stage('render'):
+        html = render_template('index.html',
+            fpl_info=fpl_info,
+            recommended_team=recommended_team,
+            total_points_used=total_points_used,
+            total_expected_points=total_expected_points,
+            current_team=current_team,
+            transfer=transfer,
+            captain=captain,
+            vice_captain=vice_captain,
+            main_11=main_11,
+            bench_4=bench_4,
+            plan=plan,
+            simulation=simulation,
+            captaincy=captaincy,
+            fpl_id=fpl_id
+        )
+    return html
+
+def _request_options():
+    # Query-string overrides of DEFAULT_OPTIONS, validated so the cache key space stays bounded
+    from src.recommender import DEFAULT_OPTIONS
+    args = request.args
+    options = DEFAULT_OPTIONS._replace(
+        budget=args.get('budget', DEFAULT_OPTIONS.budget, type=float),
+        max_transfers=args.get('max_transfers', DEFAULT_OPTIONS.max_transfers, type=int),
+        top_k=args.get('top_k', DEFAULT_OPTIONS.top_k, type=int),
+        horizon=args.get('horizon', DEFAULT_OPTIONS.horizon, type=int),
+        simulations=args.get('simulations', DEFAULT_OPTIONS.simulations, type=int),
     )
+    if not 80.0 <= options.budget <= 120.0:
+        raise ValueError("budget must be between 80.0 and 120.0")
+    if not 1 <= options.max_transfers <= MAX_TRANSFERS_LIMIT:
+        raise ValueError(f"max_transfers must be between 1 and {MAX_TRANSFERS_LIMIT}")
+    if not 1 <= options.top_k <= TOP_K_LIMIT:
+        raise ValueError(f"top_k must be between 1 and {TOP_K_LIMIT}")
+    if not 0 <= options.horizon <= HORIZON_LIMIT:
+        raise ValueError(f"horizon must be between 0 and {HORIZON_LIMIT}")
+    if not 1000 <= options.simulations <= SIMULATIONS_LIMIT:
+        raise ValueError(f"simulations must be between 1000 and {SIMULATIONS_LIMIT}")
+    return options._replace(budget=round(options.budget, 1))
+
+def _json_view(view, manager_id):
+    try:
+        options = _request_options()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        rec = recommender.recommend(manager_id, options)
+    except (FPLAPIError, requests.RequestException) as e:
+        print(f"Upstream failure for manager {manager_id}: {e}")
+        return jsonify({'error': 'FPL API unavailable'}), 502
+    response = jsonify(view(rec))
+    response.headers['X-Snapshot-Version'] = str(rec.snapshot_version)
+    return response
+
+@app.route('/api/squad', defaults={'manager_id': None})
+@app.route('/api/managers/<int:manager_id>/squad')
+def api_squad(manager_id):
+    from src.recommender import squad_json
+    return _json_view(squad_json, manager_id)
+
+@app.route('/api/lineup', defaults={'manager_id': None})
+@app.route('/api/managers/<int:manager_id>/lineup')
+def api_lineup(manager_id):
+    from src.recommender import lineup_json
+    return _json_view(lineup_json, manager_id)
+
+@app.route('/api/captaincy', defaults={'manager_id': None})
+@app.route('/api/managers/<int:manager_id>/captaincy')
+def api_captaincy(manager_id):
+    from src.recommender import captaincy_json
+    return _json_view(captaincy_json, manager_id)
+
+@app.route('/api/managers/<int:manager_id>/transfers')
+def api_transfers(manager_id):
+    from src.recommender import transfers_json
+    return _json_view(transfers_json, manager_id)
+
+@app.route('/api/managers/<int:manager_id>/chips')
+def api_chips(manager_id):
+    from src.feature_store import FeatureStoreError
+    from src.recommender import ManagerNotFound, chips_json
+    try:
+        options = _request_options()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        plan = recommender.chip_plan(manager_id, options, processes=CHIP_PROCESSES)
+    except (FPLAPIError, requests.RequestException) as e:
+        print(f"Upstream failure for manager {manager_id}: {e}")
+        return jsonify({'error': 'FPL API unavailable'}), 502
+    except ManagerNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except FeatureStoreError as e:
+        print(f"Feature store unavailable for manager {manager_id}: {e}")
+        return jsonify({'error': 'feature store unavailable'}), 503
+    response = jsonify(chips_json(plan))
+    response.headers['X-Snapshot-Version'] = str(plan.snapshot_version)
+    return response
+
+@app.route('/api/leagues/<int:league_id>')
+def api_league(league_id):
+    # ?manager_id= scores that manager's captain and transfer options against the league
+    from src.league import analyse_league, LeagueNotFound
+    from src.recommender import league_json, ManagerNotFound
+    manager_id = request.args.get('manager_id', type=int)
+    try:
+        options = _request_options()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        analysis = analyse_league(league_id, recommender, manager_id, options, max_managers=MAX_LEAGUE_MANAGERS,
+                                  max_picks=LEAGUE_PICKS)
+    except FPLAPIError as e:
+        if e.status_code == 404:
+            return jsonify({'error': f"league {league_id} not found"}), 404
+        print(f"Upstream failure for league {league_id}: {e}")
+        return jsonify({'error': 'FPL API unavailable'}), 502
+    except requests.RequestException as e:
+        print(f"Upstream failure for league {league_id}: {e}")
+        return jsonify({'error': 'FPL API unavailable'}), 502
+    except (LeagueNotFound, ManagerNotFound) as e:
+        return jsonify({'error': str(e)}), 404
+    response = jsonify(league_json(analysis))
+    response.headers['X-Snapshot-Version'] = str(analysis.snapshot_version)
+    return response
+
+@app.route('/api/status')
+def api_status():
+    status = {
+        'precompute': scheduler.status(),
+        'cache': {'responses': len(recommender.responses), 'pools': len(recommender.pools),
+                  'squads': len(recommender.squads), 'chips': len(recommender.chip_plans)},
+        'model_version': model_registry.version,
+    }
+    try:
+        status['feature_store_gw'] = recommender.feature_store.last_gw
+    except ValueError as e:
+        status['feature_store_error'] = str(e)
+    return jsonify(status)
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    # {"managers": [id, ...]} -> one summary per manager, sharing one prediction pass
+    from src.batch import run_batch
+    from src.recommender import summary_json
+    body = request.get_json(silent=True) or {}
+    managers = body.get('managers')
+    if not isinstance(managers, list) or not managers or not all(isinstance(m, int) for m in managers):
+        return jsonify({'error': 'managers must be a non-empty list of ids'}), 400
+    if len(managers) > MAX_BATCH_MANAGERS:
+        return jsonify({'error': f"at most {MAX_BATCH_MANAGERS} managers per batch"}), 400
+    try:
+        options = _request_options()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        result = run_batch(managers, recommender, options, processes=BATCH_PROCESSES, executor=batch_executor)
+    except (FPLAPIError, requests.RequestException) as e:
+        print(f"Upstream failure for batch: {e}")
+        return jsonify({'error': 'FPL API unavailable'}), 502
+    return jsonify({
+        'results': [summary_json(result.recommendations[m]) for m in managers if m in result.recommendations],
+        'errors': {str(m): e for m, e in result.errors.items()},
+        'timings': {k: round(v, 3) for k, v in result.timings.items()},
+    })
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,159 @@
+# A local stand-in for the FPL API, with injected latency and errors.
+#
+#     python -m benchmarks.fake_upstream --port 8001 --latency-ms 80 --jitter-ms 40 --error-rate 0.01
+#     python -m benchmarks.fake_upstream --archive archive --at latest
+#     FPL_BASE_URL=http://127.0.0.1:8001/api python api_full.py
+#
+# Synthetic payloads by default; with --archive, bootstrap-static and fixtures come from a
+# snapshot archive and managers' entries and picks are drawn from that pool. Responses
+# carry an ETag and answer If-None-Match with a 304, like the real API. GET /_stats
+# returns request counts per endpoint and status.
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import SyntheticSession
+
+DEFAULT_PORT = 8001
+
+
+class FakeUpstream:
+    # Answers FPL API paths from a SyntheticSession. Bodies are serialized once per
+    # path. Every request waits latency ± jitter, and error_rate of them fail with
+    # error_status instead.
+    def __init__(self, session, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, seed=0):
+        self.session = session
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._bodies = {}   # path -> (status, body, etag)
+        self._lock = threading.Lock()
+        self.counts = {}    # (endpoint, status) -> requests
+
+    def _endpoint(self, path):
+        parts = [p for p in path.split('?')[0].split('/') if p and p != 'api']
+        if parts and parts[0] in ('entry', 'leagues-classic') and len(parts) > 2:
+            return f"{parts[0]}/{parts[-1]}"
+        return parts[0] if parts else ''
+
+    def _body(self, path):
+        with self._lock:
+            cached = self._bodies.get(path)
+        if cached is None:
+            response = self.session.get(f"http://upstream{path}")
+            body = response.content
+            cached = (response.status_code, body, f'"{hashlib.sha1(body).hexdigest()[:16]}"')
+            with self._lock:
+                self._bodies[path] = cached
+        return cached
+
+    def handle(self, path, if_none_match=None):
+        # (status, body, headers) for one GET
+        with self._lock:
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            failed = self._rng.random() < self.error_rate
+        time.sleep(delay)
+        if failed:
+            status, body, headers = self.error_status, b'', {}
+        else:
+            status, body, etag = self._body(path)
+            headers = {'ETag': etag} if status == 200 else {}
+            if status == 200 and if_none_match == etag:
+                status, body = 304, b''
+        key = (self._endpoint(path), status)
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+        return status, body, headers
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        by_endpoint = {}
+        for (endpoint, status), n in sorted(counts.items()):
+            by_endpoint.setdefault(endpoint, {})[str(status)] = n
+        return {'requests': sum(counts.values()), 'endpoints': by_endpoint}
+
+
+def make_server(upstream, host='127.0.0.1', port=DEFAULT_PORT):
+    # A threaded HTTP server over `upstream`; port 0 picks a free one
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path == '/_stats':
+                status, body, headers = 200, json.dumps(upstream.stats()).encode(), {}
+            else:
+                status, body, headers = upstream.handle(self.path, self.headers.get('If-None-Match'))
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(upstream, host='127.0.0.1', port=0):
+    # (server, base URL for FPL_BASE_URL) with the server running on a daemon thread
+    server = make_server(upstream, host, port)
+    threading.Thread(target=server.serve_forever, name='fake-upstream', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/api"
+
+
+def session_from_archive(path, at=None):
+    # Synthetic managers over the archived bootstrap-static and fixtures at `at`
+    from src.snapshot_archive import SnapshotArchive, parse_time
+    archive = SnapshotArchive(path)
+    at = None if at in (None, 'latest') else parse_time(at)
+    entries = {kind: archive.entry_at(kind, at) for kind in ('bootstrap-static', 'fixtures')}
+    missing = [kind for kind, entry in entries.items() if entry is None]
+    if missing:
+        raise SystemExit(f"{path} has no {' or '.join(missing)} pull at {at or 'latest'}")
+    return SyntheticSession(bootstrap=archive.load(entries['bootstrap-static']),
+                            fixtures=archive.load(entries['fixtures']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a stand-in FPL API locally")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--players', type=int, default=700, help="synthetic pool size")
+    parser.add_argument('--gw', type=int, default=10, help="synthetic current gameweek")
+    parser.add_argument('--archive', help="serve bootstrap-static and fixtures from this snapshot archive")
+    parser.add_argument('--at', help="archive time to serve (epoch, ISO 8601 or 'latest')")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="added to every response")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="latency varies uniformly by this much")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests that fail")
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    session = session_from_archive(args.archive, args.at) if args.archive else \
+        SyntheticSession(n_players=args.players, current_gw=args.gw, seed=args.seed)
+    upstream = FakeUpstream(session, args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate,
+                            args.error_status, args.seed)
+    server = make_server(upstream, args.host, args.port)
+    print(f"Serving a stand-in FPL API at http://{args.host}:{server.server_address[1]}/api")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
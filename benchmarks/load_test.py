@@ -0,0 +1,174 @@
+# Load test: many concurrent manager ids against the Flask app, with latency percentiles.
+#
+#     python -m benchmarks.load_test --managers 100 --requests 500 --concurrency 16 --latency-ms 80
+#     python -m benchmarks.load_test --url http://127.0.0.1:5000 --upstream http://127.0.0.1:8001
+#     python -m benchmarks.load_test --path "/api/managers/{id}/captaincy?simulations=20000" --save load.json
+#
+# Without --url the app is served in this process against a stand-in upstream
+# (benchmarks/fake_upstream.py) with the given latency and error rate. With --url it
+# drives an app that is already running, e.g. under gunicorn with a chosen worker count;
+# --upstream then names the stand-in it talks to, for its request counts.
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_PATH = "/api/managers/{id}/lineup?horizon=0"
+PERCENTILES = (50, 95, 99)
+READY_TIMEOUT = 120   # seconds to wait for /ready
+
+
+def serve_app(latency=0.0, jitter=0.0, error_rate=0.0, players=700, seed=0):
+    # (app URL, stand-in upstream) with both served on daemon threads in this process
+    from werkzeug.serving import make_server
+    from benchmarks.fake_upstream import FakeUpstream, start_in_thread
+    from benchmarks.synthetic import SyntheticSession
+    upstream = FakeUpstream(SyntheticSession(n_players=players, seed=seed), latency, jitter, error_rate, seed=seed)
+    _, base_url = start_in_thread(upstream)
+    os.environ['FPL_BASE_URL'] = base_url
+    import api_full
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)   # no access log line per request
+    server = make_server('127.0.0.1', 0, api_full.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-app', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", upstream
+
+
+def wait_ready(url, timeout=READY_TIMEOUT):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(f"{url}/ready", timeout=5).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def upstream_stats(upstream):
+    # Request counts from an in-process stand-in or a stand-in's /_stats URL
+    if upstream is None:
+        return None
+    if hasattr(upstream, 'stats'):
+        return upstream.stats()
+    try:
+        return requests.get(f"{upstream.rstrip('/')}/_stats", timeout=5).json()
+    except requests.RequestException as e:
+        print(f"Upstream stats unavailable: {e}", file=sys.stderr)
+        return None
+
+
+def run_load(url, manager_ids, path=DEFAULT_PATH, concurrency=16, timeout=60):
+    # Issue one GET per manager id from `concurrency` threads; returns (status, seconds) per request
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            local.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        return local.session
+
+    def call(manager_id):
+        started = time.perf_counter()
+        try:
+            status = session().get(url + path.format(id=manager_id), timeout=timeout).status_code
+        except requests.RequestException:
+            status = 'error'
+        return status, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load') as pool:
+        return list(pool.map(call, manager_ids))
+
+
+def summarize(results, seconds):
+    latencies = np.array([s for _, s in results]) * 1000
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    latency = {}
+    if len(latencies):
+        latency = {f"p{p}": round(float(np.percentile(latencies, p)), 1) for p in PERCENTILES}
+        latency['max'] = round(float(latencies.max()), 1)
+    return {
+        'requests': len(results),
+        'seconds': round(seconds, 3),
+        'throughput_rps': round(len(results) / seconds, 2) if seconds else None,
+        'statuses': statuses,
+        'latency_ms': latency,
+    }
+
+
+def _diff(after, before):
+    if after is None:
+        return None
+    before = before or {'requests': 0, 'endpoints': {}}
+    endpoints = {}
+    for endpoint, counts in after['endpoints'].items():
+        old = before['endpoints'].get(endpoint, {})
+        changed = {status: n - old.get(status, 0) for status, n in counts.items() if n - old.get(status, 0)}
+        if changed:
+            endpoints[endpoint] = changed
+    return {'requests': after['requests'] - before['requests'], 'endpoints': endpoints}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive the app with concurrent manager requests")
+    parser.add_argument('--url', help="running app to test (default: serve one here against a stand-in upstream)")
+    parser.add_argument('--upstream', help="stand-in upstream URL whose /_stats is reported (with --url)")
+    parser.add_argument('--path', default=DEFAULT_PATH, help="request path; {id} is the manager id")
+    parser.add_argument('--managers', type=int, default=50, help="distinct manager ids")
+    parser.add_argument('--first-id', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=80.0, help="stand-in upstream latency")
+    parser.add_argument('--jitter-ms', type=float, default=40.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of upstream requests that fail")
+    parser.add_argument('--players', type=int, default=700, help="stand-in pool size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        url, upstream = args.url.rstrip('/'), args.upstream
+    else:
+        url, upstream = serve_app(args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate, args.players,
+                                  args.seed)
+    started = time.perf_counter()
+    if not wait_ready(url):
+        print(f"{url}/ready did not answer 200 within {READY_TIMEOUT}s", file=sys.stderr)
+        return 1
+    ready_seconds = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    manager_ids = [args.first_id + rng.randrange(args.managers) for _ in range(args.requests)]
+    before = upstream_stats(upstream)
+    started = time.perf_counter()
+    results = run_load(url, manager_ids, args.path, args.concurrency)
+    report = summarize(results, time.perf_counter() - started)
+    report.update(url=url, path=args.path, managers=args.managers, concurrency=args.concurrency,
+                  ready_seconds=round(ready_seconds, 3), upstream=_diff(upstream_stats(upstream), before))
+
+    print(f"{report['requests']} requests over {args.managers} managers, {args.concurrency} concurrent: "
+          f"{report['throughput_rps']} req/s in {report['seconds']:.1f}s")
+    print("  latency " + "  ".join(f"{k} {v:.0f} ms" for k, v in report['latency_ms'].items()))
+    print(f"  statuses {report['statuses']}")
+    if report['upstream']:
+        print(f"  upstream {report['upstream']['requests']} requests {report['upstream']['endpoints']}")
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved to {args.save}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
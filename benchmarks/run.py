@@ -0,0 +1,189 @@
+# Stage-level benchmarks over synthetic player pools.
+#
+#     python -m benchmarks.run --players 700 2000 10000 --save benchmarks/baselines/local.json
+#     python -m benchmarks.run --compare benchmarks/baselines/local.json
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import SyntheticSession, picks_payload
+from src import data_fetcher
+from src.data_processor import build_player_frame, prepare_dataset, fixture_matrix_for
+from src.model_trainer import ModelRegistry, train_model, save_versioned_model, DEFAULT_FEATURES
+from src.player_pool import PlayerPool
+from src.points_simulator import simulate_team
+from src.recommender import Recommender
+from src.team_optimizer import TeamOptimizer
+from src.transfer_engine import TransferEngine
+from src.transfer_planner import TransferPlanner, gameweek_points
+
+DEFAULT_SIZES = [700, 2000, 10000]
+REGRESSION_THRESHOLD = 1.25   # flag stages more than 25% slower than the baseline
+
+
+def _measure(fn, repeat):
+    fn()   # warm-up: imports, caches, first-call allocations
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def _trained_registry(frame, model_dir):
+    train = frame[DEFAULT_FEATURES].copy()
+    train['target'] = frame['total_points']
+    model, accuracy = train_model(train)
+    save_versioned_model(model, DEFAULT_FEATURES, {'r2': float(accuracy)}, model_dir, version='bench')
+    registry = ModelRegistry(model_dir)
+    registry.load()
+    return registry
+
+
+def run_size(n_players, repeat, stages, horizon):
+    session = SyntheticSession(n_players=n_players)
+    players = session.bootstrap['elements']
+    teams = session.bootstrap['teams']
+    fixtures = session.fixtures
+    gw = session.current_gw + 1
+    results = {}
+
+    frame = build_player_frame(players, fixtures, teams, gw=gw)
+    model_dir = tempfile.mkdtemp(prefix='fpl-bench-models-')
+    registry = _trained_registry(frame, model_dir)
+    model, info = registry.current()
+    frame['expected_points'] = np.asarray(model.predict(frame[info.feature_cols]), dtype='float64')
+    frame['gw_points'] = gameweek_points(frame, fixture_matrix_for(fixtures), gw, 1)[:, 0]
+    # The solvers run on the pool, as they do behind the app
+    pool = PlayerPool.from_frame(frame)
+
+    picks = picks_payload(session.bootstrap, 1, session.current_gw)
+    squad_ids = [p['element'] for p in picks['picks']]
+    bank = picks['entry_history']['bank'] / 10
+    selection = TeamOptimizer(pool, 100.0).solve()
+
+    cases = {
+        'prepare_dataset': lambda: prepare_dataset(players, fixtures),
+        'build_player_frame': lambda: build_player_frame(players, fixtures, teams, gw=gw),
+        'predict': lambda: model.predict(frame[info.feature_cols]),
+        'player_pool': lambda: PlayerPool.from_frame(frame),
+        'optimize_team': lambda: TeamOptimizer(pool, 100.0, time_limit=5.0, mip_gap=0.001).solve(),
+        'transfer_search_1': lambda: TransferEngine(pool, squad_ids, bank).search(max_transfers=1),
+        'transfer_search_2': lambda: TransferEngine(pool, squad_ids, bank).search(max_transfers=2),
+        'transfer_search_3': lambda: TransferEngine(pool, squad_ids, bank).search(max_transfers=3),
+        'horizon_planner': lambda: TransferPlanner(
+            pool, gameweek_points(pool, fixture_matrix_for(fixtures), gw, horizon), squad_ids, bank, start_gw=gw,
+        ).solve(time_budget=10.0, mip_gap=0.01),
+        'simulate_100k': lambda: simulate_team(selection.squad, selection.starters, n_sims=100_000),
+    }
+    if 'index_post' in stages:
+        cases['index_post'] = _index_case(session, registry, cached=False)
+    if 'index_post_cached' in stages:
+        cases['index_post_cached'] = _index_case(session, registry, cached=True)
+
+    for name in stages:
+        if name in cases:
+            results[name] = _measure(cases[name], repeat)
+            print(f"  {n_players:>6} players  {name:<20} {results[name]['median_ms']:>10.2f} ms  "
+                  f"peak {results[name]['peak_kb']:>10.1f} KB")
+    return results
+
+
+def _index_case(session, registry, cached=False):
+    os.environ.setdefault('FPL_WARM_UP', '0')   # the case sets up the app's objects itself
+    import api_full
+    data_fetcher.set_client(data_fetcher.FPLClient(session=session))
+    api_full.model_registry = registry
+    api_full.recommender = Recommender(registry)
+    api_full.FPL_ID = 1
+    client = api_full.app.test_client()
+
+    def post():
+        if not cached:
+            api_full.recommender.invalidate()
+        response = client.post('/')
+        if response.status_code != 200:
+            raise RuntimeError(f"index() returned {response.status_code}")
+    return post
+
+
+def compare(current, baseline, threshold):
+    regressions = []
+    for size, stages in current['results'].items():
+        for name, stats in stages.items():
+            base = baseline.get('results', {}).get(size, {}).get(name)
+            if not base:
+                continue
+            ratio = stats['median_ms'] / max(base['median_ms'], 1e-9)
+            flag = 'REGRESSION' if ratio > threshold else ''
+            print(f"  {size:>6} {name:<20} {base['median_ms']:>10.2f} -> {stats['median_ms']:>10.2f} ms  x{ratio:.2f} {flag}")
+            if flag:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+ALL_STAGES = ['prepare_dataset', 'build_player_frame', 'predict', 'player_pool', 'optimize_team', 'transfer_search_1',
+              'transfer_search_2', 'transfer_search_3', 'horizon_planner', 'simulate_100k', 'index_post',
+              'index_post_cached']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stage-level benchmarks over synthetic player pools")
+    parser.add_argument('--players', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--stages', nargs='+', default=ALL_STAGES, choices=ALL_STAGES)
+    parser.add_argument('--horizon', type=int, default=5)
+    parser.add_argument('--save', help="write results as a JSON baseline")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+    for n in args.players:
+        report['results'][str(n)] = run_size(n, args.repeat, args.stages, args.horizon)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
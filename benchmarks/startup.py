@@ -0,0 +1,103 @@
+# Worker startup cost: import time per module and package, and the warm-up phases.
+#
+#     python -m benchmarks.startup
+#     python -m benchmarks.startup --module src.recommender --top 30
+#     python -m benchmarks.startup --save startup.json
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports api_full against the synthetic upstream, then runs its warm-up, in a fresh
+# interpreter so nothing is already imported
+WARM_UP_SCRIPT = """
+import json, os, time
+os.environ['FPL_WARM_UP'] = '0'
+started = time.perf_counter()
+import api_full
+imported = time.perf_counter() - started
+from benchmarks.synthetic import SyntheticSession
+from src import data_fetcher
+data_fetcher.set_client(data_fetcher.FPLClient(session=SyntheticSession(n_players={players})))
+api_full.warm_up()
+print(json.dumps(dict(api_full.warm_up_state['seconds'], import_app=round(imported, 3),
+                      total=round(time.perf_counter() - started, 3), error=api_full.warm_up_state['error'])))
+"""
+
+
+def _run(args):
+    env = dict(os.environ, FPL_WARM_UP='0')
+    return subprocess.run([sys.executable] + args, cwd=ROOT, env=env, capture_output=True, text=True)
+
+
+def import_times(module):
+    # [(module, self seconds, cumulative seconds, depth)] from python -X importtime
+    done = _run(['-X', 'importtime', '-c', f"import {module}"])
+    if done.returncode != 0:
+        raise RuntimeError(done.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in done.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return rows
+
+
+def by_package(rows):
+    # Self time summed per top-level package; our own modules are kept apart
+    totals = {}
+    for name, self_s, _, _ in rows:
+        key = name if name.startswith('src.') else name.split('.')[0]
+        totals[key] = totals.get(key, 0.0) + self_s
+    return sorted(totals.items(), key=lambda kv: -kv[1])
+
+
+def warm_up_times(players):
+    done = _run(['-c', WARM_UP_SCRIPT.format(players=players)])
+    if done.returncode != 0:
+        raise RuntimeError(done.stderr.strip().splitlines()[-1])
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure worker import and warm-up time")
+    parser.add_argument('--module', default='api_full', help="module whose import is broken down")
+    parser.add_argument('--top', type=int, default=15, help="packages and modules to list")
+    parser.add_argument('--players', type=int, default=700, help="synthetic pool size for the warm-up")
+    parser.add_argument('--save', help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    rows = import_times(args.module)
+    total = max((cumulative for name, _, cumulative, depth in rows if depth == 0 and name == args.module), default=0.0)
+    print(f"import {args.module}: {total * 1000:.0f} ms")
+    packages = by_package(rows)
+    print("\nSelf time by package:")
+    for name, seconds in packages[:args.top]:
+        print(f"  {name:<32} {seconds * 1000:>8.1f} ms")
+    print("\nSlowest modules (cumulative):")
+    slowest = sorted(rows, key=lambda r: -r[2])[:args.top]
+    for name, _, cumulative, depth in slowest:
+        print(f"  {name:<48} {cumulative * 1000:>8.1f} ms")
+
+    warm = warm_up_times(args.players)
+    print(f"\nWarm-up against {args.players} synthetic players:")
+    for key in ('import_app', 'imports', 'model', 'snapshot', 'total'):
+        if key in warm:
+            print(f"  {key:<12} {warm[key] * 1000:>8.0f} ms")
+    if warm.get('error'):
+        print(f"  error: {warm['error']}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'module': args.module, 'import_seconds': total, 'packages': dict(packages),
+                       'modules': {name: cumulative for name, _, cumulative, _ in rows}, 'warm_up': warm}, f, indent=2)
+        print(f"\nSaved to {args.save}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+import json
+import random
+
+# Squad-shaped position mix: 2 GKP, 5 DEF, 5 MID, 3 FWD in every 15 players
+ELEMENT_TYPES = [1, 1, 2, 2, 2, 2, 2, 3, 3, 3, 3, 3, 4, 4, 4]
+NEWS = ['', '', '', '', 'Knee injury - Expected back 12 Nov', 'Suspended until 03 Dec', 'Illness - 75% chance of playing']
+
+
+def bootstrap_payload(n_players=700, n_teams=20, n_gws=38, current_gw=10, seed=0):
+    # bootstrap-static shaped payload with the fields the app reads
+    rng = random.Random(seed)
+    teams = [{
+        'id': t,
+        'name': f"Team {t}",
+        'short_name': f"T{t:02d}",
+        'strength': rng.randint(2, 5),
+        'previous_season_rank': t,
+    } for t in range(1, n_teams + 1)]
+
+    elements = []
+    for i in range(n_players):
+        element_type = ELEMENT_TYPES[i % len(ELEMENT_TYPES)]
+        quality = rng.random()
+        news = rng.choice(NEWS)
+        elements.append({
+            'id': i + 1,
+            'first_name': f"First{i}",
+            'second_name': f"Second{i}",
+            'web_name': f"Player{i}",
+            'team': rng.randint(1, n_teams),
+            'element_type': element_type,
+            'now_cost': int(40 + quality * 90) // 5 * 5,
+            'total_points': int(quality * 20 * (current_gw - 1) * rng.uniform(0.5, 1.2)),
+            'form': f"{quality * 10 * rng.uniform(0.5, 1.5):.1f}",
+            'minutes': int(rng.uniform(0, 90) * (current_gw - 1)),
+            'selected_by_percent': f"{quality ** 3 * 60:.1f}",
+            'chance_of_playing_next_round': None if not news else rng.choice([0, 25, 50, 75]),
+            'news': news,
+        })
+
+    events = [{
+        'id': gw,
+        'name': f"Gameweek {gw}",
+        'deadline_time': f"2026-{1 + (gw * 7 // 30) % 12:02d}-{1 + (gw * 7) % 28:02d}T10:00:00Z",
+        'is_previous': gw == current_gw - 1,
+        'is_current': gw == current_gw,
+        'is_next': gw == current_gw + 1,
+        'finished': gw < current_gw,
+    } for gw in range(1, n_gws + 1)]
+
+    return {'elements': elements, 'teams': teams, 'events': events, 'element_types': []}
+
+
+def fixtures_payload(n_teams=20, n_gws=38, current_gw=10, seed=0, blank_rate=0.02, double_rate=0.02):
+    # Round-robin-ish fixture list with occasional blanks and doubles
+    rng = random.Random(seed)
+    fixtures = []
+    fixture_id = 1
+    for gw in range(1, n_gws + 1):
+        team_ids = list(range(1, n_teams + 1))
+        rng.shuffle(team_ids)
+        pairs = [(team_ids[k], team_ids[k + 1]) for k in range(0, n_teams - 1, 2)]
+        pairs = [p for p in pairs if rng.random() > blank_rate]
+        pairs += [tuple(rng.sample(range(1, n_teams + 1), 2)) for _ in range(n_teams // 2) if rng.random() < double_rate]
+        for home, away in pairs:
+            finished = gw < current_gw
+            fixtures.append({
+                'id': fixture_id,
+                'event': gw,
+                'team_h': home,
+                'team_a': away,
+                'team_h_difficulty': rng.randint(2, 5),
+                'team_a_difficulty': rng.randint(2, 5),
+                'finished': finished,
+                'team_h_score': rng.randint(0, 4) if finished else None,
+                'team_a_score': rng.randint(0, 4) if finished else None,
+            })
+            fixture_id += 1
+    return fixtures
+
+
+def history_payload(bootstrap, fixtures, player_id, current_gw):
+    # element-summary shaped payload: one history row per finished fixture. Points
+    # follow the player's price, the fixture difficulty and home advantage plus noise,
+    # so a model has something to learn.
+    element = bootstrap['elements'][player_id - 1]
+    rng = random.Random(player_id)
+    quality = (element['now_cost'] - 40) / 90
+    history = []
+    for f in fixtures:
+        if not f['finished'] or element['team'] not in (f['team_h'], f['team_a']):
+            continue
+        home = f['team_h'] == element['team']
+        difficulty = f['team_h_difficulty'] if home else f['team_a_difficulty']
+        minutes = 90 if rng.random() < 0.4 + 0.5 * quality else rng.choice([0, 0, 20, 60])
+        mean = (1 + 6 * quality) * (1.25 - 0.12 * difficulty) * (1.1 if home else 1.0) * minutes / 90
+        points = max(0, int(round(rng.gauss(mean, 2)))) if minutes else 0
+        history.append({
+            'element': player_id,
+            'fixture': f['id'],
+            'opponent_team': f['team_a'] if home else f['team_h'],
+            'round': f['event'],
+            'was_home': home,
+            'minutes': minutes,
+            'total_points': points,
+            'goals_scored': int(points >= 6 and rng.random() < 0.6),
+            'assists': int(points >= 5 and rng.random() < 0.4),
+            'value': element['now_cost'] + rng.choice([-1, 0, 0, 1]) * 5 * (f['event'] > current_gw // 2),
+        })
+    return {'fixtures': [], 'history': history, 'history_past': []}
+
+
+def live_payload(bootstrap, fixtures, gw, current_gw):
+    # event/{gw}/live/ shaped payload built from the same histories, with the per-fixture
+    # breakdown under `explain`
+    elements = []
+    for e in bootstrap['elements']:
+        rows = [r for r in history_payload(bootstrap, fixtures, e['id'], current_gw)['history'] if r['round'] == gw]
+        elements.append({
+            'id': e['id'],
+            'stats': {'minutes': sum(r['minutes'] for r in rows), 'total_points': sum(r['total_points'] for r in rows)},
+            'explain': [{'fixture': r['fixture'], 'stats': [
+                {'identifier': 'minutes', 'value': r['minutes'], 'points': r['total_points']},
+                {'identifier': 'goals_scored', 'value': r['goals_scored'], 'points': 0},
+                {'identifier': 'assists', 'value': r['assists'], 'points': 0},
+            ]} for r in rows],
+        })
+    return {'elements': elements}
+
+
+def entry_payload(manager_id):
+    return {
+        'id': manager_id,
+        'player_first_name': 'Synthetic',
+        'player_last_name': f"Manager {manager_id}",
+        'name': f"Synthetic XI {manager_id}",
+        'summary_overall_points': 500,
+        'summary_overall_rank': 100000 + manager_id,
+        'last_deadline_value': 1000,
+        'last_deadline_bank': 10,
+        'summary_transfers': 12,
+    }
+
+
+def picks_payload(bootstrap, manager_id, gw):
+    # A legal 15-man squad drawn deterministically from the pool for this manager
+    rng = random.Random(manager_id)
+    elements = bootstrap['elements'][:]
+    rng.shuffle(elements)
+    need = {1: 2, 2: 5, 3: 5, 4: 3}
+    clubs = {}
+    squad = []
+    for e in elements:
+        if need[e['element_type']] and clubs.get(e['team'], 0) < 3:
+            need[e['element_type']] -= 1
+            clubs[e['team']] = clubs.get(e['team'], 0) + 1
+            squad.append(e)
+    # A 4-4-2 XI in pick order, then the bench; the XI's top scorer is captain
+    xi = {1: 1, 2: 4, 3: 4, 4: 2}
+    starters = []
+    for e in sorted(squad, key=lambda e: -e['total_points']):
+        if xi[e['element_type']]:
+            xi[e['element_type']] -= 1
+            starters.append(e)
+    squad = starters + [e for e in squad if e not in starters]
+    value = sum(e['now_cost'] for e in squad)
+    return {
+        'picks': [{'element': e['id'], 'position': k + 1, 'multiplier': 2 if k == 0 else int(k < 11),
+                   'is_captain': k == 0, 'is_vice_captain': k == 1} for k, e in enumerate(squad)],
+        'entry_history': {'event': gw, 'bank': max(0, 1000 - value), 'value': value},
+    }
+
+
+def manager_history_payload(manager_id, current_gw):
+    # entry/{id}/history/ shaped payload; odd managers have already played a wildcard
+    chips = [{'name': 'wildcard', 'time': None, 'event': min(3, current_gw)}] if manager_id % 2 else []
+    return {'current': [], 'past': [], 'chips': chips}
+
+
+def standings_payload(league_id, page, n_managers=120, page_size=50):
+    # leagues-classic standings page; entry ids are league_id * 1000 + rank
+    first = (page - 1) * page_size
+    ranks = range(first + 1, min(first + page_size, n_managers) + 1)
+    return {
+        'league': {'id': league_id, 'name': f"Synthetic League {league_id}"},
+        'standings': {
+            'has_next': first + page_size < n_managers,
+            'page': page,
+            'results': [{'entry': league_id * 1000 + r, 'entry_name': f"Synthetic XI {league_id * 1000 + r}",
+                         'player_name': f"Manager {r}", 'rank': r, 'last_rank': r,
+                         'total': 800 - 2 * r, 'event_total': 50} for r in ranks],
+        },
+    }
+
+
+class SyntheticResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.content = json.dumps(payload).encode() if payload is not None else b''
+        self.headers = {}
+
+    def json(self):
+        return self._payload
+
+
+class SyntheticSession:
+    # Drop-in for requests.Session that answers the FPL endpoints from synthetic payloads.
+    # Pass recorded bootstrap/fixtures payloads to build managers and players on them instead.
+    def __init__(self, n_players=700, n_teams=20, current_gw=10, seed=0, league_size=120, bootstrap=None,
+                 fixtures=None):
+        self.bootstrap = bootstrap or bootstrap_payload(n_players, n_teams, current_gw=current_gw, seed=seed)
+        self.fixtures = fixtures or fixtures_payload(n_teams, current_gw=current_gw, seed=seed)
+        if bootstrap is not None:
+            current_gw = next((e['id'] for e in bootstrap.get('events', []) if e.get('is_current')), current_gw)
+        self.current_gw = current_gw
+        self.league_size = league_size
+
+    def get(self, url, headers=None, timeout=None, **kwargs):
+        path, _, query = url.split('/api/', 1)[-1].partition('?')
+        parts = [p for p in path.split('/') if p]
+        if len(parts) == 3 and parts[0] == 'leagues-classic' and parts[2] == 'standings':
+            page = int(dict(q.split('=', 1) for q in query.split('&') if '=' in q).get('page_standings', 1))
+            return SyntheticResponse(200, standings_payload(int(parts[1]), page, self.league_size))
+        if parts == ['bootstrap-static']:
+            return SyntheticResponse(200, self.bootstrap)
+        if parts == ['fixtures']:
+            return SyntheticResponse(200, self.fixtures)
+        if len(parts) == 2 and parts[0] == 'element-summary':
+            return SyntheticResponse(200, history_payload(self.bootstrap, self.fixtures, int(parts[1]), self.current_gw))
+        if len(parts) == 3 and parts[0] == 'event' and parts[2] == 'live':
+            return SyntheticResponse(200, live_payload(self.bootstrap, self.fixtures, int(parts[1]), self.current_gw))
+        if len(parts) == 2 and parts[0] == 'entry':
+            return SyntheticResponse(200, entry_payload(int(parts[1])))
+        if len(parts) == 3 and parts[0] == 'entry' and parts[2] == 'history':
+            return SyntheticResponse(200, manager_history_payload(int(parts[1]), self.current_gw))
+        if len(parts) == 5 and parts[0] == 'entry' and parts[2] == 'event' and parts[4] == 'picks':
+            return SyntheticResponse(200, picks_payload(self.bootstrap, int(parts[1]), int(parts[3])))
+        return SyntheticResponse(404)
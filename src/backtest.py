@@ -0,0 +1,318 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+
+import numpy as np
+import pandas as pd
+
+from src.data_processor import FDR_MULTIPLIER, POSITION_MAP, MODEL_FEATURES
+from src.feature_store import FeatureStore
+from src.player_pool import PlayerPool
+from src.team_optimizer import TeamOptimizer, STARTING_LIMITS
+from src.transfer_engine import TransferEngine, HIT_COST
+from src.transfer_planner import MAX_FREE_TRANSFERS
+
+DEFAULT_BUDGET = 100.0
+PREDICTORS = ('model', 'form', 'ppg')
+
+
+@dataclass(frozen=True)
+class BacktestConfig:
+    # One way of playing a season. 'model' predicts each fixture with a trained
+    # gameweek model; 'form' and 'ppg' scale fixture-adjusted 5-fixture form or points
+    # per game by the fixture's FDR multiplier (fdr_multiplier overrides FDR_MULTIPLIER).
+    name: str
+    predictor: str = 'model'
+    model_path: str = None          # .ubj artifact; default is the latest in models/
+    fdr_multiplier: tuple = None
+    max_transfers: int = 2
+    min_gain: float = 0.5           # net predicted gain a transfer must clear
+    budget: float = DEFAULT_BUDGET
+
+
+@dataclass
+class SeasonResult:
+    season: str
+    config: str
+    points: int = 0
+    hits: int = 0
+    transfers: int = 0
+    final_value: float = 0.0
+    weeks: list = field(default_factory=list)   # one dict per gameweek
+    seconds: float = 0.0
+
+
+class SeasonData:
+    # A season from a feature store as [player, gameweek] arrays. Each row's features
+    # are as they stood before the fixture, so predicting gameweek g only sees the past;
+    # 'actual' is what the player then scored. Doubles are summed, blanks are zero, and
+    # prices and clubs carry forward from the last fixture played.
+    def __init__(self, rows):
+        rows = rows.sort_values(['gw', 'fixture'], kind='stable')
+        self.rows = rows.reset_index(drop=True)
+        self.ids = np.unique(rows['id'].to_numpy()).astype(np.int64)
+        self.gws = np.arange(int(rows['gw'].min()), int(rows['gw'].max()) + 1)
+        n, first = len(self.ids), int(self.gws[0])
+        self.player_row = np.searchsorted(self.ids, self.rows['id'].to_numpy())
+        self.gw_col = self.rows['gw'].to_numpy().astype(np.int64) - first
+        shape = (n, len(self.gws))
+
+        def summed(values):
+            out = np.zeros(shape)
+            np.add.at(out, (self.player_row, self.gw_col), values)
+            return out
+
+        self.actual = summed(self.rows['target'].to_numpy(dtype=float))
+        self.minutes = summed(self.rows['minutes'].to_numpy(dtype=float))
+        self.price = self._carried(self.rows['price'].to_numpy(dtype=float), shape)
+        self.team = np.nan_to_num(self._carried(self.rows['team'].to_numpy(dtype=float), shape)).astype(np.int64)
+        self.available = ~np.isnan(self.price)   # in the game by this gameweek
+        codes = np.zeros(n, dtype=np.int64)
+        codes[self.player_row] = self.rows['position_code'].to_numpy()
+        self.positions = np.array([POSITION_MAP.get(int(c), 'UNK') for c in codes])
+
+    def _carried(self, values, shape):
+        out = np.full(shape, np.nan)
+        out[self.player_row, self.gw_col] = values
+        return pd.DataFrame(out.T).ffill().to_numpy().T
+
+    def predicted(self, config, model=None):
+        # [player, gameweek] predicted points under a config
+        if config.predictor == 'model':
+            per_fixture = model.predict(self.rows[MODEL_FEATURES].astype('float32'))
+        else:
+            multiplier = np.asarray(config.fdr_multiplier or FDR_MULTIPLIER, dtype=float)
+            base = self.rows['points_adj_5' if config.predictor == 'form' else 'points_per_game'].to_numpy(dtype=float)
+            per_fixture = base * multiplier[self.rows['difficulty'].to_numpy()]
+        out = np.zeros(self.actual.shape)
+        np.add.at(out, (self.player_row, self.gw_col), np.asarray(per_fixture, dtype=float))
+        return out
+
+    def pool(self, g, expected, costs=None):
+        # PlayerPool for gameweek column g, as the optimizer and transfer engine read it.
+        # Returns (pool, player rows it covers).
+        rows = np.flatnonzero(self.available[:, g])
+        pool = PlayerPool({
+            'id': self.ids[rows],
+            'team': self.team[rows, g],
+            'position': self.positions[rows],
+            'cost': self.price[rows, g] if costs is None else costs[rows],
+            'expected_points': expected[rows, g],
+        })
+        return pool, rows
+
+
+def selling_price(bought, now):
+    # FPL keeps half of any rise, rounded down to 0.1m; a fall is passed on in full
+    if now <= bought:
+        return now
+    return bought + np.floor((now - bought) * 10 / 2) / 10
+
+
+def _lineup(squad_pool):
+    # Best XI, captain and bench order for the squad on this week's predictions
+    return TeamOptimizer(squad_pool, budget=10_000).solve()
+
+
+def _score(selection, actual, minutes):
+    # Points for a lineup with FPL's automatic substitutions: a starter who did not
+    # play is replaced by the first bench player who did, if the formation still holds,
+    # and the vice-captain takes the armband from a captain who did not play
+    starters = [p['id'] for p in selection.starters]
+    positions = {p['id']: p['position'] for p in selection.squad}
+    counts = {pos: sum(positions[i] == pos for i in starters) for pos in STARTING_LIMITS}
+    for sub in [p['id'] for p in selection.bench]:
+        if minutes[sub] == 0:
+            continue
+        for out in starters:
+            if minutes[out] > 0 or (positions[out] == 'GKP') != (positions[sub] == 'GKP'):
+                continue
+            after = dict(counts)
+            after[positions[out]] -= 1
+            after[positions[sub]] += 1
+            if all(after[pos] >= STARTING_LIMITS[pos][0] for pos in after):
+                starters[starters.index(out)] = sub
+                counts = after
+                break
+    captain = selection.captain['id']
+    if minutes[captain] == 0 and selection.vice_captain is not None:
+        captain = selection.vice_captain['id']
+    return int(sum(actual[i] for i in starters) + (actual[captain] if captain in starters else 0)), captain
+
+
+def run_season(season, data, config, model=None):
+    # Replay one season under one config: pick a squad before the first gameweek, then
+    # every week take the best predicted transfer (banking free transfers, paying hits,
+    # tracking purchase prices and the bank), pick the lineup and score actual points
+    started = time.perf_counter()
+    result = SeasonResult(season, config.name)
+    expected = data.predicted(config, model)
+    row_of = {pid: r for r, pid in enumerate(data.ids.tolist())}
+
+    pool, rows = data.pool(0, expected)
+    selection = TeamOptimizer(pool, config.budget).solve()
+    squad = [p['id'] for p in selection.squad]
+    bought = {pid: data.price[row_of[pid], 0] for pid in squad}
+    bank = round(config.budget - sum(bought.values()), 1)
+    free_transfers = 1
+
+    for g, gw in enumerate(data.gws):
+        outs, ins, hit = [], [], 0
+        if g > 0:
+            # Squad members are valued at their selling price, everyone else at today's
+            costs = data.price[:, g].copy()
+            for pid in squad:
+                costs[row_of[pid]] = selling_price(bought[pid], data.price[row_of[pid], g])
+            pool, rows = data.pool(g, expected, costs)
+            engine = TransferEngine(pool, squad, bank, free_transfers, HIT_COST)
+            options = engine.search(config.max_transfers, top_k=1)
+            if options and options[0].net_gain >= config.min_gain:
+                best = options[0]
+                outs, ins = [p['id'] for p in best.outs], [p['id'] for p in best.ins]
+                hit = int(best.hit_cost)
+                bank = round(bank + sum(costs[row_of[o]] for o in outs)
+                             - sum(data.price[row_of[i], g] for i in ins), 1)
+                squad = [pid for pid in squad if pid not in outs] + ins
+                for o in outs:
+                    del bought[o]
+                for i in ins:
+                    bought[i] = data.price[row_of[i], g]
+            free_transfers = min(max(free_transfers - len(ins), 0) + 1, MAX_FREE_TRANSFERS)
+
+        squad_rows = np.array([row_of[pid] for pid in squad])
+        squad_pool = PlayerPool({
+            'id': data.ids[squad_rows], 'team': data.team[squad_rows, g], 'position': data.positions[squad_rows],
+            'cost': data.price[squad_rows, g], 'expected_points': expected[squad_rows, g],
+        })
+        lineup = _lineup(squad_pool)
+        points, captain = _score(lineup, dict(zip(squad, data.actual[squad_rows, g])),
+                                 dict(zip(squad, data.minutes[squad_rows, g])))
+        result.points += points - hit
+        result.hits += hit
+        result.transfers += len(ins)
+        result.weeks.append({'gw': int(gw), 'points': points, 'hit': hit, 'out': outs, 'in': ins,
+                             'captain': captain, 'bank': bank, 'free_transfers': free_transfers})
+    last = len(data.gws) - 1
+    result.final_value = round(bank + sum(selling_price(bought[p], data.price[row_of[p], last]) for p in squad), 1)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+# Per-process caches: a worker loads each season and model once, however many
+# configs it is handed
+_seasons = {}
+_models = {}
+
+
+def _season(path):
+    if path not in _seasons:
+        _seasons[path] = SeasonData(FeatureStore(path).rows())
+    return _seasons[path]
+
+
+def _model(config):
+    if config.predictor != 'model':
+        return None
+    from src.model_trainer import latest_model_info, load_model, TARGET_GAMEWEEK
+    path = config.model_path
+    if path is None:
+        info = latest_model_info()
+        if info is None or info.target != TARGET_GAMEWEEK:
+            raise ValueError("no gameweek model in models/; train one or pass model_path")
+        path = info.path
+    if path not in _models:
+        _models[path] = load_model(path)
+    return _models[path]
+
+
+def _run_task(season, path, config):
+    return run_season(season, _season(path), config, _model(config))
+
+
+def run_backtests(seasons, configs, processes=None):
+    # Every (season, config) pair on a process pool. seasons maps a name to a feature
+    # store path. Returns SeasonResults in (season, config) order.
+    tasks = [(name, path, config) for name, path in seasons.items() for config in configs]
+    processes = processes or os.cpu_count() or 1
+    if processes <= 1 or len(tasks) <= 1:
+        return [_run_task(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(processes, len(tasks))) as pool:
+        return list(pool.map(_run_task, *zip(*tasks)))
+
+
+def report(results):
+    # Per config: total and per-season points, hits and transfers, ranked by total,
+    # with the gap to the best
+    by_config = {}
+    for r in results:
+        summary = by_config.setdefault(r.config, {'config': r.config, 'points': 0, 'hits': 0, 'transfers': 0,
+                                                  'seasons': {}, 'seconds': 0.0})
+        summary['points'] += r.points
+        summary['hits'] += r.hits
+        summary['transfers'] += r.transfers
+        summary['seasons'][r.season] = r.points
+        summary['seconds'] += r.seconds
+    ranked = sorted(by_config.values(), key=lambda s: -s['points'])
+    for summary in ranked:
+        summary['behind_best'] = ranked[0]['points'] - summary['points']
+        summary['seconds'] = round(summary['seconds'], 2)
+    return ranked
+
+
+def _parse_config(spec):
+    # name[:key=value,...], e.g. "form-soft:predictor=form,fdr_multiplier=0/1.1/1.1/1/0.9/0.8"
+    name, _, rest = spec.partition(':')
+    fields = {'name': name}
+    for item in filter(None, rest.split(',')):
+        key, _, value = item.partition('=')
+        if key == 'fdr_multiplier':
+            fields[key] = tuple(float(v) for v in value.split('/'))
+        elif key in ('max_transfers',):
+            fields[key] = int(value)
+        elif key in ('min_gain', 'budget'):
+            fields[key] = float(value)
+        else:
+            fields[key] = value
+    config = BacktestConfig(**fields)
+    if config.predictor not in PREDICTORS:
+        raise ValueError(f"unknown predictor {config.predictor}; expected one of {PREDICTORS}")
+    return config
+
+
+def main(argv=None):
+    # python -m src.backtest --season 2024=features --config model --config form:predictor=form
+    parser = argparse.ArgumentParser(description="Replay seasons through predict -> optimize -> transfer")
+    parser.add_argument('--season', action='append', required=True, help="name=feature store path")
+    parser.add_argument('--config', action='append', help="name[:key=value,...]; default: model, form and ppg")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--output', help="write the report and per-week results as JSON")
+    args = parser.parse_args(argv)
+
+    seasons = dict(spec.split('=', 1) for spec in args.season)
+    specs = args.config or ['model', 'form:predictor=form', 'ppg:predictor=ppg']
+    try:
+        configs = [_parse_config(spec) for spec in specs]
+    except (TypeError, ValueError) as e:
+        parser.error(str(e))
+    started = time.perf_counter()
+    results = run_backtests(seasons, configs, args.processes)
+    ranked = report(results)
+
+    print(f"{'config':<20} {'points':>7} {'behind':>7} {'hits':>5} {'transfers':>9}  per season")
+    for s in ranked:
+        per_season = '  '.join(f"{k}={v}" for k, v in s['seasons'].items())
+        print(f"{s['config']:<20} {s['points']:>7} {s['behind_best']:>7} {s['hits']:>5} {s['transfers']:>9}  {per_season}")
+    print(f"{len(results)} season replays in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'report': ranked, 'results': [asdict(r) for r in results],
+                       'configs': [asdict(c) for c in configs]}, f, indent=2, default=float)
+    return ranked
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from src.data_fetcher import (fetch_bundle, get_client, call_with_retry, RateLimiter,
+                              UPSTREAM_RATE, UPSTREAM_BURST, FETCH_THREADS)
+from src.metrics import stage
+from src.recommender import Recommender, DEFAULT_OPTIONS, recommend_for, summary_json
+
+
+@dataclass
+class BatchResult:
+    recommendations: dict = field(default_factory=dict)   # manager id -> Recommendation
+    errors: dict = field(default_factory=dict)            # manager id -> message
+    timings: dict = field(default_factory=dict)           # phase -> seconds
+
+
+def fetch_managers(manager_ids, gw, client=None, limiter=None, threads=FETCH_THREADS, with_entry=True):
+    # Picks (and entry info) for every manager, concurrently but under one rate limit.
+    # Cached responses do not use up the limit. Returns ({id: (entry, picks)}, {id: error message}).
+    client = client or get_client()
+    limiter = limiter or RateLimiter(UPSTREAM_RATE, UPSTREAM_BURST)
+
+    def fetch(manager_id):
+        picks = call_with_retry(client.picks, manager_id, gw, limiter)
+        entry = call_with_retry(client.entry, manager_id, limiter) if with_entry else None
+        return entry, picks
+
+    fetched, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='fpl-batch') as pool:
+        futures = {m: pool.submit(fetch, m) for m in manager_ids}
+        for manager_id, future in futures.items():
+            try:
+                fetched[manager_id] = future.result()
+            except Exception as e:
+                errors[manager_id] = str(e)
+    return fetched, errors
+
+
+def _recommend_task(shared, manager_id, entry, picks, options, warm_start):
+    # (recommendation, error message) so one failing manager does not sink the batch
+    try:
+        return recommend_for(shared, manager_id, entry, picks, options, warm_start), None
+    except Exception as e:
+        return None, str(e)
+
+
+def run_batch(manager_ids, recommender, options=DEFAULT_OPTIONS, processes=None, rate=UPSTREAM_RATE,
+              burst=UPSTREAM_BURST, client=None, executor=None):
+    # Shared state once per snapshot, picks fetched concurrently, and per-manager
+    # transfer/captaincy work spread over a process pool: `executor` when given (a
+    # long-lived pool, as the web app keeps), else one started for this batch
+    client = client or recommender.client
+    result = BatchResult()
+    manager_ids = list(dict.fromkeys(manager_ids))
+    started = time.perf_counter()
+
+    with stage('batch_shared'):
+        bundle = fetch_bundle(None, client=client)
+        shared = recommender.shared_state(bundle, options.budget)
+    result.timings['shared'] = time.perf_counter() - started
+
+    # Managers already answered for this snapshot/model/options come from the cache
+    todo = []
+    for manager_id in manager_ids:
+        cached = recommender.responses.get((shared.snapshot_version, shared.model_version, manager_id, options))
+        if cached is not None:
+            result.recommendations[manager_id] = cached
+        else:
+            todo.append(manager_id)
+
+    mark = time.perf_counter()
+    with stage('batch_fetch'):
+        fetched, result.errors = fetch_managers(todo, bundle.gw, client, RateLimiter(rate, burst))
+    result.timings['fetch'] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    tasks = [(m, fetched[m][0], fetched[m][1], options, recommender.previous_plan(m))
+             for m in todo if m in fetched]
+    processes = processes or os.cpu_count() or 1
+    with stage('batch_recommend'):
+        if processes <= 1 or len(tasks) <= 1:
+            outcomes = [_recommend_task(shared, *task) for task in tasks]
+        else:
+            # Tasks go out in one chunk per worker, so the shared state is pickled once per chunk
+            chunksize = -(-len(tasks) // processes)
+            calls = [(shared,) + task for task in tasks]
+            if executor is not None:
+                outcomes = list(executor.map(_recommend_task, *zip(*calls), chunksize=chunksize))
+            else:
+                with ProcessPoolExecutor(max_workers=min(processes, len(tasks))) as pool:
+                    outcomes = list(pool.map(_recommend_task, *zip(*calls), chunksize=chunksize))
+    for task, (rec, error) in zip(tasks, outcomes):
+        if error is not None:
+            result.errors[task[0]] = error
+            continue
+        recommender.remember(rec)
+        result.recommendations[rec.manager_id] = rec
+    result.timings['recommend'] = time.perf_counter() - mark
+    result.timings['total'] = time.perf_counter() - started
+    return result
+
+
+def _read_ids(path):
+    with open(path) as f:
+        return [int(token) for line in f for token in line.replace(',', ' ').split()]
+
+
+def main(argv=None):
+    # python -m src.batch 123 456 --file managers.txt --processes 4 --output recs.json
+    from src.model_trainer import ModelRegistry
+    parser = argparse.ArgumentParser(description="Recommendations for many managers in one pass")
+    parser.add_argument('managers', nargs='*', type=int, help="FPL manager ids")
+    parser.add_argument('--file', help="file of manager ids, whitespace or comma separated")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--rate', type=float, default=UPSTREAM_RATE, help="upstream requests per second")
+    parser.add_argument('--budget', type=float, default=DEFAULT_OPTIONS.budget)
+    parser.add_argument('--max-transfers', type=int, default=DEFAULT_OPTIONS.max_transfers)
+    parser.add_argument('--horizon', type=int, default=DEFAULT_OPTIONS.horizon, help="0 skips the multi-week planner")
+    parser.add_argument('--simulations', type=int, default=DEFAULT_OPTIONS.simulations)
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    manager_ids = list(args.managers) + (_read_ids(args.file) if args.file else [])
+    if not manager_ids:
+        parser.error("no manager ids given")
+    options = DEFAULT_OPTIONS._replace(budget=args.budget, max_transfers=args.max_transfers,
+                                       horizon=args.horizon, simulations=args.simulations)
+    registry = ModelRegistry()
+    registry.load()
+    result = run_batch(manager_ids, Recommender(registry), options, processes=args.processes, rate=args.rate)
+
+    report = {
+        'results': [summary_json(result.recommendations[m]) for m in manager_ids if m in result.recommendations],
+        'errors': {str(m): e for m, e in result.errors.items()},
+        'timings': {k: round(v, 3) for k, v in result.timings.items()},
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    print(f"{len(report['results'])} managers in {result.timings['total']:.1f}s "
+          f"({len(result.errors)} failed)", file=sys.stderr)
+    return 1 if result.errors and not report['results'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from src.metrics import stage
+from src.player_pool import as_pool
+from src.team_optimizer import TeamOptimizer, SQUAD_SIZE, STARTING_LIMITS, STARTING_SIZE
+
+# FPL's chip names, as they appear in entry/{id}/history/
+CHIPS = ('wildcard', 'freehit', 'bboost', '3xc')
+CHIP_LABELS = {'wildcard': 'Wildcard', 'freehit': 'Free Hit', 'bboost': 'Bench Boost', '3xc': 'Triple Captain'}
+# Every chip is issued once per half season and lapses at the end of it
+SEASON_HALF_GW = 19
+CANDIDATES_PER_POSITION = 40   # pool rows offered to each wildcard/free hit MILP, per position
+
+
+@dataclass
+class ChipOption:
+    chip: str
+    gw: int
+    gain: float        # expected points over holding the current squad
+    points: float      # expected points with the chip, over the weeks it affects
+    baseline: float    # the same weeks without it
+    ins: list = field(default_factory=list)    # player ids brought in (wildcard, free hit)
+    outs: list = field(default_factory=list)
+
+
+@dataclass
+class ChipPlan:
+    options: list                    # every (chip, gameweek), best gain first
+    best: dict                       # chip -> its best ChipOption
+    baseline: list                   # expected points per week holding the current squad
+    start_gw: int = None
+    seconds: float = 0.0
+    # Filled in by the recommender for its cache and JSON view
+    manager_id: int = None
+    snapshot_version: str = None
+    model_version: str = None
+    available: list = None
+    players: dict = None             # id -> player dict for every id in options
+
+
+def available_chips(history, gw):
+    # Chips not yet played in the half of the season gw falls in
+    half = gw <= SEASON_HALF_GW
+    used = {c.get('name') for c in (history or {}).get('chips', [])
+            if c.get('event') and (c['event'] <= SEASON_HALF_GW) == half}
+    return [chip for chip in CHIPS if chip not in used]
+
+
+def lineup_values(points, positions):
+    # Best XI value per week (captain counted twice) and the bench total, for a 15-man
+    # squad's [players, weeks] points. Every legal formation is tried on the sorted
+    # per-position points, so no solver is needed.
+    weeks = points.shape[1]
+    top = {}
+    for pos in SQUAD_SIZE:
+        rows = np.sort(points[positions == pos], axis=0)[::-1]
+        top[pos] = np.vstack([np.zeros((1, weeks)), np.cumsum(rows, axis=0)])   # top[pos][k] = best k
+    best = np.full(weeks, -np.inf)
+    for d in range(STARTING_LIMITS['DEF'][0], STARTING_LIMITS['DEF'][1] + 1):
+        for m in range(STARTING_LIMITS['MID'][0], STARTING_LIMITS['MID'][1] + 1):
+            f = STARTING_SIZE - 1 - d - m
+            lo, hi = STARTING_LIMITS['FWD']
+            if not lo <= f <= hi or any(k >= len(top[p]) for p, k in (('DEF', d), ('MID', m), ('FWD', f))):
+                continue
+            best = np.maximum(best, top['GKP'][1] + top['DEF'][d] + top['MID'][m] + top['FWD'][f])
+    # The best player always starts, so the captain is the squad's best each week
+    xi = best + points.max(axis=0)
+    bench = points.sum(axis=0) - best
+    return xi, bench
+
+
+# Worker-process state: the [players, weeks] points matrix and the player pool are
+# sent once per worker by the pool initializer, and every MILP reads them
+_shared = None
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def _candidate_rows(shared, objective, keep):
+    # The best CANDIDATES_PER_POSITION rows per position on this objective, plus `keep`
+    rows = set(keep)
+    for pos in SQUAD_SIZE:
+        idx = np.flatnonzero(shared['pool'].position_mask(pos))
+        rows.update(idx[np.argsort(-objective[idx])[:CANDIDATES_PER_POSITION]].tolist())
+    return np.array(sorted(rows))
+
+
+def _solve_chip(chip, w, shared=None):
+    # Wildcard from week w to the end of the horizon, or a free hit for week w alone:
+    # the best squad for the summed weeks under the squad's value, then scored week by
+    # week with its best XI. Returns (chip, w, chip points, weeks affected, ins, outs).
+    shared = shared or _shared
+    pool, points = shared['pool'], shared['points']
+    weeks = slice(w, points.shape[1]) if chip == 'wildcard' else slice(w, w + 1)
+    objective = points[:, weeks].sum(axis=1)
+    rows = _candidate_rows(shared, objective, shared['squad_rows'])
+    selection = TeamOptimizer(pool.subset(rows, expected_points=objective[rows]), shared['budget']).solve()
+    chosen = rows[np.asarray(selection.indices)]
+    xi, _ = lineup_values(points[chosen][:, weeks], shared['positions'][chosen])
+    squad = set(shared['squad_rows'].tolist())
+    ins = [int(pool.ids[r]) for r in chosen if r not in squad]
+    outs = [int(pool.ids[r]) for r in shared['squad_rows'] if r not in set(chosen.tolist())]
+    return chip, w, float(xi.sum()), weeks, ins, outs
+
+
+def evaluate_chips(player_data, points_by_gw, squad_ids, budget, start_gw, chips=CHIPS, processes=None):
+    # Every available chip in every week of the horizon against holding the current
+    # squad. Wildcard and free hit are one squad MILP each, run on a process pool that
+    # shares the points matrix; bench boost and triple captain are read off the best XI.
+    started = time.perf_counter()
+    pool = as_pool(player_data)
+    squad_rows = pool.rows_for(list(squad_ids))
+    squad_rows = squad_rows[squad_rows >= 0]
+    points = np.asarray(points_by_gw, dtype=float)
+    shared = {
+        'pool': pool.core(),   # only the solver's columns travel to the workers
+        'points': points,
+        'positions': pool.column('position').astype(str),
+        'squad_rows': squad_rows,
+        'budget': float(budget),
+    }
+    horizon = points.shape[1]
+    baseline, bench = lineup_values(points[squad_rows], shared['positions'][squad_rows])
+
+    options = []
+    for w in range(horizon):
+        gw = start_gw + w
+        if 'bboost' in chips:
+            options.append(ChipOption('bboost', gw, float(bench[w]), float(baseline[w] + bench[w]), float(baseline[w])))
+        if '3xc' in chips:
+            captain = float(points[squad_rows, w].max()) if len(squad_rows) else 0.0
+            options.append(ChipOption('3xc', gw, captain, float(baseline[w] + captain), float(baseline[w])))
+
+    tasks = [(chip, w) for chip in ('wildcard', 'freehit') if chip in chips for w in range(horizon)]
+    processes = processes or os.cpu_count() or 1
+    with stage('chips'):
+        if processes <= 1 or len(tasks) <= 1:
+            solved = [_solve_chip(chip, w, shared) for chip, w in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(processes, len(tasks)), initializer=_init_worker,
+                                     initargs=(shared,)) as pool:
+                solved = list(pool.map(_solve_chip, *zip(*tasks)))
+    for chip, w, value, weeks, ins, outs in solved:
+        held = float(baseline[weeks].sum())
+        options.append(ChipOption(chip, start_gw + w, value - held, value, held, ins, outs))
+
+    options.sort(key=lambda o: -o.gain)
+    best = {}
+    for option in options:
+        best.setdefault(option.chip, option)
+    return ChipPlan(options, best, [float(v) for v in baseline], start_gw, time.perf_counter() - started)
@@ -1,26 +1,449 @@
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from src.metrics import CACHE_REQUESTS, UPSTREAM_SECONDS
+
+BASE_URL = "https://fantasy.premierleague.com/api"
+# Set FPL_BASE_URL to point the app at another upstream, e.g. the stand-in server in
+# benchmarks/fake_upstream.py (http://127.0.0.1:8001/api)
+BASE_URL_ENV = 'FPL_BASE_URL'
+
+# How long a cached response is served without asking upstream, and whether an
+# expired entry is revalidated with If-None-Match / If-Modified-Since instead of
+# being downloaded again.
+CachePolicy = namedtuple('CachePolicy', ['ttl', 'revalidate'])
+
+BOOTSTRAP_POLICY = CachePolicy(ttl=300, revalidate=True)   # prices/news only move a few times a day
+FIXTURES_POLICY = CachePolicy(ttl=900, revalidate=True)    # scores change on match days only
+ENTRY_POLICY = CachePolicy(ttl=300, revalidate=False)
+PICKS_POLICY = CachePolicy(ttl=120, revalidate=False)
+HISTORY_POLICY = CachePolicy(ttl=300, revalidate=False)
+ELEMENT_SUMMARY_POLICY = CachePolicy(ttl=3600, revalidate=False)   # per-player history, for training
+LIVE_POLICY = CachePolicy(ttl=300, revalidate=True)                 # a gameweek's stats, final once it finishes
+STANDINGS_POLICY = CachePolicy(ttl=300, revalidate=False)
+
+# Set FPL_ARCHIVE_DIR to archive every bootstrap-static and fixtures pull, and
+# FPL_REPLAY_AT (a timestamp, or 'latest') to serve that archive instead of the API
+ARCHIVE_ENV = 'FPL_ARCHIVE_DIR'
+REPLAY_ENV = 'FPL_REPLAY_AT'
+ARCHIVED_ENDPOINTS = ('bootstrap-static', 'fixtures')
+
+# Concurrent fetch stage settings
+FETCH_WORKERS = 8
+CALL_TIMEOUT = 15      # wall-clock seconds per call, including retries
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.25   # seconds, doubled on every attempt
+
+# Bulk fetches (many managers, every player's history) share one token bucket.
+# FPL_UPSTREAM_RATE overrides the requests per second, e.g. behind a proxy that allows more.
+UPSTREAM_RATE_ENV = 'FPL_UPSTREAM_RATE'
+UPSTREAM_RATE = float(os.environ.get(UPSTREAM_RATE_ENV) or 10.0)
+UPSTREAM_BURST = 10
+FETCH_THREADS = 16
+
+
+# Fields the pipeline actually reads. A snapshot's content_version only moves when
+# one of these does, not on every ownership or transfer-count tick.
+ELEMENT_FIELDS = ('id', 'first_name', 'second_name', 'web_name', 'team', 'element_type', 'total_points',
+                  'form', 'now_cost', 'chance_of_playing_next_round', 'news', 'points_per_game', 'minutes')
+TEAM_FIELDS = ('id', 'name')
+EVENT_FIELDS = ('id', 'deadline_time', 'is_current', 'is_next', 'finished')
+
+
+class FPLAPIError(Exception):
+    def __init__(self, url, status_code):
+        super().__init__(f"FPL API request to {url} failed with status {status_code}")
+        self.url = url
+        self.status_code = status_code
+
+
+def _project(rows, fields):
+    getter = itemgetter(*fields)
+    try:
+        return [getter(row) for row in rows]
+    except KeyError:
+        return [tuple(row.get(f) for f in fields) for row in rows]
+
+
+class BootstrapSnapshot:
+    # Parsed bootstrap-static payload. Built once per upstream version and shared
+    # by every caller until the cache entry is replaced.
+    def __init__(self, data, version=None, fetched_at=None):
+        self.elements = data.get('elements', [])
+        self.teams = data.get('teams', [])
+        self.events = data.get('events', [])
+        self.element_types = data.get('element_types', [])
+        self.version = version
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.team_by_id = {t['id']: t for t in self.teams if 'id' in t}
+        self._content_version = None
+        self._projections = {}
+
+    def projection(self, kind):
+        # Rows of elements/teams/events as tuples of the fields above, built once
+        if kind not in self._projections:
+            rows, fields = {'elements': (self.elements, ELEMENT_FIELDS), 'teams': (self.teams, TEAM_FIELDS),
+                            'events': (self.events, EVENT_FIELDS)}[kind]
+            self._projections[kind] = _project(rows, fields)
+        return self._projections[kind]
+
+    @property
+    def content_version(self):
+        # Digest of the fields in ELEMENT_FIELDS / TEAM_FIELDS / EVENT_FIELDS
+        if self._content_version is None:
+            digest = hashlib.sha1()
+            for kind in ('elements', 'teams', 'events'):
+                digest.update(repr(self.projection(kind)).encode())
+            self._content_version = digest.hexdigest()
+        return self._content_version
+
+    @property
+    def last_finished_gw(self):
+        finished = [event['id'] for event in self.events if event.get('finished')]
+        return max(finished) if finished else None
+
+    @property
+    def current_gw(self):
+        for event in self.events:
+            if event.get('is_current'):
+                return event['id']
+        return None
+
+    @property
+    def next_gw(self):
+        for event in self.events:
+            if event.get('is_next'):
+                return event['id']
+        return None
+
+
+class _CacheEntry:
+    __slots__ = ('value', 'etag', 'last_modified', 'expires_at')
+
+    def __init__(self, value, etag, last_modified, expires_at):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+
+class FPLClient:
+    def __init__(self, base_url=BASE_URL, timeout=10, pool_size=20, session=None, archive=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.archive = archive   # SnapshotArchive that new bootstrap/fixtures payloads are recorded in
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._key_locks = {}
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0}
+
+    def _lock_for(self, key):
+        with self._cache_lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _get(self, path, policy, transform=None, endpoint=None, force=False, limiter=None):
+        # Single-flight per URL: concurrent callers wait for one upstream fetch
+        # rather than all downloading the same payload. force skips the TTL but
+        # still revalidates, so an unchanged payload costs a 304. A limiter is only
+        # charged when the request actually goes upstream.
+        url = f"{self.base_url}/{path}"
+        endpoint = endpoint or path.strip('/')
+        with self._lock_for(url):
+            entry = self._cache.get(url)
+            now = time.time()
+            if entry is not None and now < entry.expires_at and not force:
+                self.stats['hits'] += 1
+                CACHE_REQUESTS.inc(endpoint=endpoint, result='hit')
+                return entry.value
+
+            headers = {}
+            if entry is not None and policy.revalidate:
+                if entry.etag:
+                    headers['If-None-Match'] = entry.etag
+                if entry.last_modified:
+                    headers['If-Modified-Since'] = entry.last_modified
+
+            if limiter is not None:
+                limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, status='error')
+                raise
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, status=response.status_code)
+            if response.status_code == 304 and entry is not None:
+                self.stats['revalidated'] += 1
+                CACHE_REQUESTS.inc(endpoint=endpoint, result='revalidated')
+                entry.expires_at = now + policy.ttl
+                return entry.value
+            if response.status_code != 200:
+                raise FPLAPIError(url, response.status_code)
+
+            self.stats['misses'] += 1
+            CACHE_REQUESTS.inc(endpoint=endpoint, result='miss')
+            payload = response.json()
+            value = transform(payload, response) if transform else payload
+            if self.archive is not None and endpoint in ARCHIVED_ENDPOINTS:
+                try:
+                    self.archive.record(endpoint, payload, response.headers.get('ETag'),
+                                        response.headers.get('Last-Modified'), now)
+                except Exception as e:
+                    print(f"Failed to archive {endpoint}: {e}")
+            self._cache[url] = _CacheEntry(
+                value,
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified'),
+                now + policy.ttl,
+            )
+            return value
+
+    def bootstrap(self, force=False):
+        def to_snapshot(payload, response):
+            version = response.headers.get('ETag') or hashlib.sha1(response.content).hexdigest()
+            return BootstrapSnapshot(payload, version=version)
+        return self._get("bootstrap-static/", BOOTSTRAP_POLICY, to_snapshot, endpoint='bootstrap-static', force=force)
+
+    def fixtures(self):
+        return self._get("fixtures/", FIXTURES_POLICY, endpoint='fixtures')
+
+    def entry(self, fpl_id, limiter=None):
+        return self._get(f"entry/{fpl_id}/", ENTRY_POLICY, endpoint='entry', limiter=limiter)
+
+    def picks(self, fpl_id, gw, limiter=None):
+        return self._get(f"entry/{fpl_id}/event/{gw}/picks/", PICKS_POLICY, endpoint='picks', limiter=limiter)
+
+    def history(self, fpl_id):
+        return self._get(f"entry/{fpl_id}/history/", HISTORY_POLICY, endpoint='history')
+
+    def league_standings(self, league_id, page=1):
+        # One page (50 managers) of a classic league's standings
+        return self._get(f"leagues-classic/{league_id}/standings/?page_standings={page}", STANDINGS_POLICY,
+                         endpoint='league-standings')
+
+    def element_summary(self, player_id):
+        return self._get(f"element-summary/{player_id}/", ELEMENT_SUMMARY_POLICY, endpoint='element-summary')
+
+    def event_live(self, gw):
+        return self._get(f"event/{gw}/live/", LIVE_POLICY, endpoint='event-live')
+
+    def seed(self, path, value, etag=None, last_modified=None):
+        # Pre-populate a cache entry that is already due for revalidation
+        with self._cache_lock:
+            self._cache[f"{self.base_url}/{path}"] = _CacheEntry(value, etag, last_modified, 0)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = _client_from_env()
+        return _default_client
+
+
+def _client_from_env():
+    archive_dir, replay_at = os.environ.get(ARCHIVE_ENV), os.environ.get(REPLAY_ENV)
+    base_url = os.environ.get(BASE_URL_ENV) or BASE_URL
+    if not archive_dir and not replay_at:
+        return FPLClient(base_url)
+    from src.snapshot_archive import SnapshotArchive, ReplayClient, ARCHIVE_DIR
+    archive = SnapshotArchive(archive_dir or ARCHIVE_DIR)
+    if replay_at:
+        print(f"Replaying FPL snapshots from {archive.path} at {replay_at}")
+        return ReplayClient(archive, None if replay_at == 'latest' else replay_at)
+    client = FPLClient(base_url, archive=archive)
+    archive.warm(client)
+    return client
+
+
+def set_client(client):
+    # Swap the process-wide client, e.g. for a synthetic or replaying upstream
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
+
+
+def fetch_bootstrap():
+    return get_client().bootstrap()
+
 
 def fetch_player_data():
-    url = "https://fantasy.premierleague.com/api/bootstrap-static/"
-    response = requests.get(url)
-    data = response.json()
-    return data['elements']
+    return fetch_bootstrap().elements
+
+
+def fetch_team_data():
+    return fetch_bootstrap().teams
+
+
+def fetch_current_gw():
+    try:
+        return fetch_bootstrap().current_gw
+    except FPLAPIError:
+        return None
+
 
 def fetch_fixtures():
-    url = "https://fantasy.premierleague.com/api/fixtures/"
-    response = requests.get(url)
-    if response.status_code == 200:
+    try:
+        return get_client().fixtures()
+    except FPLAPIError as e:
+        print(f"Failed to fetch fixtures. Status: {e.status_code}")
+        return []
+    except ValueError as e:
+        print(f"Error decoding JSON from fixtures API: {e}")
+        return []
+
+
+def fetch_entry_info(fpl_id):
+    try:
+        return get_client().entry(fpl_id)
+    except FPLAPIError:
+        return None
+
+
+def fetch_team_picks(fpl_id, gw):
+    try:
+        return get_client().picks(fpl_id, gw)
+    except FPLAPIError:
+        return None
+
+
+class RateLimiter:
+    # Token bucket shared by the fetch threads: `rate` requests per second on
+    # average, with up to `burst` issued back to back
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class FetchBundle:
+    snapshot: BootstrapSnapshot
+    fixtures: list
+    entry: dict = None
+    picks: dict = None
+    gw: int = None
+    errors: dict = field(default_factory=dict)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='fpl-fetch')
+        return _executor
+
+
+def _is_retryable(error):
+    if isinstance(error, FPLAPIError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, requests.RequestException)
+
+
+def call_with_retry(fn, *args, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+    for attempt in range(retries + 1):
         try:
-            return response.json()
+            return fn(*args)
         except Exception as e:
-            print(f"Error decoding JSON from fixtures API: {e}")
-            return []
-    else:
-        print(f"Failed to fetch fixtures. Status: {response.status_code}")
-        return []
+            if attempt == retries or not _is_retryable(e):
+                raise
+            time.sleep(backoff * (2 ** attempt))
 
-def fetch_team_data():
-    url = "https://fantasy.premierleague.com/api/bootstrap-static/"
-    response = requests.get(url)
-    data = response.json()
-    return data['teams']
\ No newline at end of file
+
+def _result(future, name, errors, default=None, timeout=CALL_TIMEOUT):
+    try:
+        return future.result(timeout=timeout)
+    except Exception as e:
+        errors[name] = e
+        return default
+
+
+def fetch_bundle(fpl_id=None, client=None, timeout=CALL_TIMEOUT):
+    # Issue the independent upstream calls in parallel. Only picks has to wait,
+    # because it needs the gameweek from bootstrap-static.
+    client = client or get_client()
+    executor = _get_executor()
+    errors = {}
+
+    bootstrap_future = executor.submit(call_with_retry, client.bootstrap)
+    fixtures_future = executor.submit(call_with_retry, client.fixtures)
+    entry_future = executor.submit(call_with_retry, client.entry, fpl_id) if fpl_id else None
+
+    snapshot = _result(bootstrap_future, 'bootstrap', errors, timeout=timeout)
+    if snapshot is None:
+        raise errors['bootstrap']
+    gw = snapshot.current_gw
+    picks_future = executor.submit(call_with_retry, client.picks, fpl_id, gw) if fpl_id and gw else None
+
+    fixtures = _result(fixtures_future, 'fixtures', errors, default=[], timeout=timeout)
+    entry = _result(entry_future, 'entry', errors, timeout=timeout) if entry_future else None
+    picks = _result(picks_future, 'picks', errors, timeout=timeout) if picks_future else None
+    for name, error in errors.items():
+        print(f"Failed to fetch {name}: {error}")
+
+    return FetchBundle(snapshot=snapshot, fixtures=fixtures, entry=entry, picks=picks, gw=gw, errors=errors)
+
+
+def fetch_histories(player_ids, client=None, limiter=None, threads=FETCH_THREADS):
+    # Past-gameweek rows from element-summary for every player, concurrently but under
+    # one rate limit. Returns ({id: history rows}, {id: error message}).
+    client = client or get_client()
+    limiter = limiter or RateLimiter(UPSTREAM_RATE, UPSTREAM_BURST)
+
+    def fetch(player_id):
+        limiter.acquire()
+        return call_with_retry(client.element_summary, player_id).get('history', [])
+
+    histories, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='fpl-history') as pool:
+        futures = {p: pool.submit(fetch, p) for p in player_ids}
+        for player_id, future in futures.items():
+            try:
+                histories[player_id] = future.result()
+            except Exception as e:
+                errors[player_id] = str(e)
+    return histories, errors
@@ -1,3 +1,34 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.player_pool import PlayerPool
+
+POSITION_MAP = {1: 'GKP', 2: 'DEF', 3: 'MID', 4: 'FWD'}
+TEAM_STAT_COLUMNS = ['home_games', 'home_goals', 'away_games', 'away_goals']
+# Columns prepare_dataset has always returned
+DATASET_COLUMNS = ['id', 'name', 'team', 'position', 'total_points', 'form', 'price'] + TEAM_STAT_COLUMNS
+# Expected-points multiplier per FDR, indexed by difficulty (1-5); 0 is a blank
+FDR_MULTIPLIER = np.array([0.0, 1.0, 1.2, 1.0, 0.85, 0.7])
+NEUTRAL_FDR = 3
+# Per-fixture model inputs. Training rows compute them from element-summary history as
+# of the gameweek before each fixture; build_player_frame computes the same columns from
+# bootstrap-static for the gameweek being planned.
+GAMEWEEK_FEATURES = ['price', 'form', 'points_per_game', 'minutes_per_game', 'position_code',
+                     'difficulty', 'is_home']
+FORM_WINDOW = 4   # fixtures; FPL's own form is the mean over the last 30 days
+# Rolling means over each player's last 3/5/10 fixtures of minutes, points, goal
+# involvements and fixture-adjusted points (points divided by the FDR multiplier).
+# They come from the feature store at serve time.
+ROLLING_WINDOWS = (3, 5, 10)
+ROLLING_FEATURES = [f'{name}_{n}' for name in ('minutes', 'points', 'gi', 'points_adj') for n in ROLLING_WINDOWS]
+MODEL_FEATURES = GAMEWEEK_FEATURES + ROLLING_FEATURES
+# One row per player and fixture, as ingested; CARRY_COLUMNS are season totals through the row
+HISTORY_COLUMNS = ['id', 'gw', 'fixture', 'team', 'position_code', 'price', 'minutes', 'total_points',
+                   'goal_involvements', 'difficulty', 'is_home']
+CARRY_COLUMNS = ['cum_points', 'cum_apps', 'cum_minutes', 'cum_games']
+
 def process_player_data(player_data):
     # Clean and transform player data
     cleaned_data = []
@@ -38,28 +69,7 @@ def aggregate_fixture_data(fixture_data):
 
 def prepare_dataset(player_data, fixture_data):
     # Prepare the final dataset for model training
-    processed_players = process_player_data(player_data)
-    aggregated_fixtures = aggregate_fixture_data(fixture_data)
-    
-    # Combine player and fixture data into a single dataset
-    dataset = []
-    for player in processed_players:
-        player_stats = {
-            'id': player['id'],
-            'name': f"{player['first_name']} {player['second_name']}",
-            'team': player['team'],
-            'position': player['position'],
-            'total_points': player['total_points'],
-            'form': player['form'],
-            'price': player['price'],
-            'home_games': aggregated_fixtures.get(player['team'], {}).get('home_games', 0),
-            'home_goals': aggregated_fixtures.get(player['team'], {}).get('home_goals', 0),
-            'away_games': aggregated_fixtures.get(player['team'], {}).get('away_games', 0),
-            'away_goals': aggregated_fixtures.get(player['team'], {}).get('away_goals', 0)
-        }
-        dataset.append(player_stats)
-    
-    return dataset
+    return build_player_frame(player_data, fixture_data)[DATASET_COLUMNS].to_dict('records')
 
 # Added to support tests/test_data_processor.py
 def clean_data(player_data):
@@ -75,4 +85,279 @@ def clean_data(player_data):
             player.get('points') is not None
         ):
             cleaned.append(player)
-    return cleaned
\ No newline at end of file
+    return cleaned
+
+
+def aggregate_fixture_frame(fixture_data):
+    # Vectorized aggregate_fixture_data: one row per team id with the same four counts
+    if not fixture_data:
+        return pd.DataFrame(columns=TEAM_STAT_COLUMNS, dtype='int32')
+    fx = pd.DataFrame.from_records(fixture_data, columns=['team_h', 'team_a', 'team_h_score', 'team_a_score'])
+    home = fx.groupby('team_h').agg(home_games=('team_h', 'size'), home_goals=('team_h_score', 'sum'))
+    away = fx.groupby('team_a').agg(away_games=('team_a', 'size'), away_goals=('team_a_score', 'sum'))
+    stats = home.join(away, how='outer').fillna(0).astype('int32')
+    stats.index = stats.index.astype('int64')
+    return stats[TEAM_STAT_COLUMNS]
+
+class FixtureMatrix:
+    # Fixture difficulty and home/away flags indexed by [team_id, gameweek, slot].
+    # Slot 1 is only used in double gameweeks; a blank gameweek has count 0.
+    def __init__(self, fixture_data, n_teams=None, n_gws=None):
+        scheduled = [f for f in fixture_data if f.get('event')]
+        n_teams = n_teams or max([max(f['team_h'], f['team_a']) for f in scheduled] + [20])
+        n_gws = n_gws or max([f['event'] for f in scheduled] + [38])
+        self.n_teams = n_teams
+        self.n_gws = n_gws
+
+        count = np.zeros((n_teams + 1, n_gws + 1), dtype=np.int8)
+        for f in scheduled:
+            count[f['team_h'], f['event']] += 1
+            count[f['team_a'], f['event']] += 1
+        slots = max(int(count.max()), 1)
+
+        self.count = count
+        self.difficulty = np.zeros((n_teams + 1, n_gws + 1, slots), dtype=np.int8)
+        self.is_home = np.zeros((n_teams + 1, n_gws + 1, slots), dtype=bool)
+        self.opponent = np.zeros((n_teams + 1, n_gws + 1, slots), dtype=np.int16)
+        filled = np.zeros_like(count)
+        for f in scheduled:
+            gw = f['event']
+            for team, opp, home, fdr in ((f['team_h'], f['team_a'], True, f.get('team_h_difficulty')),
+                                         (f['team_a'], f['team_h'], False, f.get('team_a_difficulty'))):
+                slot = filled[team, gw]
+                self.difficulty[team, gw, slot] = fdr or NEUTRAL_FDR
+                self.is_home[team, gw, slot] = home
+                self.opponent[team, gw, slot] = opp
+                filled[team, gw] += 1
+
+    def lookup(self, team_id, gw):
+        n = self.count[team_id, gw]
+        return [(int(self.opponent[team_id, gw, i]), int(self.difficulty[team_id, gw, i]), bool(self.is_home[team_id, gw, i]))
+                for i in range(n)]
+
+    def multiplier(self, team_ids, gw):
+        # Summed FDR multiplier per team for one gameweek: 0 for a blank, roughly 2x for a double
+        return FDR_MULTIPLIER[self.difficulty[team_ids, gw]].sum(axis=-1)
+
+    def multipliers(self, team_ids, start_gw, horizon):
+        # [len(team_ids), horizon] slice of multipliers; gameweeks past the season are blanks
+        gws = np.arange(start_gw, start_gw + horizon)
+        valid = gws <= self.n_gws
+        out = np.zeros((len(team_ids), horizon))
+        out[:, valid] = FDR_MULTIPLIER[self.difficulty[np.asarray(team_ids)[:, None], gws[valid][None, :]]].sum(axis=-1)
+        return out
+
+    def mean_difficulty(self, team_ids, start_gw, horizon):
+        gws = np.arange(start_gw, min(start_gw + horizon, self.n_gws + 1))
+        d = self.difficulty[np.asarray(team_ids)[:, None], gws[None, :]].astype(float)
+        played = d > 0
+        return np.where(played.any(axis=(1, 2)), (d * played).sum(axis=(1, 2)) / np.maximum(played.sum(axis=(1, 2)), 1), NEUTRAL_FDR)
+
+
+_fixture_matrix = None   # (fixtures payload, its FixtureMatrix)
+_fixture_matrix_lock = threading.Lock()
+
+def fixture_matrix_for(fixture_data):
+    # Built once per fixtures payload. The API client returns the same list object
+    # until fixtures are refetched, so the object identity is the snapshot key. The
+    # payload itself is kept, so a new list can never reuse a freed one's identity.
+    global _fixture_matrix
+    with _fixture_matrix_lock:
+        if _fixture_matrix is None or _fixture_matrix[0] is not fixture_data:
+            _fixture_matrix = (fixture_data, FixtureMatrix(fixture_data))
+        return _fixture_matrix[1]
+
+def fixture_adjustment(fdr):
+    # Works on a single FDR or an array of them
+    return FDR_MULTIPLIER[np.clip(np.asarray(fdr, dtype=int), 0, 5)]
+
+def build_player_frame(player_data, fixture_data, teams=None, gw=None):
+    # Single typed frame for the whole player pool, built straight from the
+    # bootstrap elements. The model, optimizer and templates all read from it.
+    el = pd.DataFrame.from_records(player_data)
+    for col in ('web_name', 'news'):
+        if col not in el:
+            el[col] = ''
+    if 'chance_of_playing_next_round' not in el:
+        el['chance_of_playing_next_round'] = np.nan
+    for col in ('points_per_game', 'minutes'):
+        if col not in el:
+            el[col] = 0
+
+    frame = pd.DataFrame({
+        'id': el['id'].astype('int32'),
+        'name': el['first_name'].astype(str) + ' ' + el['second_name'].astype(str),
+        'web_name': el['web_name'].fillna('').astype(str),
+        'team': el['team'].astype('int32'),
+        'position': el['element_type'].map(POSITION_MAP).fillna('UNK').astype(str),
+        'total_points': el['total_points'].astype('int32'),
+        'form': pd.to_numeric(el['form'], errors='coerce').fillna(0).astype('float32'),
+        'price': (el['now_cost'] / 10).astype('float64'),
+        # FPL leaves chance_of_playing empty when there is no injury news
+        'chance_of_playing_next_round': pd.to_numeric(el['chance_of_playing_next_round'], errors='coerce').fillna(100).astype('float32'),
+        'news': el['news'].fillna('').astype(str),
+        'position_code': el['element_type'].fillna(0).astype('int8'),
+        'points_per_game': pd.to_numeric(el['points_per_game'], errors='coerce').fillna(0).astype('float32'),
+        'minutes': pd.to_numeric(el['minutes'], errors='coerce').fillna(0).astype('int32'),
+    })
+
+    stats = aggregate_fixture_frame(fixture_data)
+    frame = frame.join(stats, on='team')
+    frame[TEAM_STAT_COLUMNS] = frame[TEAM_STAT_COLUMNS].fillna(0).astype('int32')
+
+    if teams:
+        names = pd.Series({int(t['id']): t['name'] for t in teams if 'id' in t and 'name' in t}, name='team_name')
+        frame = frame.join(names, on='team')
+        frame['team_name'] = frame['team_name'].fillna(frame['team'].astype(str))
+    # Minutes per finished gameweek, and the first fixture of the planned one (a blank
+    # reads as a neutral away game). Without fixtures for the gameweek every team gets
+    # one neutral fixture.
+    frame['minutes_per_game'] = (frame['minutes'] / max((gw or 1) - 1, 1)).astype('float32')
+    frame['difficulty'] = np.int8(NEUTRAL_FDR)
+    frame['is_home'] = np.int8(0)
+    frame['fixture_count'] = np.int8(1)
+    frame['fdr_multiplier'] = 1.0
+    if gw and fixture_data:
+        matrix = fixture_matrix_for(fixture_data)
+        if gw <= matrix.n_gws:
+            team_ids = frame['team'].to_numpy()
+            count = matrix.count[team_ids, gw]
+            frame['fixture_count'] = count.astype('int8')
+            frame['fdr_multiplier'] = matrix.multiplier(team_ids, gw)
+            frame['difficulty'] = np.where(count > 0, matrix.difficulty[team_ids, gw, 0], NEUTRAL_FDR).astype('int8')
+            frame['is_home'] = (matrix.is_home[team_ids, gw, 0] & (count > 0)).astype('int8')
+    frame['cost'] = frame['price']
+    return frame
+
+def history_frame(histories, player_data, fixture_data):
+    # Raw per-fixture rows (HISTORY_COLUMNS) from element-summary history;
+    # histories maps player id -> that player's history rows
+    records = [row for rows in histories.values() for row in rows]
+    h = pd.DataFrame.from_records(records, columns=['element', 'fixture', 'round', 'total_points', 'minutes',
+                                                    'goals_scored', 'assists', 'value', 'was_home'])
+    home = h['was_home'].fillna(False).astype(bool)
+    return _history_rows(h['element'], h['round'], h['fixture'], h['value'] / 10, h['minutes'], h['total_points'],
+                         h['goals_scored'].fillna(0) + h['assists'].fillna(0), home, player_data, fixture_data)
+
+def live_history_frame(live, gw, player_data, fixture_data):
+    # The same rows for one finished gameweek from event/{gw}/live/, one call instead of
+    # one per player. Per-fixture stats come from `explain`; the price is today's.
+    teams = {p['id']: p['team'] for p in player_data}
+    prices = {p['id']: p['now_cost'] / 10 for p in player_data}
+    home_team = {f.get('id'): f['team_h'] for f in fixture_data}
+    rows = []
+    for element in live.get('elements', []):
+        for part in element.get('explain', []):
+            stats = {s['identifier']: s for s in part.get('stats', [])}
+            value = lambda name: (stats.get(name) or {}).get('value', 0)
+            rows.append((element['id'], part['fixture'], value('minutes'),
+                         sum(s.get('points', 0) for s in stats.values()),
+                         value('goals_scored') + value('assists'),
+                         home_team.get(part['fixture']) == teams.get(element['id'])))
+    h = pd.DataFrame.from_records(rows, columns=['element', 'fixture', 'minutes', 'total_points', 'gi', 'was_home'])
+    return _history_rows(h['element'], gw, h['fixture'], h['element'].map(prices), h['minutes'], h['total_points'],
+                         h['gi'], h['was_home'].astype(bool), player_data, fixture_data)
+
+def _history_rows(ids, gws, fixtures, prices, minutes, points, gi, home, player_data, fixture_data):
+    positions = {p['id']: p.get('element_type', 0) for p in player_data}
+    fdr, side = {}, {}
+    for f in fixture_data:
+        fdr[(f.get('id'), True)] = f.get('team_h_difficulty') or NEUTRAL_FDR
+        fdr[(f.get('id'), False)] = f.get('team_a_difficulty') or NEUTRAL_FDR
+        side[(f.get('id'), True)], side[(f.get('id'), False)] = f.get('team_h'), f.get('team_a')
+    raw = pd.DataFrame({
+        'id': ids.astype('int32'),
+        'gw': np.broadcast_to(gws, len(ids)).astype('int32') if np.isscalar(gws) else gws.astype('int32'),
+        'fixture': fixtures.astype('int32'),
+        'team': np.array([side.get((f, w)) or 0 for f, w in zip(fixtures, home)], dtype='int16'),
+        'position_code': ids.map(positions).fillna(0).astype('int8'),
+        'price': prices.astype('float64'),
+        'minutes': minutes.astype('int16'),
+        'total_points': points.astype('int16'),
+        'goal_involvements': gi.astype('int16'),
+        'difficulty': np.array([fdr.get((f, w), NEUTRAL_FDR) for f, w in zip(fixtures, home)], dtype='int8'),
+        'is_home': home.astype('int8'),
+    })
+    return raw.sort_values(['id', 'gw', 'fixture']).reset_index(drop=True)
+
+def _window_mean(values, ids, n):
+    # Mean of each player's previous n values (fewer at the start), excluding the row itself
+    before = values.groupby(ids).cumsum() - values
+    dropped = before.groupby(ids).shift(n).fillna(0)
+    count = np.minimum(ids.groupby(ids).cumcount(), n)
+    return ((before - dropped) / np.maximum(count, 1)).astype('float32')
+
+def rolling_features(raw, tail=None):
+    # Model inputs for each row of raw (HISTORY_COLUMNS) as they stood before its fixture:
+    # form, points/minutes per game and the ROLLING_FEATURES windows. tail holds earlier
+    # rows already processed (at least the last max(ROLLING_WINDOWS) per player, with
+    # their CARRY_COLUMNS), so a new gameweek costs only its own rows.
+    if tail is not None and len(tail):
+        rows = pd.concat([tail[HISTORY_COLUMNS].assign(_new=False), raw[HISTORY_COLUMNS].assign(_new=True)],
+                         ignore_index=True).sort_values(['id', 'gw', 'fixture'], kind='stable').reset_index(drop=True)
+        carry = tail.sort_values(['id', 'gw', 'fixture']).groupby('id')[CARRY_COLUMNS].last()
+    else:
+        rows = raw[HISTORY_COLUMNS].assign(_new=True).reset_index(drop=True)
+        carry = pd.DataFrame(columns=CARRY_COLUMNS, dtype='float64')
+    ids = rows['id']
+    points = rows['total_points'].astype('float64')
+    adjusted = points / FDR_MULTIPLIER[rows['difficulty'].to_numpy()]
+    out = rows.assign(
+        form=_window_mean(points, ids, FORM_WINDOW),
+        **{f'{name}_{n}': _window_mean(series, ids, n)
+           for name, series in (('minutes', rows['minutes'].astype('float64')), ('points', points),
+                                ('gi', rows['goal_involvements'].astype('float64')), ('points_adj', adjusted))
+           for n in ROLLING_WINDOWS})
+    out = out[out['_new']].drop(columns='_new')
+
+    # Season totals through each row, continuing from the carried totals
+    new_ids = out['id']
+    played = (out['minutes'] > 0).astype('float64')
+    for col, series in (('cum_points', out['total_points'].astype('float64')), ('cum_apps', played),
+                        ('cum_minutes', out['minutes'].astype('float64')), ('cum_games', pd.Series(1.0, index=out.index))):
+        out[col] = series.groupby(new_ids).cumsum() + new_ids.map(carry[col]).fillna(0).astype('float64')
+    out['points_per_game'] = ((out['cum_points'] - out['total_points']) / np.maximum(out['cum_apps'] - played, 1)).astype('float32')
+    out['minutes_per_game'] = ((out['cum_minutes'] - out['minutes']) / np.maximum(out['cum_games'] - 1, 1)).astype('float32')
+    out['target'] = out['total_points'].astype('float32')
+    return out.reset_index(drop=True)
+
+def gameweek_training_frame(histories, player_data, fixture_data):
+    # One row per (player, fixture) from element-summary history: MODEL_FEATURES as
+    # they stood before the fixture, plus 'gw' and the points scored ('target')
+    return rolling_features(history_frame(histories, player_data, fixture_data))
+
+def update_player_frame(frame, player_data, rows, fixture_data, teams=None, gw=None):
+    # Copy of frame with the given rows rebuilt from player_data (elements in the same
+    # order as the frame). Cost scales with the number of rows, not the pool size.
+    rows = np.asarray(rows, dtype=np.int64)
+    updated = frame.copy()
+    if len(rows) == 0:
+        return updated
+    fresh = build_player_frame([player_data[r] for r in rows], fixture_data, teams, gw=gw)
+    for col in fresh.columns:
+        if col in updated:
+            values = updated[col].to_numpy(copy=True)
+            values[rows] = fresh[col].to_numpy()
+            updated[col] = values
+    return updated
+
+def column_values(player_data, name):
+    # Column as a NumPy array from a PlayerPool, a player frame or a list of player dicts
+    if isinstance(player_data, PlayerPool):
+        return player_data.column(name)
+    if hasattr(player_data, 'iloc'):
+        return player_data[name].to_numpy()
+    return np.array([p[name] for p in player_data])
+
+def take_rows(player_data, rows):
+    # Selected rows in the shape templates and transfer output expect: row views for a
+    # PlayerPool, plain dicts otherwise
+    if isinstance(player_data, PlayerPool):
+        return player_data.rows(rows)
+    rows = [int(r) for r in rows]
+    if hasattr(player_data, 'iloc'):
+        # Straight from the column arrays; DataFrame.iloc/to_dict costs ~1ms per call
+        columns = [(name, player_data[name].to_numpy()) for name in player_data.columns]
+        return [{name: values[r].item() if hasattr(values[r], 'item') else values[r] for name, values in columns}
+                for r in rows]
+    return [player_data[r] for r in rows]
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.data_processor import (HISTORY_COLUMNS, CARRY_COLUMNS, ROLLING_FEATURES, ROLLING_WINDOWS,
+                                history_frame, live_history_frame, rolling_features)
+
+FEATURE_DIR = "features"
+# What ingest keeps per row: the raw fixture, season totals through it, the features
+# as they stood before it, and the points scored
+STORE_COLUMNS = HISTORY_COLUMNS + CARRY_COLUMNS + ['form', 'points_per_game', 'minutes_per_game'] + ROLLING_FEATURES + ['target']
+
+
+class FeatureStoreError(ValueError):
+    # The store is empty or was built by another version; the fix is rerunning ingest
+    pass
+
+
+class FeatureStore:
+    # Per-player, per-fixture history with rolling-window features, persisted as one
+    # directory of .npy columns per finished gameweek (features/gw-NN/<column>.npy)
+    # plus meta.json. Partitions are read memory-mapped and never rewritten: a new
+    # gameweek is computed from the last ROLLING_WINDOWS rows of each player and
+    # appended as its own partition.
+    def __init__(self, path=FEATURE_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._meta = None
+        self._meta_mtime = None
+        self._rows = None
+        self._latest = None
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.path, 'meta.json')
+
+    def _read_meta(self):
+        # Re-read when another process (the ingest job) has written a new gameweek
+        try:
+            mtime = os.path.getmtime(self.meta_path)
+        except OSError:
+            return {'gameweeks': []}
+        if mtime != self._meta_mtime:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            # A store written with other columns has partitions this code cannot read
+            if meta.get('columns') != STORE_COLUMNS:
+                missing = [c for c in STORE_COLUMNS if c not in meta.get('columns', [])]
+                raise FeatureStoreError(f"feature store at {self.path} was built with different columns "
+                                 f"(missing {', '.join(missing) or 'none'}); "
+                                 f"run python -m src.feature_store --rebuild")
+            self._meta = meta
+            self._meta_mtime = mtime
+            self._rows = self._latest = None
+        return self._meta
+
+    @property
+    def gameweeks(self):
+        return list(self._read_meta()['gameweeks'])
+
+    @property
+    def last_gw(self):
+        gameweeks = self.gameweeks
+        return gameweeks[-1] if gameweeks else None
+
+    def rows(self):
+        # Every ingested row as one frame (STORE_COLUMNS)
+        with self._lock:
+            meta = self._read_meta()
+            if self._rows is None:
+                parts = [self._load_partition(gw) for gw in meta['gameweeks']]
+                self._rows = (pd.concat(parts, ignore_index=True) if parts
+                              else pd.DataFrame({c: pd.Series(dtype='float32') for c in STORE_COLUMNS}))
+            return self._rows
+
+    def _partition_dir(self, gw):
+        return os.path.join(self.path, f"gw-{gw:02d}")
+
+    def _load_partition(self, gw):
+        directory = self._partition_dir(gw)
+        return pd.DataFrame({c: np.load(os.path.join(directory, f"{c}.npy"), mmap_mode='r') for c in STORE_COLUMNS})
+
+    def _write_partition(self, gw, frame):
+        # Columns go to a temporary directory that is renamed into place, then meta.json
+        # is replaced, so readers only ever see complete gameweeks
+        directory = self._partition_dir(gw)
+        tmp = directory + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for c in STORE_COLUMNS:
+            np.save(os.path.join(tmp, f"{c}.npy"), frame[c].to_numpy())
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp, directory)
+
+    def _commit(self, gameweeks):
+        meta = {'gameweeks': sorted(gameweeks), 'columns': STORE_COLUMNS, 'windows': list(ROLLING_WINDOWS)}
+        with open(self.meta_path + ".tmp", 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+    def tail(self, n=max(ROLLING_WINDOWS)):
+        # Each player's last n rows: all a new gameweek needs from the past
+        rows = self.rows()
+        return rows.sort_values(['id', 'gw', 'fixture'], kind='stable').groupby('id').tail(n)
+
+    def ingest(self, raw):
+        # Append raw history rows (HISTORY_COLUMNS) for gameweeks not stored yet; rows of
+        # stored gameweeks are ignored. Returns the gameweeks added.
+        os.makedirs(self.path, exist_ok=True)
+        stored = set(self.gameweeks)
+        raw = raw[~raw['gw'].isin(stored)]
+        if raw.empty:
+            return []
+        last = max(stored) if stored else None
+        if last is not None and raw['gw'].min() < last:
+            raise ValueError(f"gameweek {raw['gw'].min()} is older than the last stored gameweek {last}")
+        features = rolling_features(raw, self.tail() if stored else None)
+        added = sorted(int(gw) for gw in features['gw'].unique())
+        for gw in added:
+            self._write_partition(gw, features[features['gw'] == gw])
+        self._commit(stored | set(added))
+        with self._lock:
+            self._meta_mtime = None
+        return added
+
+    def training_frame(self):
+        # Rows with model inputs and target, for the trainer
+        return self.rows()
+
+    def latest(self):
+        # ROLLING_FEATURES per player id as they stand now, i.e. before the next fixture.
+        # Cached until a new gameweek is ingested.
+        with self._lock:
+            self._read_meta()
+            latest = self._latest
+        if latest is not None:
+            return latest
+        tail = self.tail()
+        if tail.empty:
+            latest = pd.DataFrame(columns=ROLLING_FEATURES, dtype='float32')
+        else:
+            # A placeholder next fixture per player; its features only look backwards
+            last = tail.groupby('id').tail(1)
+            upcoming = last[HISTORY_COLUMNS].assign(gw=last['gw'] + 1, fixture=0, minutes=0, total_points=0,
+                                                    goal_involvements=0)
+            latest = rolling_features(upcoming, tail).set_index('id')[ROLLING_FEATURES]
+        with self._lock:
+            self._latest = latest
+        return latest
+
+    def update(self, client=None):
+        # Bring the store up to the last finished gameweek: the whole season from
+        # element-summary on the first run, then one event/{gw}/live/ call per new gameweek
+        from src.data_fetcher import get_client, call_with_retry, fetch_histories
+        client = client or get_client()
+        snapshot = call_with_retry(client.bootstrap)
+        fixtures = call_with_retry(client.fixtures)
+        finished = snapshot.last_finished_gw
+        if finished is None:
+            return []
+        last = self.last_gw
+        if last is None:
+            histories, errors = fetch_histories([p['id'] for p in snapshot.elements], client)
+            if errors:
+                print(f"Skipping {len(errors)} players whose history could not be fetched")
+            raw = history_frame(histories, snapshot.elements, fixtures)
+            return self.ingest(raw[raw['gw'] <= finished])
+        added = []
+        for gw in range(last + 1, finished + 1):
+            live = call_with_retry(client.event_live, gw)
+            added += self.ingest(live_history_frame(live, gw, snapshot.elements, fixtures))
+        return added
+
+
+def main(argv=None):
+    # python -m src.feature_store: ingest any gameweeks finished since the last run
+    parser = argparse.ArgumentParser(description="Update the rolling per-gameweek feature store")
+    parser.add_argument('--path', default=FEATURE_DIR)
+    parser.add_argument('--rebuild', action='store_true', help="drop the store and ingest the season again")
+    args = parser.parse_args(argv)
+    if args.rebuild:
+        shutil.rmtree(args.path, ignore_errors=True)
+    store = FeatureStore(args.path)
+    added = store.update()
+    print(f"Feature store at {args.path}: added gameweeks {added or 'none'}, "
+          f"{len(store.rows())} rows through gameweek {store.last_gw}")
+    return store
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from src.batch import fetch_managers
+from src.data_fetcher import (fetch_bundle, get_client, call_with_retry, RateLimiter, FPLAPIError,
+                              UPSTREAM_RATE, UPSTREAM_BURST)
+from src.metrics import stage
+from src.points_simulator import PointsSimulator, distribution_params, CHUNK_SIZE
+from src.recommender import Recommender, DEFAULT_OPTIONS, ManagerNotFound, league_json
+from src.transfer_engine import TransferEngine
+
+MAX_LEAGUE_MANAGERS = 1000   # standings pages stop here (50 managers a page)
+LEAGUE_SIMULATIONS = 5_000
+TRANSFER_CANDIDATES = 10     # best single swaps by projected gain that are scored against the league
+TOP_OWNED = 20
+
+
+class LeagueNotFound(LookupError):
+    # Upstream answered, but the league has no standings to analyse
+    pass
+
+
+@dataclass
+class LeagueAnalysis:
+    league_id: int
+    name: str
+    gw: int                  # gameweek whose picks give the ownership
+    planning_gw: int         # gameweek whose projections are simulated
+    standings: list          # standings rows, in rank order
+    managers: list           # manager ids behind the ownership matrix's rows
+    ownership: list          # most-owned players: id, owned, captained, effective ownership
+    manager_id: int = None
+    baseline: dict = None    # the manager's team as picked
+    captains: list = field(default_factory=list)    # each starter as captain
+    transfers: list = field(default_factory=list)   # the best single transfers
+    players: dict = None     # id -> player row for every id above
+    errors: dict = field(default_factory=dict)      # manager id -> message, for picks that failed
+    sampled: bool = False    # only the top max_picks managers' picks (and the manager's) were used
+    snapshot_version: str = None
+    model_version: str = None
+    timings: dict = field(default_factory=dict)
+
+
+def fetch_standings(league_id, client=None, max_managers=MAX_LEAGUE_MANAGERS):
+    # (league info, standings rows) for a classic league, following has_next page by page
+    client = client or get_client()
+    league, rows, page = {}, [], 1
+    while len(rows) < max_managers:
+        data = call_with_retry(client.league_standings, league_id, page)
+        league = data.get('league') or league
+        standings = data.get('standings') or {}
+        rows.extend(standings.get('results', []))
+        if not standings.get('has_next'):
+            break
+        page += 1
+    return league, rows[:max_managers]
+
+
+def ownership_matrix(picks_by_manager, pool):
+    # (manager ids, multipliers) where multipliers is [managers, pool rows] int8: 0 for
+    # not owned or benched, 1 starting, 2 captained, 3 triple captained
+    managers = list(picks_by_manager)
+    picks = [p.get('picks', []) if p else [] for p in picks_by_manager.values()]
+    counts = np.array([len(p) for p in picks], dtype=np.int64)
+    manager_rows = np.repeat(np.arange(len(managers)), counts)
+    elements = np.array([pick['element'] for squad in picks for pick in squad], dtype=np.int64)
+    multipliers = np.array([pick.get('multiplier', 1) for squad in picks for pick in squad], dtype=np.int8)
+    rows = pool.rows_for(elements)
+    known = rows >= 0
+    matrix = np.zeros((len(managers), len(pool)), dtype=np.int8)
+    matrix[manager_rows[known], rows[known]] = multipliers[known]
+    owned = np.zeros((len(managers), len(pool)), dtype=bool)
+    owned[manager_rows[known], rows[known]] = True
+    return managers, matrix, owned
+
+
+def rivals_ahead(rivals, mine):
+    # For [sims, rivals] and [sims, options] scores, how many rivals finish strictly
+    # above each option in each simulation. Every simulation's sorted rival scores are
+    # shifted into a band of their own, so one searchsorted answers all of them.
+    sims, n = rivals.shape
+    if n == 0:
+        return np.zeros(mine.shape, dtype=np.int64)
+    low = min(rivals.min(), mine.min())
+    span = max(rivals.max(), mine.max()) - low + 1.0
+    offsets = np.arange(sims)[:, None] * span
+    keys = (np.sort(rivals, axis=1) - low + offsets).ravel()
+    at_or_below = np.searchsorted(keys, (mine - low + offsets).ravel(), side='right').reshape(mine.shape)
+    return n - (at_or_below - np.arange(sims)[:, None] * n)
+
+
+def _option(multipliers, mean, eo, rank, win, baseline_rank=None, **extra):
+    # One candidate team (a multiplier per simulated player) as reported
+    option = dict(extra, expected_points=float(multipliers @ mean),
+                  relative_points=float((multipliers - eo) @ mean),
+                  expected_rank=float(rank), win_probability=float(win))
+    if baseline_rank is not None:
+        option['rank_change'] = float(rank - baseline_rank)
+    return option
+
+
+def analyse_league(league_id, recommender, manager_id=None, options=DEFAULT_OPTIONS, client=None,
+                   rate=UPSTREAM_RATE, burst=UPSTREAM_BURST, max_managers=MAX_LEAGUE_MANAGERS, max_picks=None,
+                   n_sims=LEAGUE_SIMULATIONS, seed=42):
+    # Ownership across a mini-league and, for `manager_id`, how each captain choice and
+    # the best single transfers move their simulated rank within it. Picks cost one
+    # rate-limited request per manager; max_picks keeps that to the top of the standings.
+    client = client or recommender.client
+    started = time.perf_counter()
+    timings = {}
+
+    with stage('league_standings'):
+        league, standings = fetch_standings(league_id, client, max_managers)
+        bundle = fetch_bundle(None, client=client)
+        shared = recommender.shared_state(bundle, options.budget)
+    timings['standings'] = time.perf_counter() - started
+    if not standings:
+        raise LeagueNotFound(f"league {league_id} has no managers")
+    totals = {row['entry']: row.get('total', 0) for row in standings}
+    if manager_id is not None and manager_id not in totals:
+        raise ManagerNotFound(f"manager {manager_id} is not in league {league_id}")
+    members = list(totals)
+    sampled = max_picks is not None and len(members) > max_picks
+    if sampled:
+        members = members[:max_picks]
+        if manager_id is not None and manager_id not in members:
+            members[-1] = manager_id
+
+    mark = time.perf_counter()
+    limiter = RateLimiter(rate, burst)
+    with stage('league_picks'):
+        # The manager's own picks first, so a failure keeps its upstream status
+        if manager_id is not None:
+            members.remove(manager_id)
+            try:
+                mine = call_with_retry(client.picks, manager_id, bundle.gw, limiter)
+            except FPLAPIError as e:
+                if e.status_code == 404:
+                    raise ManagerNotFound(f"no picks for manager {manager_id} in gameweek {bundle.gw}") from e
+                raise
+        fetched, errors = fetch_managers(members, bundle.gw, client, limiter, with_entry=False)
+    timings['picks'] = time.perf_counter() - mark
+
+    pool = shared.pool
+    picks = {m: fetched[m][1] for m in members if m in fetched}
+    if manager_id is not None:
+        picks[manager_id] = mine
+    managers, matrix, owned = ownership_matrix(picks, pool)
+    me = managers.index(manager_id) if manager_id in picks else None
+    rivals = np.array([i for i in range(len(managers)) if i != me], dtype=np.int64)
+
+    # Ownership among the rivals: effective ownership is the mean multiplier, so a
+    # player everyone captains has an EO of 2
+    field_matrix = matrix[rivals]
+    eo = field_matrix.mean(axis=0) if len(rivals) else np.zeros(len(pool))
+    owned_share = owned[rivals].mean(axis=0) if len(rivals) else np.zeros(len(pool))
+    captained = (field_matrix >= 2).mean(axis=0) if len(rivals) else np.zeros(len(pool))
+    top = np.argsort(-eo)[:TOP_OWNED]
+    ownership = [{'id': int(pool.ids[r]), 'owned': float(owned_share[r]), 'captained': float(captained[r]),
+                  'effective_ownership': float(eo[r])} for r in top if eo[r] > 0]
+
+    analysis = LeagueAnalysis(
+        league_id=league_id, name=league.get('name'), gw=bundle.gw, planning_gw=shared.planning_gw,
+        standings=standings, managers=managers, ownership=ownership, manager_id=manager_id, errors=errors,
+        sampled=sampled,
+        snapshot_version=shared.snapshot_version, model_version=shared.model_version,
+    )
+    ids = set(int(pool.ids[r]) for r in top)
+
+    if me is not None:
+        mark = time.perf_counter()
+        with stage('league_simulation'):
+            mine = matrix[me].astype(float)
+            squad_rows = np.flatnonzero(owned[me])
+            starters = np.flatnonzero(mine > 0)
+            captain = int(np.argmax(mine))
+
+            # Best single swaps on this gameweek's projection; the player coming in takes
+            # the outgoing starter's multiplier
+            gw_points = pool.column('gw_points').astype(float)
+            engine = TransferEngine(pool.subset(np.arange(len(pool)), expected_points=gw_points),
+                                    pool.ids[squad_rows], _bank(picks[manager_id]))
+            gains = engine.gain_matrix(starters)
+            order = np.argsort(-gains, axis=None)[:TRANSFER_CANDIDATES]
+            swaps = [(int(starters[i]), int(j)) for i, j in zip(*np.unravel_index(order, gains.shape))
+                     if np.isfinite(gains[i, j])]
+
+            # Only players someone fields, or might bring in, are simulated
+            fielded = matrix.any(axis=0)
+            fielded[[in_row for _, in_row in swaps]] = True
+            columns = np.flatnonzero(fielded)
+            candidates = [('baseline', mine)]
+            for row in starters:
+                team = mine.copy()
+                if row != captain:
+                    team[row], team[captain] = mine[captain], 1
+                candidates.append(('captain', team))
+            for out_row, in_row in swaps:
+                team = mine.copy()
+                team[in_row], team[out_row] = mine[out_row], 0
+                candidates.append(('transfer', team))
+            teams = np.array([team[columns] for _, team in candidates])
+
+            mean, cv, p_play, clubs = distribution_params(pool.subset(columns))
+            simulator = PointsSimulator(mean, cv, p_play, clubs, seed=seed, chunk_size=min(CHUNK_SIZE, 2_000))
+            base = np.array([totals[managers[i]] for i in rivals], dtype=float)
+            own_total = float(totals[manager_id])
+            field_columns = field_matrix[:, columns].T.astype(float)
+            ahead = np.zeros(len(candidates))
+            wins = np.zeros(len(candidates))
+            for points in simulator.chunks(n_sims):
+                ahead_now = rivals_ahead(base + points @ field_columns, own_total + points @ teams.T)
+                ahead += ahead_now.sum(axis=0)
+                wins += (ahead_now == 0).sum(axis=0)
+            ranks = 1 + ahead / n_sims
+            wins /= n_sims
+        timings['simulation'] = time.perf_counter() - mark
+
+        eo_columns = eo[columns]
+        baseline_rank = ranks[0]
+        analysis.baseline = _option(teams[0], mean, eo_columns, ranks[0], wins[0],
+                                    captain_id=int(pool.ids[captain]))
+        k = 1
+        for row in starters:
+            analysis.captains.append(_option(teams[k], mean, eo_columns, ranks[k], wins[k], baseline_rank,
+                                             id=int(pool.ids[row]), effective_ownership=float(eo[row])))
+            k += 1
+        for out_row, in_row in swaps:
+            analysis.transfers.append(_option(teams[k], mean, eo_columns, ranks[k], wins[k], baseline_rank,
+                                              out_id=int(pool.ids[out_row]), in_id=int(pool.ids[in_row]),
+                                              gain=float(gw_points[in_row] - gw_points[out_row]),
+                                              out_eo=float(eo[out_row]), in_eo=float(eo[in_row])))
+            k += 1
+        analysis.captains.sort(key=lambda o: o['expected_rank'])
+        analysis.transfers.sort(key=lambda o: o['expected_rank'])
+        ids.update(int(pool.ids[r]) for r in squad_rows)
+        ids.update(o['in_id'] for o in analysis.transfers)
+
+    rows = pool.rows_for(sorted(ids))
+    analysis.players = {p['id']: p for p in pool.rows(rows[rows >= 0])}
+    timings['total'] = time.perf_counter() - started
+    analysis.timings = timings
+    return analysis
+
+
+def _bank(picks_data):
+    return ((picks_data or {}).get('entry_history') or {}).get('bank', 0) / 10
+
+
+def main(argv=None):
+    # python -m src.league 314 --manager 123456 --rate 20 --output league.json
+    from src.model_trainer import ModelRegistry
+    parser = argparse.ArgumentParser(description="Ownership, captaincy and transfer differentials in a mini-league")
+    parser.add_argument('league', type=int, help="classic league id")
+    parser.add_argument('--manager', type=int, help="manager whose options are scored against the league")
+    parser.add_argument('--rate', type=float, default=UPSTREAM_RATE, help="upstream requests per second")
+    parser.add_argument('--max-managers', type=int, default=MAX_LEAGUE_MANAGERS)
+    parser.add_argument('--max-picks', type=int, help="fetch picks for only the top N of the standings")
+    parser.add_argument('--simulations', type=int, default=LEAGUE_SIMULATIONS)
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry()
+    registry.load()
+    analysis = analyse_league(args.league, Recommender(registry), args.manager, rate=args.rate,
+                              max_managers=args.max_managers, max_picks=args.max_picks, n_sims=args.simulations)
+    report = league_json(analysis)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    print(f"{len(analysis.managers)} managers in {analysis.timings['total']:.1f}s "
+          f"({len(analysis.errors)} failed)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
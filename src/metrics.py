@@ -0,0 +1,180 @@
+import cProfile
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from cache hits up to a slow upstream or a solver budget
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROFILE_DIR = "profiles"
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[-1] if series else 0
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, n in zip(self.buckets, series):
+                    out.append((self.name + '_bucket', key, (('le', repr(float(bound))),), n))
+                out.append((self.name + '_bucket', key, (('le', '+Inf'),), series[-1]))
+                out.append((self.name + '_sum', key, (), series[-2]))
+                out.append((self.name + '_count', key, (), series[-1]))
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text=''):
+        return self._get_or_create(Counter, name, help_text)
+
+    def histogram(self, name, help_text='', buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key, extra)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram('fpl_stage_seconds', "Wall-clock time spent in each pipeline stage")
+UPSTREAM_SECONDS = registry.histogram('fpl_upstream_request_seconds', "Latency of FPL API requests by endpoint")
+CACHE_REQUESTS = registry.counter('fpl_cache_requests_total', "FPL client cache lookups by result")
+SOLVER_RUNS = registry.counter('fpl_solver_runs_total', "MILP solves by model and outcome")
+TRANSFER_COMBINATIONS = registry.counter('fpl_transfer_combinations_total', "Transfer combinations scored by search size")
+HTTP_REQUESTS = registry.counter('fpl_http_requests_total', "Requests served by the web app")
+HTTP_SECONDS = registry.histogram('fpl_http_request_seconds', "Request latency of the web app")
+
+# scipy.optimize.milp status codes
+SOLVER_OUTCOMES = {0: 'optimal', 1: 'limit', 2: 'infeasible', 3: 'unbounded', 4: 'error'}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@contextmanager
+def stage(name):
+    # with stage('predict'): ... records the block's duration, even if it raises
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+def timed(name):
+    # Decorator form of stage()
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    return registry.render()
+
+
+def start_profile():
+    # Only one profiler can be active per interpreter on recent Pythons; a
+    # concurrent request asking for a profile just runs unprofiled
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        print(f"Profiling unavailable: {e}")
+        return None
+    return profiler
+
+
+def dump_profile(profiler, label, directory=PROFILE_DIR):
+    # Stop the profiler and write a .prof file readable with pstats or snakeviz
+    profiler.disable()
+    os.makedirs(directory, exist_ok=True)
+    safe = ''.join(ch if ch.isalnum() else '_' for ch in label).strip('_') or 'root'
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe}-{os.getpid()}-{threading.get_ident()}.prof")
+    profiler.dump_stats(path)
+    return path
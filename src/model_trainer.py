@@ -1,11 +1,19 @@
 import numpy as np
 
-# Wrapper class for model training and evaluation to support tests/test_model_trainer.py
+# Wrapper class for model training and evaluation to support tests/test_model_trainer.py.
+# Given a gameweek_training_frame it holds out the latest gameweeks; without one it
+# falls back to random data.
 class ModelTrainer:
-    def __init__(self):
+    def __init__(self, dataset=None):
         self.model = None
+        self.dataset = dataset
 
     def prepare_data(self, test=False):
+        if self.dataset is not None:
+            gws = np.sort(self.dataset['gw'].unique())
+            cutoff = gws[int(len(gws) * 0.8)] if len(gws) > 1 else gws[-1] + 1
+            part = self.dataset[(self.dataset['gw'] >= cutoff) if test else (self.dataset['gw'] < cutoff)]
+            return part[MODEL_FEATURES], part['target']
         # Generate dummy data for testing
         np.random.seed(42)
         X = np.random.rand(100, 5)
@@ -16,19 +24,148 @@ class ModelTrainer:
             return X[:80], y[:80]
 
     def train_model(self, X, y):
-        from xgboost import XGBRegressor
-        self.model = XGBRegressor()
+        self.model = XGBRegressor(**dict(BASE_PARAMS, n_estimators=200))
         self.model.fit(X, y)
         return self.model
 
     def evaluate_model(self, model, X, y):
-        from sklearn.metrics import accuracy_score
+        # R^2, since this is a regression model
         preds = model.predict(X)
-        return accuracy_score(y, preds)
+        return r2_score(y, preds)
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
 import pandas as pd
 from xgboost import XGBRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split, ParameterSampler
+from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
+
+from src.data_processor import MODEL_FEATURES
+
+MODEL_DIR = "models"
+LEGACY_MODEL_FILE = "model.xgb"
+# Features the original model.xgb was fitted on (the numeric columns of prepare_dataset)
+DEFAULT_FEATURES = ['team', 'price', 'home_games', 'home_goals', 'away_games', 'away_goals']
+
+# What a model predicts: season total points (the original model) or points in a single
+# fixture (the gameweek pipeline below). The recommender scales predictions accordingly.
+TARGET_SEASON = 'season_points'
+TARGET_GAMEWEEK = 'gw_points'
+
+# Gameweek pipeline: histogram trees with early stopping on each validation fold, and a
+# random search over SEARCH_SPACE
+BASE_PARAMS = {'tree_method': 'hist', 'objective': 'reg:squarederror', 'random_state': 42}
+MAX_ESTIMATORS = 2000
+EARLY_STOPPING_ROUNDS = 50
+SEARCH_SPACE = {
+    'learning_rate': [0.01, 0.02, 0.05, 0.1],
+    'max_depth': [3, 4, 5, 6, 8],
+    'min_child_weight': [1, 3, 5, 10],
+    'subsample': [0.6, 0.8, 1.0],
+    'colsample_bytree': [0.6, 0.8, 1.0],
+    'reg_lambda': [0.1, 1.0, 5.0, 10.0],
+    'max_bin': [64, 128, 256],
+}
+SEARCH_CANDIDATES = 24
+CV_FOLDS = 4
+MIN_TRAIN_GWS = 4
+
+def time_series_folds(gws, n_folds=CV_FOLDS, min_train_gws=MIN_TRAIN_GWS):
+    # Expanding-window folds over gameweeks: each fold trains on every gameweek before
+    # its validation block, so no fold ever sees the future. Returns a list of
+    # (train row indices, validation row indices).
+    gws = np.asarray(gws)
+    unique = np.unique(gws)
+    if len(unique) < min_train_gws + 1:
+        raise ValueError(f"need at least {min_train_gws + 1} gameweeks of history, got {len(unique)}")
+    n_folds = min(n_folds, len(unique) - min_train_gws)
+    block = (len(unique) - min_train_gws) // n_folds
+    folds = []
+    for i in range(n_folds):
+        start = min_train_gws + i * block
+        stop = len(unique) if i == n_folds - 1 else start + block
+        train = np.flatnonzero(gws < unique[start])
+        valid = np.flatnonzero((gws >= unique[start]) & (gws <= unique[stop - 1]))
+        folds.append((train, valid))
+    return folds
+
+
+# Worker-process state: the training matrix and folds are sent once per worker by the
+# pool initializer instead of being pickled into every candidate
+_worker_data = None
+
+
+def _init_worker(X, y, folds):
+    global _worker_data
+    _worker_data = (X, y, folds)
+
+
+def evaluate_params(params, X, y, folds, n_jobs=1):
+    # Cross-validated scores for one parameter set. Every fold stops early on its own
+    # validation block; the best iterations size the final refit.
+    scores = {'rmse': [], 'mae': [], 'r2': [], 'best_iteration': []}
+    for train, valid in folds:
+        model = XGBRegressor(**BASE_PARAMS, **params, n_estimators=MAX_ESTIMATORS,
+                             early_stopping_rounds=EARLY_STOPPING_ROUNDS, n_jobs=n_jobs)
+        model.fit(X[train], y[train], eval_set=[(X[valid], y[valid])], verbose=False)
+        preds = model.predict(X[valid])
+        scores['rmse'].append(float(np.sqrt(mean_squared_error(y[valid], preds))))
+        scores['mae'].append(float(mean_absolute_error(y[valid], preds)))
+        scores['r2'].append(float(r2_score(y[valid], preds)))
+        scores['best_iteration'].append(int(model.best_iteration))
+    return params, scores
+
+
+def _evaluate_in_worker(params, n_jobs):
+    return evaluate_params(params, *_worker_data, n_jobs=n_jobs)
+
+
+def search_params(X, y, folds, candidates=SEARCH_CANDIDATES, processes=None, n_jobs=1, seed=42):
+    # Random search over SEARCH_SPACE, one candidate per task on a process pool. Each
+    # worker's XGBoost uses n_jobs threads, so processes * n_jobs should not exceed the
+    # core count; by default processes fills the cores left after n_jobs.
+    sampled = list(ParameterSampler(SEARCH_SPACE, n_iter=candidates, random_state=seed))
+    processes = processes or max(1, (os.cpu_count() or 1) // max(n_jobs, 1))
+    if processes <= 1 or len(sampled) <= 1:
+        results = [evaluate_params(p, X, y, folds, n_jobs) for p in sampled]
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(sampled)), initializer=_init_worker,
+                                 initargs=(X, y, folds)) as pool:
+            results = list(pool.map(_evaluate_in_worker, sampled, [n_jobs] * len(sampled)))
+    # Lowest mean validation RMSE first
+    return sorted(results, key=lambda r: np.mean(r[1]['rmse']))
+
+
+def train_gameweek_model(dataset, candidates=SEARCH_CANDIDATES, processes=None, n_jobs=1,
+                         n_folds=CV_FOLDS, seed=42, features=MODEL_FEATURES):
+    # Time-ordered CV + random search, then a refit of the best parameters on every
+    # gameweek with the mean early-stopped tree count (on every core, since it runs
+    # alone). Returns (model, params, metrics).
+    X = dataset[features].to_numpy(dtype='float32')
+    y = dataset['target'].to_numpy(dtype='float32')
+    folds = time_series_folds(dataset['gw'].to_numpy(), n_folds)
+    results = search_params(X, y, folds, candidates, processes, n_jobs, seed)
+    params, scores = results[0]
+    n_estimators = max(1, int(np.mean(scores['best_iteration'])) + 1)
+    model = XGBRegressor(**BASE_PARAMS, **params, n_estimators=n_estimators)
+    model.fit(dataset[features].astype('float32'), y)
+    metrics = {
+        'cv_rmse': float(np.mean(scores['rmse'])),
+        'cv_mae': float(np.mean(scores['mae'])),
+        'cv_r2': float(np.mean(scores['r2'])),
+        'folds': [{'train_rows': int(len(t)), 'valid_rows': int(len(v)), 'rmse': r}
+                  for (t, v), r in zip(folds, scores['rmse'])],
+        'candidates': len(results),
+        'runner_up_rmse': float(np.mean(results[1][1]['rmse'])) if len(results) > 1 else None,
+    }
+    return model, dict(params, n_estimators=n_estimators), metrics
+
 
 def train_model(data):
     X = data.drop('target', axis=1)
@@ -50,4 +187,191 @@ def save_model(model, filename):
 def load_model(filename):
     model = XGBRegressor()
     model.load_model(filename)
-    return model
\ No newline at end of file
+    return model
+
+
+@dataclass
+class ModelInfo:
+    version: str
+    feature_cols: list
+    path: str
+    metrics: dict = None
+    created_at: float = None
+    target: str = TARGET_SEASON
+
+
+def feature_schema(frame, feature_cols):
+    # Column name and dtype the model was fitted on, recorded next to the artifact
+    return [{'name': c, 'dtype': str(frame[c].dtype)} for c in feature_cols]
+
+
+def new_version():
+    # Creation time, so versions sort in order, plus microseconds and a random tail so
+    # two runs saving in the same second do not overwrite each other
+    now = time.time()
+    return f"{time.strftime('%Y%m%d%H%M%S', time.localtime(now))}-{int(now % 1 * 1e6):06d}-{uuid.uuid4().hex[:6]}"
+
+
+def _temp_path(model_dir, suffix):
+    # A name no other writer uses, next to the target so os.replace onto it is atomic
+    return os.path.join(model_dir, f".model-{uuid.uuid4().hex}.tmp{suffix}")
+
+
+def save_versioned_model(model, feature_cols, metrics=None, model_dir=MODEL_DIR, version=None,
+                         target=TARGET_SEASON, extra=None):
+    # Artifacts are model-<version>.ubj plus model-<version>.meta.json. Both are written
+    # to temporary files and renamed into place, the metadata last, so a registry never
+    # sees a half-written model. `extra` adds fields to the metadata (parameters,
+    # feature schema, training data).
+    os.makedirs(model_dir, exist_ok=True)
+    version = version or new_version()
+    model_path = os.path.join(model_dir, f"model-{version}.ubj")
+    meta_path = os.path.join(model_dir, f"model-{version}.meta.json")
+    tmp_model = _temp_path(model_dir, '.ubj')
+    try:
+        model.save_model(tmp_model)
+        os.replace(tmp_model, model_path)
+    finally:
+        if os.path.exists(tmp_model):
+            os.remove(tmp_model)
+    meta = {
+        'version': version,
+        'feature_cols': list(feature_cols),
+        'metrics': metrics or {},
+        'created_at': time.time(),
+        'target': target,
+        **(extra or {}),
+    }
+    tmp_meta = _temp_path(model_dir, '.json')
+    try:
+        with open(tmp_meta, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_meta, meta_path)
+    finally:
+        if os.path.exists(tmp_meta):
+            os.remove(tmp_meta)
+    return ModelInfo(version, list(feature_cols), model_path, meta['metrics'], meta['created_at'], target)
+
+
+def latest_model_info(model_dir=MODEL_DIR):
+    if not os.path.isdir(model_dir):
+        return None
+    metas = sorted(f for f in os.listdir(model_dir) if f.startswith("model-") and f.endswith(".meta.json"))
+    if not metas:
+        return None
+    with open(os.path.join(model_dir, metas[-1])) as f:
+        meta = json.load(f)
+    path = os.path.join(model_dir, f"model-{meta['version']}.ubj")
+    return ModelInfo(meta['version'], meta['feature_cols'], path, meta.get('metrics'), meta.get('created_at'),
+                     meta.get('target', TARGET_SEASON))
+
+
+class ModelRegistry:
+    # Keeps one model resident for the life of the process. New versioned artifacts
+    # are picked up on read (at most every poll_interval seconds), loaded off to the
+    # side and swapped in with a single reference assignment.
+    def __init__(self, model_dir=MODEL_DIR, legacy_path=LEGACY_MODEL_FILE, poll_interval=60):
+        self.model_dir = model_dir
+        self.legacy_path = legacy_path
+        self.poll_interval = poll_interval
+        self._current = (None, None)
+        self._last_check = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        self.refresh(force=True)
+        return self._current
+
+    def refresh(self, force=False):
+        now = time.time()
+        if not force and now - self._last_check < self.poll_interval:
+            return False
+        if not self._lock.acquire(blocking=False):
+            return False   # another thread is already checking
+        try:
+            self._last_check = now
+            info = latest_model_info(self.model_dir)
+            if info is None and self._current[0] is None and os.path.exists(self.legacy_path):
+                info = ModelInfo('legacy', list(DEFAULT_FEATURES), self.legacy_path)
+            if info is None or (self._current[1] is not None and self._current[1].version == info.version):
+                return False
+            try:
+                model = load_model(info.path)
+            except Exception as e:
+                print(f"Failed to load model {info.path}: {e}")
+                return False
+            self._current = (model, info)
+            return True
+        finally:
+            self._lock.release()
+
+    def current(self):
+        self.refresh()
+        return self._current
+
+    @property
+    def info(self):
+        return self._current[1]
+
+    @property
+    def version(self):
+        info = self._current[1]
+        return info.version if info else None
+
+
+def train_and_save(model_dir=MODEL_DIR):
+    # The original season-points model: python -m src.model_trainer --legacy
+    from src.data_fetcher import fetch_player_data, fetch_fixtures
+    from src.data_processor import build_player_frame
+    df = build_player_frame(fetch_player_data(), fetch_fixtures())
+    df['target'] = df['total_points']
+    model, accuracy = train_model(df[DEFAULT_FEATURES + ['target']])
+    info = save_versioned_model(model, DEFAULT_FEATURES, {'r2': float(accuracy)}, model_dir)
+    print(f"Saved model version {info.version} to {info.path} (r2={accuracy:.3f})")
+    return info
+
+
+def train_gameweek_and_save(model_dir=MODEL_DIR, candidates=SEARCH_CANDIDATES, processes=None, n_jobs=1,
+                            n_folds=CV_FOLDS, store=None):
+    # Out-of-band training job: python -m src.model_trainer. Brings the feature store up
+    # to the last finished gameweek, searches parameters under time-ordered CV and
+    # saves a versioned model.
+    from src.feature_store import FeatureStore
+    store = store or FeatureStore()
+    store.update()
+    dataset = store.training_frame()
+    started = time.perf_counter()
+    model, params, metrics = train_gameweek_model(dataset, candidates, processes, n_jobs, n_folds)
+    metrics['train_seconds'] = round(time.perf_counter() - started, 1)
+    extra = {
+        'params': params,
+        'feature_schema': feature_schema(dataset, MODEL_FEATURES),
+        'feature_store': {'path': store.path, 'last_gw': store.last_gw},
+        'training_rows': int(len(dataset)),
+        'gameweeks': [int(dataset['gw'].min()), int(dataset['gw'].max())],
+    }
+    info = save_versioned_model(model, MODEL_FEATURES, metrics, model_dir, target=TARGET_GAMEWEEK, extra=extra)
+    print(f"Saved model version {info.version} to {info.path} "
+          f"(cv rmse={metrics['cv_rmse']:.3f}, r2={metrics['cv_r2']:.3f}, {metrics['train_seconds']}s)")
+    return info
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and save a versioned points model")
+    parser.add_argument('--candidates', type=int, default=SEARCH_CANDIDATES, help="parameter sets to try")
+    parser.add_argument('--processes', type=int, default=None, help="search worker processes (default: cores / n-jobs)")
+    parser.add_argument('--n-jobs', type=int, default=1, help="XGBoost threads per worker")
+    parser.add_argument('--folds', type=int, default=CV_FOLDS)
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--feature-dir', default=None, help="feature store location (default: features/)")
+    parser.add_argument('--legacy', action='store_true', help="train the old season-points model instead")
+    args = parser.parse_args(argv)
+    if args.legacy:
+        return train_and_save(args.model_dir)
+    from src.feature_store import FeatureStore
+    store = FeatureStore(args.feature_dir) if args.feature_dir else None
+    return train_gameweek_and_save(args.model_dir, args.candidates, args.processes, args.n_jobs, args.folds, store)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+POSITIONS = ['GKP', 'DEF', 'MID', 'FWD']
+POSITION_CODES = {pos: code for code, pos in enumerate(POSITIONS)}
+# The columns the solvers read; every pool has them
+CORE_COLUMNS = ('id', 'team', 'position', 'cost', 'expected_points')
+
+
+class PlayerRow(Mapping):
+    # Read-only view of one pool row, for templates and the JSON views. Values come
+    # straight from the pool's columns, so a view costs two slots instead of a dict of
+    # every column. Views compare by (pool, row), not field by field.
+    __slots__ = ('pool', 'row')
+
+    def __init__(self, pool, row):
+        self.pool = pool
+        self.row = row
+
+    def __getitem__(self, name):
+        value = self.pool.columns[name][self.row]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __iter__(self):
+        return iter(self.pool.columns)
+
+    def __len__(self):
+        return len(self.pool.columns)
+
+    def __contains__(self, name):
+        return name in self.pool.columns
+
+    def __eq__(self, other):
+        if isinstance(other, PlayerRow):
+            return self.pool is other.pool and self.row == other.row
+        return Mapping.__eq__(self, other)
+
+    def __hash__(self):
+        return hash((id(self.pool), self.row))
+
+    def __repr__(self):
+        return f"PlayerRow({dict(self)!r})"
+
+    def __reduce__(self):
+        # Pickled as a plain dict, so a row sent to another process does not take the
+        # whole pool with it
+        return dict, (dict(self),)
+
+
+class PlayerPool:
+    # The player pool as NumPy columns, one row per player. The columns every solver
+    # reads are typed once here:
+    #   ids, clubs (team id), club_index (0..n_clubs-1), position_codes (POSITIONS
+    #   order, -1 for unknown), costs, points (expected_points)
+    # along with an id -> row lookup and per-position / per-club masks. Every other
+    # column (names, news, gw_points...) is kept as-is for display.
+    def __init__(self, columns):
+        self.columns = {name: np.asarray(values) for name, values in columns.items()}
+        self.ids = self.columns['id'].astype(np.int64, copy=False)
+        self.clubs = self.columns['team'].astype(np.int64, copy=False)
+        self.costs = self.columns['cost'].astype(float, copy=False)
+        self.points = self.columns['expected_points'].astype(float, copy=False)
+        positions = self.columns['position'].astype(str)
+        self.position_codes = np.full(len(self.ids), -1, dtype=np.int8)
+        for pos, code in POSITION_CODES.items():
+            self.position_codes[positions == pos] = code
+        self.club_ids, self.club_index = np.unique(self.clubs, return_inverse=True)
+        self.position_masks = self.position_codes[None, :] == np.arange(len(POSITIONS))[:, None]
+        self.club_masks = self.club_index[None, :] == np.arange(len(self.club_ids))[:, None]
+        self._row_by_id = np.full(int(self.ids.max()) + 1 if len(self.ids) else 0, -1, dtype=np.int64)
+        self._row_by_id[self.ids] = np.arange(len(self.ids))
+
+    @classmethod
+    def from_frame(cls, frame):
+        # Columns are taken without copying; a frame rebuilt later never writes into them
+        return cls({name: frame[name].to_numpy() for name in frame.columns})
+
+    @classmethod
+    def from_records(cls, players):
+        names = list(dict.fromkeys(k for p in players for k in p))
+        return cls({name: np.array([p.get(name) for p in players]) for name in names})
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def column(self, name):
+        return self.columns[name]
+
+    def rows_for(self, ids):
+        # Pool rows of the given player ids, -1 for ids not in the pool
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        known = (ids >= 0) & (ids < len(self._row_by_id))
+        rows[known] = self._row_by_id[ids[known]]
+        return rows
+
+    def row(self, r):
+        return PlayerRow(self, int(r))
+
+    def rows(self, rows):
+        return [PlayerRow(self, int(r)) for r in rows]
+
+    def position_mask(self, position):
+        code = POSITION_CODES.get(position)
+        return self.position_masks[code] if code is not None else np.zeros(len(self), dtype=bool)
+
+    def core(self):
+        # The same rows with only CORE_COLUMNS, e.g. to ship to worker processes
+        return PlayerPool({name: self.columns[name] for name in CORE_COLUMNS})
+
+    def subset(self, rows, **overrides):
+        # A smaller pool over the given rows, with any column replaced by `overrides`
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = {name: values[rows] for name, values in self.columns.items()}
+        columns.update({name: np.asarray(values) for name, values in overrides.items()})
+        return PlayerPool(columns)
+
+
+def as_pool(player_data):
+    # A PlayerPool from a pool, a player frame or a list of player dicts
+    if isinstance(player_data, PlayerPool):
+        return player_data
+    if hasattr(player_data, 'iloc'):
+        return PlayerPool.from_frame(player_data)
+    return PlayerPool.from_records(player_data)
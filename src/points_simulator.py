@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.data_processor import column_values
+
+# Coefficient of variation of a player's points, given that the player features.
+# Attackers are streakier than keepers and defenders.
+POSITION_CV = {'GKP': 0.6, 'DEF': 0.8, 'MID': 1.0, 'FWD': 1.1}
+TEAM_CORRELATION = 0.3    # share of variance that is common to team-mates
+HAUL_THRESHOLD = 10
+DEFAULT_SIMULATIONS = 100_000
+CHUNK_SIZE = 20_000       # simulations drawn at once; bounds memory at CHUNK_SIZE x players
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+@dataclass
+class SimulationResult:
+    ids: list
+    mean_points: np.ndarray
+    captain_ev: np.ndarray
+    haul_probability: np.ndarray
+    squad_quantiles: dict
+    squad_mean: float
+    n_sims: int
+
+    def ranked_captains(self, top_n=5):
+        order = np.argsort(-self.captain_ev)[:top_n]
+        return [{'id': self.ids[i], 'captain_ev': float(self.captain_ev[i]),
+                 'haul_probability': float(self.haul_probability[i])} for i in order]
+
+
+def distribution_params(players, points_column='gw_points'):
+    # Per-player parameters from the model's per-gameweek expectation (which already
+    # carries the fixture difficulty), the player's position and availability
+    mean = column_values(players, points_column).astype(float)
+    positions = column_values(players, 'position').astype(str)
+    cv = np.array([POSITION_CV.get(p, 1.0) for p in positions])
+    chance = column_values(players, 'chance_of_playing_next_round').astype(float)
+    p_play = np.clip(np.nan_to_num(chance, nan=100.0) / 100.0, 0.0, 1.0)
+    teams = column_values(players, 'team').astype(np.int64)
+    return mean, cv, p_play, teams
+
+
+class PointsSimulator:
+    # Gameweek points as a lognormal per player, zeroed when the player does not feature.
+    # A Gaussian team factor correlates team-mates, so stacks swing together.
+    def __init__(self, mean, cv, p_play, teams, team_correlation=TEAM_CORRELATION, seed=42, chunk_size=CHUNK_SIZE):
+        self.p_play = np.asarray(p_play, dtype=float)
+        mean = np.maximum(np.asarray(mean, dtype=float), 1e-6)
+        # Expected points include the chance of not playing, so scale up the conditional mean
+        conditional = mean / np.maximum(self.p_play, 1e-6)
+        self.sigma = np.sqrt(np.log1p(np.asarray(cv, dtype=float) ** 2))
+        self.mu = np.log(conditional) - self.sigma ** 2 / 2
+        self.team_index = np.unique(np.asarray(teams), return_inverse=True)[1]
+        self.n_teams = int(self.team_index.max()) + 1 if len(self.team_index) else 0
+        self.rho = team_correlation
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+    def _draw(self, rng, n):
+        team_z = rng.standard_normal((n, self.n_teams))[:, self.team_index]
+        z = np.sqrt(self.rho) * team_z + np.sqrt(1 - self.rho) * rng.standard_normal((n, len(self.mu)))
+        points = np.exp(self.mu + self.sigma * z)
+        points *= rng.random((n, len(self.mu))) < self.p_play
+        return points
+
+    def chunks(self, n_sims):
+        # [size, players] draws, chunk by chunk. One child seed per chunk keeps results
+        # reproducible for a given seed and chunk size.
+        seeds = np.random.SeedSequence(self.seed).spawn((n_sims + self.chunk_size - 1) // self.chunk_size)
+        done = 0
+        for seq in seeds:
+            size = min(self.chunk_size, n_sims - done)
+            yield self._draw(np.random.default_rng(seq), size)
+            done += size
+
+    def simulate(self, ids, n_sims=DEFAULT_SIMULATIONS, starters=None, captain=None,
+                 haul_threshold=HAUL_THRESHOLD, quantiles=QUANTILES):
+        # starters: row positions counted in the squad score (default all players).
+        # captain: row position doubled in the squad score (default best starter).
+        n = len(self.mu)
+        starters = np.arange(n) if starters is None else np.asarray(starters)
+        totals = np.zeros(n)
+        hauls = np.zeros(n)
+        squad = np.empty(n_sims)
+        if captain is None:
+            expected = np.exp(self.mu + self.sigma ** 2 / 2) * self.p_play
+            captain = int(starters[np.argmax(expected[starters])])
+        done = 0
+        for points in self.chunks(n_sims):
+            size = len(points)
+            totals += points.sum(axis=0)
+            hauls += (points >= haul_threshold).sum(axis=0)
+            squad[done:done + size] = points[:, starters].sum(axis=1) + points[:, captain]
+            done += size
+
+        mean_points = totals / n_sims
+        return SimulationResult(
+            ids=list(ids),
+            mean_points=mean_points,
+            captain_ev=2 * mean_points,
+            haul_probability=hauls / n_sims,
+            squad_quantiles={q: float(v) for q, v in zip(quantiles, np.quantile(squad, quantiles))},
+            squad_mean=float(squad.mean()),
+            n_sims=n_sims,
+        )
+
+
+def simulate_team(players, starters=None, captain=None, n_sims=DEFAULT_SIMULATIONS, seed=42, chunk_size=CHUNK_SIZE):
+    # Convenience wrapper over a list of player dicts (or a frame slice)
+    mean, cv, p_play, teams = distribution_params(players)
+    simulator = PointsSimulator(mean, cv, p_play, teams, seed=seed, chunk_size=chunk_size)
+    ids = column_values(players, 'id').tolist()
+    row = {pid: i for i, pid in enumerate(ids)}
+    starter_rows = [row[p['id']] for p in starters] if starters is not None else None
+    captain_row = row[captain['id']] if captain is not None else None
+    return simulator.simulate(ids, n_sims=n_sims, starters=starter_rows, captain=captain_row)
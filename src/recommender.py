@@ -0,0 +1,762 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from src.data_fetcher import fetch_bundle, get_client, call_with_retry
+from src.data_processor import (build_player_frame, update_player_frame, fixture_matrix_for,
+                                fixture_adjustment, ROLLING_FEATURES)
+from src.feature_store import FeatureStore, FeatureStoreError
+from src.player_pool import PlayerPool
+from src.chip_evaluator import evaluate_chips, available_chips, CHIP_LABELS
+from src.metrics import registry as metrics_registry, stage, SOLVER_RUNS
+from src.model_trainer import TARGET_GAMEWEEK
+from src.points_simulator import simulate_team
+from src.snapshot_diff import diff_snapshots, changed_rows, squad_affected
+from src.team_optimizer import TeamOptimizer, best_lineup, POSITIONS
+from src.transfer_engine import TransferEngine
+from src.transfer_planner import TransferPlanner, gameweek_points
+
+SOLVER_TIME_LIMIT = 5.0  # seconds
+SOLVER_MIP_GAP = 0.001
+# Seconds of wall-clock per plan. On a 700-player pool this rarely proves optimality:
+# a 5-week plan ends about 1-5% from the solver's bound, an 8-week one 3-5%, so
+# plans report the gap they reached.
+PLANNER_TIME_BUDGET = 2.0
+PLANNER_MIP_GAP = 0.01
+RESPONSE_CACHE_SIZE = 512   # recommendations kept per process
+POOL_CACHE_SIZE = 4         # predicted player pools (one per snapshot/model pair)
+
+# Everything a caller can vary. Part of the cache key, so it must stay hashable.
+Options = namedtuple('Options', ['budget', 'max_transfers', 'top_k', 'horizon', 'simulations'])
+DEFAULT_OPTIONS = Options(budget=100.0, max_transfers=2, top_k=5, horizon=5, simulations=100_000)
+
+CACHE_REQUESTS = metrics_registry.counter('fpl_recommendation_cache_total', "Recommendation cache lookups by cache and result")
+
+
+class ManagerNotFound(LookupError):
+    # No picks upstream for the manager id: unknown, or no team entered yet
+    pass
+
+
+class LRUCache:
+    # Bounded, thread-safe mapping that evicts the least recently used entry
+    def __init__(self, maxsize, name='cache'):
+        self.maxsize = maxsize
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, record=True):
+        # record=False for the re-check under a single-flight lock, so a miss counts once
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                if record:
+                    CACHE_REQUESTS.inc(cache=self.name, result='hit')
+                return self._data[key]
+        if record:
+            CACHE_REQUESTS.inc(cache=self.name, result='miss')
+        return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def purge(self, predicate):
+        # Drop every entry whose key matches; returns how many were dropped
+        with self._lock:
+            stale = [k for k in self._data if predicate(k)]
+            for k in stale:
+                del self._data[k]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+@dataclass
+class Recommendation:
+    manager_id: int
+    options: Options
+    snapshot_version: str
+    model_version: str
+    gw: int
+    planning_gw: int
+    selection: object              # SquadSelection built from scratch under the budget
+    squad: list                    # selection.squad ordered GKP, DEF, MID, FWD
+    fpl_info: dict = None
+    current_team: list = field(default_factory=list)
+    transfer: dict = None
+    plan: object = None
+    simulation: object = None
+    captain: dict = None
+    vice_captain: dict = None
+    captaincy: list = field(default_factory=list)
+    computed_at: float = 0.0
+
+
+@dataclass
+class SharedState:
+    snapshot_version: str
+    model_version: str
+    gw: int
+    planning_gw: int
+    pool: object                   # predicted PlayerPool
+    fixtures: list
+    selection: object              # from-scratch SquadSelection
+    squad: list                    # selection.squad ordered GKP, DEF, MID, FWD
+
+
+@lru_cache(maxsize=4096)
+def _days_out(news, today):
+    # News text rarely changes between snapshots, so the regex and date parse run
+    # once per distinct (news, day) rather than per player per request
+    date_match = re.search(r'(\d{1,2} [A-Za-z]{3})', news)
+    if not date_match:
+        return 0
+    try:
+        return_date = datetime.strptime(date_match.group(1) + f" {today.year}", "%d %b %Y").date()
+    except ValueError:
+        return 0
+    return (return_date - today).days
+
+
+def get_injury_severity(player):
+    chance = player.get('chance_of_playing_next_round', 100)
+    days_out = _days_out((player.get('news', '') or '').lower(), date.today())
+    return (100 - (chance if chance is not None else 100)) + days_out
+
+
+def is_injured(player):
+    news = player.get('news', '') or ''
+    return player.get('chance_of_playing_next_round', 100) < 100 or 'injur' in news.lower()
+
+
+def captaincy_table(simulation, players, top_n=5):
+    if simulation is None:
+        return []
+    by_id = {p['id']: p for p in players}
+    rows = []
+    for entry in simulation.ranked_captains(top_n):
+        player = by_id.get(entry['id'])
+        if player:
+            rows.append(dict(entry, web_name=player.get('web_name', '')))
+    return rows
+
+
+def fpl_info_from(entry_info, gw):
+    if not entry_info:
+        return None
+    return {
+        'player_name': f"{entry_info.get('player_first_name', '')} {entry_info.get('player_last_name', '')}",
+        'team_name': entry_info.get('name', ''),
+        'overall_points': entry_info.get('summary_overall_points', ''),
+        'overall_rank': entry_info.get('summary_overall_rank', ''),
+        'value': entry_info.get('last_deadline_value', ''),
+        'bank': entry_info.get('last_deadline_bank', ''),
+        'total_transfers': entry_info.get('summary_transfers', ''),
+        'gameweek': gw
+    }
+
+
+class Recommender:
+    # Runs fetch -> predict -> optimize and caches the results. The predicted pool and
+    # the from-scratch squad are shared by every manager; per-manager recommendations
+    # are keyed by (snapshot version, model version, manager id, options). The snapshot
+    # version is its content_version, so ownership ticks do not flush the cache, and a
+    # new one purges everything built from the old.
+    def __init__(self, model_registry, client=None, cache_size=RESPONSE_CACHE_SIZE, feature_store=None):
+        self.model_registry = model_registry
+        self.feature_store = feature_store or FeatureStore()
+        self._client = client
+        self.responses = LRUCache(cache_size, 'response')
+        self.pools = LRUCache(POOL_CACHE_SIZE, 'pool')
+        self.squads = LRUCache(cache_size, 'squad')
+        self.chip_plans = LRUCache(cache_size, 'chips')
+        self._snapshot_version = None
+        self._previous_plans = {}   # manager id -> last plan, used to warm-start the next solve
+        self._recent_managers = OrderedDict()   # manager id -> options, most recent last
+        # Incremental state: the last pool built, how the current pool was derived from
+        # it (prev key, key, prev frame, changed rows) and the last squad per budget.
+        # _lineage and _last_selection are read and written only under _lineage_lock.
+        self._last_pool = None
+        self._lineage = None
+        self._last_selection = {}
+        self._lineage_lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self._squad_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._key_locks = {}   # key -> [lock, holders and waiters], only while a request is in flight
+        self._locks_lock = threading.Lock()
+
+    @property
+    def client(self):
+        return self._client or get_client()
+
+    def _model_version(self, model_info):
+        # Models reading rolling features are versioned together with the feature store's
+        # last gameweek, so ingesting a gameweek re-predicts like a new model would
+        if model_info is None:
+            return None
+        if set(ROLLING_FEATURES) & set(model_info.feature_cols):
+            return f"{model_info.version}+gw{self.feature_store.last_gw}"
+        return model_info.version
+
+    @property
+    def model_version(self):
+        return self._model_version(self.model_registry.info)
+
+    @property
+    def snapshot_version(self):
+        # Content version of the last snapshot seen, None before the first fetch
+        return self._snapshot_version
+
+    @contextmanager
+    def _single_flight(self, key):
+        # Hold the lock for `key`; it is dropped once no request holds or waits on it
+        with self._locks_lock:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = self._key_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def _observe_snapshot(self, version):
+        with self._snapshot_lock:
+            if version == self._snapshot_version:
+                return
+            previous, self._snapshot_version = self._snapshot_version, version
+            if previous is None:
+                return
+            stale = lambda key: key[0] == previous
+            dropped = (self.responses.purge(stale) + self.pools.purge(stale) + self.squads.purge(stale)
+                       + self.chip_plans.purge(stale))
+        print(f"Snapshot changed ({previous} -> {version}); dropped {dropped} cached results")
+
+    def invalidate(self):
+        self.responses.clear()
+        self.pools.clear()
+        self.squads.clear()
+        self.chip_plans.clear()
+
+    def player_pool(self, bundle):
+        # PlayerPool with predictions for the planning gameweek, shared by all managers.
+        # Returns ((snapshot version, model version), pool). The frame it was built from
+        # is kept only for the last pool, as the base of the next incremental update.
+        snapshot = bundle.snapshot
+        model, model_info = self.model_registry.current()
+        key = (snapshot.content_version, self._model_version(model_info))
+        pool = self.pools.get(key)
+        if pool is not None:
+            return key, pool
+        # One builder at a time: the incremental path reads and replaces _last_pool
+        with self._pool_lock:
+            pool = self.pools.get(key, record=False)
+            if pool is not None:
+                return key, pool
+            planning_gw = snapshot.next_gw or bundle.gw
+            frame, lineage = self._update_pool(key, bundle, planning_gw, model, model_info)
+            if frame is None:
+                with stage('build_player_frame'):
+                    frame = build_player_frame(snapshot.elements, bundle.fixtures, snapshot.teams, gw=planning_gw)
+                self._predict(frame, None, bundle.fixtures, planning_gw, model, model_info)
+            with self._lineage_lock:
+                self._lineage = lineage
+            self._last_pool = (key, snapshot, bundle.fixtures, planning_gw, frame)
+            pool = PlayerPool.from_frame(frame)
+            self.pools.put(key, pool)
+            return key, pool
+
+    def _update_pool(self, key, bundle, planning_gw, model, model_info):
+        # Incremental path: same model, fixtures and gameweek as the last pool and only
+        # row-level changes in the snapshot, so only the changed rows are rebuilt and
+        # re-predicted. Returns (frame, lineage), or (None, None) when a full build is needed.
+        if self._last_pool is None:
+            return None, None
+        prev_key, prev_snapshot, prev_fixtures, prev_gw, prev_frame = self._last_pool
+        if prev_key[1] != key[1] or prev_gw != planning_gw:
+            return None, None
+        if prev_fixtures is not bundle.fixtures and prev_fixtures != bundle.fixtures:
+            return None, None
+        diff = diff_snapshots(prev_snapshot, bundle.snapshot)
+        if diff.structural:
+            return None, None
+        rows = changed_rows(prev_frame, diff)
+        with stage('update_player_frame'):
+            frame = update_player_frame(prev_frame, bundle.snapshot.elements, rows, bundle.fixtures,
+                                        bundle.snapshot.teams, gw=planning_gw)
+        self._predict(frame, rows, bundle.fixtures, planning_gw, model, model_info)
+        print(f"Snapshot diff: {len(rows)} changed players, pool updated in place of a rebuild")
+        return frame, (prev_key, key, prev_frame, rows)
+
+    def _predict(self, frame, rows, fixtures, planning_gw, model, model_info):
+        # Fill expected_points and gw_points, for every row or only for `rows`
+        subset = frame if rows is None else frame.iloc[rows]
+        if len(subset) == 0:
+            return
+        preds = None
+        if model is not None:
+            try:
+                with stage('predict'):
+                    preds = model.predict(self._model_input(subset, model_info.feature_cols))
+            except Exception as e:
+                print(f"Prediction with model {model_info.version} failed: {e}")
+        if preds is not None and model_info.target == TARGET_GAMEWEEK:
+            # Points in the planned fixture: strip its difficulty and scale up to the
+            # season-total convention expected_points has everywhere else, which
+            # gameweek_points divides back out
+            per_game = np.asarray(preds, dtype='float64') / fixture_adjustment(subset['difficulty'].to_numpy())
+            expected = per_game * max((planning_gw or 1) - 1, 1)
+        elif preds is not None:
+            expected = np.asarray(preds, dtype='float64')
+        else:
+            # No model trained yet: fall back to season points
+            expected = subset['total_points'].to_numpy(dtype='float64')
+        # Per-gameweek expectation for the gameweek being planned, used by the simulator
+        if planning_gw and fixtures:
+            gw_points = gameweek_points(subset.assign(expected_points=expected), fixture_matrix_for(fixtures),
+                                        planning_gw, 1)[:, 0]
+        else:
+            gw_points = expected
+        if rows is None:
+            frame['expected_points'] = expected
+            frame['gw_points'] = gw_points
+        else:
+            for col, values in (('expected_points', expected), ('gw_points', gw_points)):
+                column = frame[col].to_numpy(copy=True)
+                column[rows] = values
+                frame[col] = column
+
+    def _model_input(self, subset, feature_cols):
+        # Feature columns for the model; rolling features the frame lacks are joined from
+        # the feature store by player id
+        missing = [c for c in feature_cols if c not in subset]
+        if not missing:
+            return subset[feature_cols]
+        latest = self.feature_store.latest()
+        if latest.empty:
+            raise FeatureStoreError(f"feature store at {self.feature_store.path} is empty; run python -m src.feature_store")
+        joined = latest.reindex(subset['id'].to_numpy())[missing].fillna(0).set_index(subset.index)
+        return pd.concat([subset[[c for c in feature_cols if c in subset]], joined], axis=1)[feature_cols]
+
+    def best_squad(self, pool, key, budget):
+        # One integer program picks the 15-man squad, starting XI and captain. After an
+        # incremental pool update the previous squad is reused outright when no changed
+        # player can affect it. (Feeding it back as an objective cut-off was tried and
+        # made HiGHS slower, so an affected squad is re-solved cold.)
+        squad_key = key + (budget,)
+        selection = self.squads.get(squad_key)
+        if selection is not None:
+            return selection
+        with self._squad_lock:
+            selection = self.squads.get(squad_key, record=False)
+            if selection is None:
+                selection = self._solve_squad(pool, key, budget)
+                self.squads.put(squad_key, selection)
+            return selection
+
+    def _solve_squad(self, pool, key, budget):
+        optimizer = TeamOptimizer(pool, budget, time_limit=SOLVER_TIME_LIMIT, mip_gap=SOLVER_MIP_GAP)
+        with self._lineage_lock:
+            previous, lineage = self._last_selection.get(budget), self._lineage
+        reason = 'no previous squad'
+        if previous is not None and lineage is not None and lineage[:2] == (previous[0], key):
+            reason = squad_affected(lineage[2], pool, lineage[3], previous[1])
+        if reason is None:
+            selection = optimizer.selection_for(*previous[1].incumbent(), status=previous[1].status)
+            SOLVER_RUNS.inc(model='squad', outcome='skipped')
+        else:
+            with stage('optimize_team'):
+                selection = optimizer.solve()
+        with self._lineage_lock:
+            self._last_selection[budget] = (key, selection, pool)
+        return selection
+
+    def cache_key(self, manager_id, options):
+        snapshot = call_with_retry(self.client.bootstrap)
+        self._observe_snapshot(snapshot.content_version)
+        return (snapshot.content_version, self.model_version, manager_id, options)
+
+    def recent_managers(self, limit=None):
+        # Managers asked about most recently first, with the options they used
+        with self._locks_lock:
+            items = list(reversed(self._recent_managers.items()))
+        return items[:limit] if limit else items
+
+    def _touch(self, manager_id, options):
+        if manager_id is None:
+            return
+        with self._locks_lock:
+            self._recent_managers[manager_id] = options
+            self._recent_managers.move_to_end(manager_id)
+            while len(self._recent_managers) > self.responses.maxsize:
+                self._recent_managers.popitem(last=False)
+
+    def recommend(self, manager_id=None, options=DEFAULT_OPTIONS):
+        self._touch(manager_id, options)
+        key = self.cache_key(manager_id, options)
+        cached = self.responses.get(key)
+        if cached is not None:
+            return cached
+        # Single-flight: concurrent identical requests wait for one computation
+        with self._single_flight(('response',) + key):
+            cached = self.responses.get(key, record=False)
+            if cached is not None:
+                return cached
+            result = self._compute(manager_id, options)
+            self._observe_snapshot(result.snapshot_version)
+            self.responses.put((result.snapshot_version, result.model_version, manager_id, options), result)
+            return result
+
+    def chip_plan(self, manager_id, options=DEFAULT_OPTIONS, processes=None):
+        # Ranked chip timings for a manager over the options' horizon, cached like
+        # recommendations
+        key = self.cache_key(manager_id, options)
+        cached = self.chip_plans.get(key)
+        if cached is not None:
+            return cached
+        with self._single_flight(('chips',) + key):
+            cached = self.chip_plans.get(key, record=False)
+            if cached is not None:
+                return cached
+            plan = self._compute_chips(manager_id, options, processes)
+            self._observe_snapshot(plan.snapshot_version)
+            self.chip_plans.put((plan.snapshot_version, plan.model_version, manager_id, options), plan)
+            return plan
+
+    def _compute_chips(self, manager_id, options, processes):
+        with stage('fetch'):
+            bundle = fetch_bundle(manager_id, client=self.client)
+        if not bundle.picks or 'picks' not in bundle.picks:
+            raise ManagerNotFound(f"no picks for manager {manager_id} in gameweek {bundle.gw}")
+        shared = self.shared_state(bundle, options.budget)
+        try:
+            history = call_with_retry(self.client.history, manager_id)
+        except Exception as e:
+            print(f"Chip history for manager {manager_id} unavailable, assuming every chip is left: {e}")
+            history = None
+        start_gw = shared.planning_gw
+        horizon = options.horizon or DEFAULT_OPTIONS.horizon
+        points_by_gw = gameweek_points(shared.pool, fixture_matrix_for(shared.fixtures), start_gw, horizon)
+        squad_ids = [pick['element'] for pick in bundle.picks['picks']]
+        entry_history = bundle.picks.get('entry_history') or {}
+        if 'value' in entry_history and 'bank' in entry_history:
+            budget = (entry_history['value'] + entry_history['bank']) / 10
+        else:
+            budget = options.budget
+        available = available_chips(history, start_gw)
+        plan = evaluate_chips(shared.pool, points_by_gw, squad_ids, budget, start_gw, available, processes)
+        plan.manager_id = manager_id
+        plan.snapshot_version, plan.model_version = shared.snapshot_version, shared.model_version
+        plan.available = available
+        ids = sorted(set(squad_ids).union(*(o.ins for o in plan.options)))
+        rows = shared.pool.rows_for(ids)
+        plan.players = {p['id']: p for p in shared.pool.rows(rows[rows >= 0])}
+        return plan
+
+    def shared_state(self, bundle, budget):
+        # Everything that is the same for every manager on this snapshot
+        pool_key, pool = self.player_pool(bundle)
+        selection = self.best_squad(pool, pool_key, budget)
+        order = {pos: i for i, pos in enumerate(POSITIONS)}
+        return SharedState(
+            snapshot_version=pool_key[0],
+            model_version=pool_key[1],
+            gw=bundle.gw,
+            planning_gw=bundle.snapshot.next_gw or bundle.gw,
+            pool=pool,
+            fixtures=bundle.fixtures,
+            selection=selection,
+            squad=sorted(selection.squad, key=lambda p: order.get(p.get('position'), len(order))),
+        )
+
+    def previous_plan(self, manager_id):
+        return self._previous_plans.get(manager_id)
+
+    def remember(self, rec):
+        # Store a recommendation computed elsewhere (e.g. by a batch worker)
+        self._observe_snapshot(rec.snapshot_version)
+        if rec.plan is not None:
+            self._previous_plans[rec.manager_id] = rec.plan
+        self.responses.put((rec.snapshot_version, rec.model_version, rec.manager_id, rec.options), rec)
+
+    def _compute(self, manager_id, options):
+        with stage('fetch'):
+            bundle = fetch_bundle(manager_id, client=self.client)
+        shared = self.shared_state(bundle, options.budget)
+        rec = recommend_for(shared, manager_id, bundle.entry, bundle.picks, options,
+                            warm_start=self.previous_plan(manager_id))
+        if rec.plan is not None:
+            self._previous_plans[manager_id] = rec.plan
+        return rec
+
+
+def recommend_for(shared, manager_id, entry, picks_data, options, warm_start=None):
+    # Per-manager step on top of the shared state; pure function of its inputs so it
+    # can run in a worker process
+    rec = Recommendation(
+        manager_id=manager_id,
+        options=options,
+        snapshot_version=shared.snapshot_version,
+        model_version=shared.model_version,
+        gw=shared.gw,
+        planning_gw=shared.planning_gw,
+        selection=shared.selection,
+        squad=shared.squad,
+        fpl_info=fpl_info_from(entry, shared.gw),
+        computed_at=time.time(),
+    )
+    pool = shared.pool
+    if picks_data and 'picks' in picks_data:
+        rows = pool.rows_for([pick['element'] for pick in picks_data['picks']])
+        rec.current_team = pool.rows(rows[rows >= 0])
+
+    selection = shared.selection
+    if shared.gw == 1 or not rec.current_team:
+        # GW1 or no team: the from-scratch squad and its captaincy
+        rec.captain, rec.vice_captain = selection.captain, selection.vice_captain
+        with stage('simulate'):
+            rec.simulation = simulate_team(selection.squad, selection.starters, selection.captain,
+                                           n_sims=options.simulations)
+    else:
+        _advise_transfers(rec, pool, shared.fixtures, picks_data, options, warm_start)
+
+    rec.captaincy = captaincy_table(rec.simulation, rec.squad + rec.current_team + ((rec.transfer or {}).get('ins') or []))
+    return rec
+
+
+def _advise_transfers(rec, pool, fixtures, picks_data, options, warm_start=None):
+    # Later GWs: score every legal swap against the full player pool
+    current_team = rec.current_team
+    squad_ids = [p['id'] for p in current_team]
+    entry_history = picks_data.get('entry_history') or {}
+    if 'bank' in entry_history:
+        bank = entry_history['bank'] / 10
+    else:
+        bank = options.budget - sum(float(p.get('price', p.get('cost', 0))) for p in current_team)
+
+    if rec.planning_gw and options.horizon:
+        points_by_gw = gameweek_points(pool, fixture_matrix_for(fixtures), rec.planning_gw, options.horizon)
+        planner = TransferPlanner(pool, points_by_gw, squad_ids, bank, start_gw=rec.planning_gw)
+        try:
+            with stage('plan_transfers'):
+                rec.plan = planner.solve(time_budget=PLANNER_TIME_BUDGET, mip_gap=PLANNER_MIP_GAP,
+                                         warm_start=warm_start)
+        except ValueError as e:
+            print(f"Transfer planning failed: {e}")
+
+    injured = sorted((p for p in current_team if is_injured(p)), key=get_injury_severity, reverse=True)
+    out_ids = [injured[0]['id']] if injured else None
+    engine = TransferEngine(pool, squad_ids, bank)
+    with stage('transfer_search'):
+        found = engine.search(max_transfers=options.max_transfers, top_k=options.top_k, out_ids=out_ids)
+    found = [o for o in found if o.net_gain > 0]
+
+    team = current_team
+    if found:
+        best = found[0]
+        out_ids_best = set(p['id'] for p in best.outs)
+        team = [p for p in current_team if p['id'] not in out_ids_best] + best.ins
+        rec.transfer = {
+            'out': best.outs[0],
+            'in': best.ins[0],
+            'outs': best.outs,
+            'ins': best.ins,
+            'reason': best.outs[0].get('news', None),
+            'gain': best.net_gain,
+            'hit_cost': best.hit_cost,
+            'new_team': team,
+            'options': found
+        }
+
+    # Captain and vice are the starters with the highest simulated captaincy EV
+    starters = best_lineup(team, 'gw_points')
+    with stage('simulate'):
+        rec.simulation = simulate_team(team, starters, n_sims=options.simulations)
+    starter_ids = set(p['id'] for p in starters)
+    by_id = {p['id']: p for p in team}
+    ranked = [by_id[c['id']] for c in rec.simulation.ranked_captains(len(team)) if c['id'] in starter_ids]
+    rec.captain = ranked[0] if ranked else None
+    rec.vice_captain = ranked[1] if len(ranked) > 1 else None
+
+
+# JSON views. Player dicts can hold numpy scalars and NaN, neither of which is valid JSON.
+PLAYER_FIELDS = ['id', 'web_name', 'name', 'team', 'team_name', 'position', 'price', 'expected_points',
+                 'gw_points', 'total_points', 'form', 'chance_of_playing_next_round', 'news']
+
+
+def _plain(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        # float32 columns such as form would otherwise leak digits like 4.900000095
+        return round(value, 4) if math.isfinite(value) else None
+    return value
+
+
+def player_json(player):
+    if player is None:
+        return None
+    return {k: _plain(player.get(k)) for k in PLAYER_FIELDS if k in player}
+
+
+def players_json(players):
+    return [player_json(p) for p in players or []]
+
+
+def _meta(rec):
+    return {
+        'manager_id': rec.manager_id,
+        'gameweek': rec.gw,
+        'planning_gameweek': rec.planning_gw,
+        'snapshot_version': rec.snapshot_version,
+        'model_version': rec.model_version,
+        'computed_at': rec.computed_at,
+        'options': rec.options._asdict(),
+    }
+
+
+def squad_json(rec):
+    selection = rec.selection
+    return dict(_meta(rec), squad=players_json(rec.squad), total_cost=selection.total_cost,
+                expected_points=selection.expected_points, status=selection.status, manager=rec.fpl_info)
+
+
+def lineup_json(rec):
+    # The manager's own XI when they have a team, otherwise the from-scratch squad's
+    if rec.current_team and rec.gw != 1:
+        team = (rec.transfer or {}).get('new_team') or rec.current_team
+        starters = best_lineup(team, 'gw_points')
+        starter_ids = set(p['id'] for p in starters)
+        bench = sorted((p for p in team if p['id'] not in starter_ids),
+                       key=lambda p: (p.get('position') != 'GKP', -float(p.get('gw_points', 0))))
+        source = 'current_team'
+    else:
+        starters, bench, source = rec.selection.starters, rec.selection.bench, 'recommended_squad'
+    return dict(_meta(rec), source=source, starters=players_json(starters), bench=players_json(bench),
+                captain=player_json(rec.captain), vice_captain=player_json(rec.vice_captain))
+
+
+def captaincy_json(rec):
+    simulation = rec.simulation
+    return dict(
+        _meta(rec),
+        captain=player_json(rec.captain),
+        vice_captain=player_json(rec.vice_captain),
+        candidates=[{k: _plain(v) for k, v in row.items()} for row in rec.captaincy],
+        simulations=simulation.n_sims if simulation else 0,
+        squad_quantiles={str(q): v for q, v in simulation.squad_quantiles.items()} if simulation else {},
+        squad_mean=simulation.squad_mean if simulation else None,
+    )
+
+
+def transfers_json(rec):
+    transfer = rec.transfer
+    options = []
+    for o in (transfer or {}).get('options', []):
+        options.append({'outs': players_json(o.outs), 'ins': players_json(o.ins), 'gain': o.gain,
+                        'hit_cost': o.hit_cost, 'net_gain': o.net_gain, 'cost_delta': o.cost_delta})
+    plan = None
+    if rec.plan is not None:
+        plan = {
+            'start_gw': rec.plan.start_gw,
+            'objective': _plain(rec.plan.objective),
+            'optimal': rec.plan.optimal,
+            'gap': _plain(rec.plan.gap),
+            'status': rec.plan.status,
+            'weeks': [{'gw': w.gw, 'transfers_in': players_json(w.transfers_in),
+                       'transfers_out': players_json(w.transfers_out), 'free_transfers': _plain(w.free_transfers),
+                       'hits': _plain(w.hits), 'captain_id': _plain(w.captain_id),
+                       'expected_points': _plain(w.expected_points)}
+                      for w in rec.plan.weeks],
+        }
+    return dict(_meta(rec), current_team=players_json(rec.current_team),
+                reason=(transfer or {}).get('reason'), options=options, plan=plan)
+
+
+def chips_json(plan):
+    players = plan.players or {}
+    return {
+        'manager_id': plan.manager_id,
+        'snapshot_version': plan.snapshot_version,
+        'model_version': plan.model_version,
+        'start_gw': plan.start_gw,
+        'available': plan.available,
+        'baseline': [_plain(v) for v in plan.baseline],
+        'best': {chip: {'gw': o.gw, 'gain': _plain(o.gain)} for chip, o in plan.best.items()},
+        'options': [{'chip': o.chip, 'label': CHIP_LABELS[o.chip], 'gw': o.gw, 'gain': _plain(o.gain),
+                     'points': _plain(o.points), 'baseline': _plain(o.baseline),
+                     'ins': players_json([players[i] for i in o.ins if i in players]),
+                     'outs': players_json([players[i] for i in o.outs if i in players])}
+                    for o in plan.options],
+        'seconds': round(plan.seconds, 3),
+    }
+
+
+def league_json(analysis):
+    players = analysis.players or {}
+
+    def with_players(option, **keys):
+        # Each id field gets the player it names alongside it
+        return dict({k: _plain(v) for k, v in option.items()},
+                    **{name: player_json(players.get(option.get(key))) for name, key in keys.items()})
+
+    return {
+        'league_id': analysis.league_id,
+        'name': analysis.name,
+        'gameweek': analysis.gw,
+        'planning_gameweek': analysis.planning_gw,
+        'manager_id': analysis.manager_id,
+        'snapshot_version': analysis.snapshot_version,
+        'model_version': analysis.model_version,
+        'managers': len(analysis.managers),
+        'sampled': analysis.sampled,
+        'standings': [{k: row.get(k) for k in ('entry', 'entry_name', 'player_name', 'rank', 'total', 'event_total')}
+                      for row in analysis.standings],
+        'ownership': [with_players(row, player='id') for row in analysis.ownership],
+        'baseline': with_players(analysis.baseline, captain='captain_id') if analysis.baseline else None,
+        'captains': [with_players(o, player='id') for o in analysis.captains],
+        'transfers': [with_players(o, out='out_id', **{'in': 'in_id'}) for o in analysis.transfers],
+        'errors': {str(m): e for m, e in analysis.errors.items()},
+        'timings': {k: round(v, 3) for k, v in analysis.timings.items()},
+    }
+
+
+def summary_json(rec):
+    # One line per manager for batch output: captaincy plus the best move, if any
+    transfer = rec.transfer or {}
+    simulation = rec.simulation
+    return dict(
+        _meta(rec),
+        manager=rec.fpl_info,
+        captain=player_json(rec.captain),
+        vice_captain=player_json(rec.vice_captain),
+        transfer_out=players_json(transfer.get('outs')),
+        transfer_in=players_json(transfer.get('ins')),
+        net_gain=_plain(transfer.get('gain')),
+        hit_cost=_plain(transfer.get('hit_cost')),
+        squad_mean=simulation.squad_mean if simulation else None,
+    )
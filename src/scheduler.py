@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from src.batch import run_batch
+from src.metrics import registry as metrics_registry, stage
+from src.recommender import DEFAULT_OPTIONS
+
+POLL_INTERVAL = 300            # seconds between snapshot checks on a quiet day
+DEADLINE_POLL_INTERVAL = 30    # ... and in the run-up to a deadline
+DEADLINE_WINDOW = 3 * 3600     # how long before a deadline polling speeds up
+HOT_MANAGERS = 200             # recently seen managers precomputed on every change
+ERROR_BACKOFF = 60
+
+PRECOMPUTE_RUNS = metrics_registry.counter('fpl_precompute_runs_total', "Background precompute runs by trigger and outcome")
+
+
+def parse_deadline(value):
+    # FPL deadlines are ISO 8601 in UTC, e.g. 2024-08-16T17:30:00Z
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def next_deadline(snapshot, now=None):
+    # (gameweek, epoch seconds) of the first deadline still ahead, or (None, None)
+    now = time.time() if now is None else now
+    upcoming = []
+    for event in snapshot.events:
+        deadline = parse_deadline(event.get('deadline_time'))
+        if deadline is not None and deadline > now:
+            upcoming.append((deadline, event.get('id')))
+    if not upcoming:
+        return None, None
+    deadline, gw = min(upcoming)
+    return gw, deadline
+
+
+class PrecomputeScheduler:
+    # Background thread that keeps the recommender's caches warm. It revalidates
+    # bootstrap-static (a 304 when nothing moved) and, when the snapshot content
+    # or the model version changes, precomputes the shared squad and captaincy plus
+    # every recently seen manager, so request handlers only read the cache.
+    def __init__(self, recommender, options=DEFAULT_OPTIONS, poll_interval=POLL_INTERVAL,
+                 deadline_poll_interval=DEADLINE_POLL_INTERVAL, deadline_window=DEADLINE_WINDOW,
+                 hot_managers=HOT_MANAGERS, processes=None):
+        self.recommender = recommender
+        self.options = options
+        self.poll_interval = poll_interval
+        self.deadline_poll_interval = deadline_poll_interval
+        self.deadline_window = deadline_window
+        self.hot_managers = hot_managers
+        self.processes = processes
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen = None   # (snapshot content version, model version) last precomputed
+        self.last_poll = None
+        self.last_precompute = None
+        self.last_duration = None
+        self.last_error = None
+        self.next_deadline = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='fpl-precompute', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def next_interval(self, now=None):
+        # Poll fast inside the deadline window; otherwise sleep, but wake up in time for it
+        now = time.time() if now is None else now
+        if self.next_deadline is None:
+            return self.poll_interval
+        until = self.next_deadline - now
+        if until <= self.deadline_window:
+            return self.deadline_poll_interval
+        return max(self.deadline_poll_interval, min(self.poll_interval, until - self.deadline_window))
+
+    def poll_once(self, force=False):
+        # One check; returns True if a precompute ran
+        snapshot = self.recommender.client.bootstrap(force=True)
+        self.last_poll = time.time()
+        _, self.next_deadline = next_deadline(snapshot, self.last_poll)
+        self.recommender.model_registry.refresh()
+        seen = (snapshot.content_version, self.recommender.model_version)
+        if seen == self._seen and not force:
+            return False
+        trigger = 'startup' if self._seen is None else ('snapshot' if seen[0] != self._seen[0] else 'model')
+        self.precompute(trigger)
+        self._seen = seen
+        return True
+
+    def precompute(self, trigger='manual'):
+        started = time.perf_counter()
+        try:
+            with stage('precompute'):
+                # Shared pool, from-scratch squad and its captaincy
+                self.recommender.recommend(None, self.options)
+                by_options = defaultdict(list)
+                for manager_id, options in self.recommender.recent_managers(self.hot_managers):
+                    by_options[options].append(manager_id)
+                for options, manager_ids in by_options.items():
+                    run_batch(manager_ids, self.recommender, options, processes=self.processes)
+        except Exception:
+            PRECOMPUTE_RUNS.inc(trigger=trigger, outcome='error')
+            raise
+        self.last_duration = time.perf_counter() - started
+        self.last_precompute = time.time()
+        PRECOMPUTE_RUNS.inc(trigger=trigger, outcome='ok')
+        print(f"Precomputed recommendations ({trigger}) in {self.last_duration:.1f}s")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+                self.last_error = None
+                wait = self.next_interval()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Precompute failed: {e}")
+                wait = ERROR_BACKOFF
+            self._stop.wait(wait)
+
+    def status(self):
+        return {
+            'running': self.running,
+            'last_poll': self.last_poll,
+            'last_precompute': self.last_precompute,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error,
+            'next_deadline': self.next_deadline,
+            'next_poll_in': self.next_interval() if self.running else None,
+            'snapshot_version': self._seen[0] if self._seen else None,
+            'model_version': self._seen[1] if self._seen else None,
+        }
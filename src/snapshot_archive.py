@@ -0,0 +1,283 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from src.data_fetcher import BootstrapSnapshot, FPLAPIError, get_client, call_with_retry
+
+ARCHIVE_DIR = "archive"
+# The tables kept per pull; everything else in bootstrap-static is never read
+BOOTSTRAP_TABLES = ('elements', 'teams', 'events', 'element_types')
+REPLAY_CACHE_SIZE = 8
+
+_MISSING = object()   # a row without the key, distinct from an explicit null
+
+
+def parse_time(value):
+    # Epoch seconds or ISO 8601 (a trailing Z is UTC)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+def _encode(values):
+    # (array, kind) for one column. Scalars of one type get a native dtype so they can be
+    # memory-mapped; anything else (nested lists, mixed types, missing keys) is stored
+    # as JSON text per row, with '' marking a row that lacked the key.
+    present = [v for v in values if v is not _MISSING]
+    if len(present) == len(values):
+        if all(type(v) is bool for v in present):
+            return np.array(present, dtype=bool), 'bool'
+        if all(type(v) is int for v in present):
+            return np.array(present, dtype=np.int64), 'int'
+        if all(type(v) is float for v in present):
+            return np.array(present, dtype=np.float64), 'float'
+        if all(type(v) is int or v is None for v in present):
+            return np.array([np.nan if v is None else v for v in present], dtype=np.float64), 'int_or_none'
+        if all(type(v) is str for v in present):
+            return np.array(present, dtype=str), 'str'
+    return np.array(['' if v is _MISSING else json.dumps(v) for v in values], dtype=str), 'json'
+
+
+def _decode(array, kind):
+    values = array.tolist()
+    if kind == 'int_or_none':
+        return [None if v != v else int(v) for v in values]
+    if kind == 'json':
+        return [json.loads(v) if v else _MISSING for v in values]
+    return values
+
+
+class SnapshotArchive:
+    # Every bootstrap-static and fixtures pull, stored column by column:
+    #   columns/<sha1>.npy   one column, content-addressed, so a column that did not
+    #                        change between pulls (names, teams, ids...) is stored once
+    #   tables/<sha1>.json   a table: row count plus (field, kind, column sha) per field
+    #   index.jsonl          one line per pull: kind, time, ETag and table hashes
+    # Columns are loaded memory-mapped. A pull identical to the previous one of its
+    # kind is not recorded again.
+    def __init__(self, path=ARCHIVE_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_size = None
+
+    def _file(self, *parts):
+        return os.path.join(self.path, *parts)
+
+    def _write(self, path, write):
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+        return True
+
+    def _put_table(self, rows):
+        fields = list(dict.fromkeys(k for row in rows for k in row))
+        columns = []
+        for name in fields:
+            array, kind = _encode([row.get(name, _MISSING) for row in rows])
+            digest = hashlib.sha1(f"{kind}:{array.dtype.str}:{array.shape}".encode() + array.tobytes()).hexdigest()
+            self._write(self._file('columns', f"{digest}.npy"), lambda f: np.save(f, array))
+            columns.append([name, kind, digest])
+        table = {'rows': len(rows), 'columns': columns}
+        body = json.dumps(table, sort_keys=True).encode()
+        digest = hashlib.sha1(body).hexdigest()
+        self._write(self._file('tables', f"{digest}.json"), lambda f: f.write(body))
+        return digest
+
+    def record(self, kind, payload, etag=None, last_modified=None, fetched_at=None):
+        # Archive one pull; kind is 'bootstrap-static' or 'fixtures'. Returns the index
+        # entry, or None when the content matches the last pull of that kind.
+        if kind == 'bootstrap-static':
+            tables = {name: self._put_table(payload.get(name, [])) for name in BOOTSTRAP_TABLES}
+        elif kind == 'fixtures':
+            tables = {'fixtures': self._put_table(payload)}
+        else:
+            raise ValueError(f"cannot archive {kind}")
+        with self._lock:
+            previous = [e for e in self.entries() if e['kind'] == kind]
+            if previous and previous[-1]['tables'] == tables:
+                return None
+            entry = {'kind': kind, 'at': fetched_at if fetched_at is not None else time.time(),
+                     'etag': etag, 'last_modified': last_modified, 'tables': tables}
+            os.makedirs(self.path, exist_ok=True)
+            with open(self._file('index.jsonl'), 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+            return entry
+
+    def entries(self, kind=None):
+        # Index entries in pull order; re-read when another process has appended
+        path = self._file('index.jsonl')
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size != self._index_size:
+            if size:
+                with open(path) as f:
+                    self._index = [json.loads(line) for line in f if line.strip()]
+            else:
+                self._index = []
+            self._index_size = size
+        return [e for e in self._index if kind is None or e['kind'] == kind]
+
+    def entry_at(self, kind, at=None):
+        # The last pull of kind at or before `at` (epoch seconds; None is the latest)
+        found = None
+        for entry in self.entries(kind):
+            if at is not None and entry['at'] > at:
+                break
+            found = entry
+        return found
+
+    def load_columns(self, table, fields=None):
+        # {field: memory-mapped array} without building row dicts
+        with open(self._file('tables', f"{table}.json")) as f:
+            meta = json.load(f)
+        return {name: np.load(self._file('columns', f"{digest}.npy"), mmap_mode='r')
+                for name, kind, digest in meta['columns'] if fields is None or name in fields}
+
+    def load_table(self, table):
+        # The table back as the list of dicts it was recorded from
+        with open(self._file('tables', f"{table}.json")) as f:
+            meta = json.load(f)
+        names, columns = [], []
+        for name, kind, digest in meta['columns']:
+            names.append(name)
+            columns.append(_decode(np.load(self._file('columns', f"{digest}.npy"), mmap_mode='r'), kind))
+        rows = [dict(zip(names, values)) for values in zip(*columns)] if columns else [{} for _ in range(meta['rows'])]
+        if any(kind == 'json' for _, kind, _ in meta['columns']):
+            rows = [{k: v for k, v in row.items() if v is not _MISSING} for row in rows]
+        return rows
+
+    def load(self, entry):
+        # Payload of an index entry, shaped like the upstream response
+        if entry['kind'] == 'fixtures':
+            return self.load_table(entry['tables']['fixtures'])
+        return {name: self.load_table(digest) for name, digest in entry['tables'].items()}
+
+    def snapshot(self, entry):
+        return BootstrapSnapshot(self.load(entry), version=entry.get('etag') or entry['tables']['elements'],
+                                 fetched_at=entry['at'])
+
+    def stats(self):
+        # Bytes on disk vs bytes the recorded pulls reference, i.e. the dedup saving
+        stored = sum(os.path.getsize(self._file('columns', f)) for f in os.listdir(self._file('columns')))
+        referenced = 0
+        for entry in self.entries():
+            for table in entry['tables'].values():
+                with open(self._file('tables', f"{table}.json")) as f:
+                    for _, _, digest in json.load(f)['columns']:
+                        referenced += os.path.getsize(self._file('columns', f"{digest}.npy"))
+        return {'pulls': len(self.entries()), 'stored_bytes': stored, 'referenced_bytes': referenced}
+
+    def warm(self, client):
+        # Seed a live client's cache with the latest archived pulls, already expired, so
+        # the first request revalidates with their ETag: an unchanged upstream answers
+        # 304 and nothing is downloaded or parsed from JSON
+        seeded = 0
+        for kind, path in (('bootstrap-static', "bootstrap-static/"), ('fixtures', "fixtures/")):
+            entry = self.entry_at(kind)
+            if entry is None or not (entry.get('etag') or entry.get('last_modified')):
+                continue
+            value = self.snapshot(entry) if kind == 'bootstrap-static' else self.load(entry)
+            client.seed(path, value, entry.get('etag'), entry.get('last_modified'))
+            seeded += 1
+        return seeded
+
+
+class ReplayClient:
+    # Drop-in for FPLClient that serves the archive as it stood at `at` (epoch seconds
+    # or ISO 8601; None follows the latest pull). Only bootstrap-static and fixtures
+    # are archived, so manager and player endpoints answer 404.
+    def __init__(self, archive, at=None):
+        self.archive = archive if isinstance(archive, SnapshotArchive) else SnapshotArchive(archive)
+        self.at = parse_time(at)
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0}
+        self._loaded = {}   # (kind, entry time) -> decoded value, most recent last
+        self._lock = threading.Lock()
+
+    def set_time(self, at):
+        self.at = parse_time(at)
+
+    def _serve(self, kind):
+        entry = self.archive.entry_at(kind, self.at)
+        if entry is None:
+            raise FPLAPIError(f"archive:{kind}@{self.at}", 404)
+        key = (kind, entry['at'])
+        with self._lock:
+            value = self._loaded.get(key)
+            if value is not None:
+                self.stats['hits'] += 1
+                return value
+            self.stats['misses'] += 1
+            value = self.archive.snapshot(entry) if kind == 'bootstrap-static' else self.archive.load(entry)
+            self._loaded[key] = value
+            while len(self._loaded) > REPLAY_CACHE_SIZE:
+                self._loaded.pop(next(iter(self._loaded)))
+            return value
+
+    def bootstrap(self, force=False):
+        return self._serve('bootstrap-static')
+
+    def fixtures(self):
+        return self._serve('fixtures')
+
+    def _not_archived(self, path):
+        raise FPLAPIError(f"archive:{path}", 404)
+
+    def entry(self, fpl_id, limiter=None):
+        self._not_archived(f"entry/{fpl_id}/")
+
+    def picks(self, fpl_id, gw, limiter=None):
+        self._not_archived(f"entry/{fpl_id}/event/{gw}/picks/")
+
+    def history(self, fpl_id):
+        self._not_archived(f"entry/{fpl_id}/history/")
+
+    def league_standings(self, league_id, page=1):
+        self._not_archived(f"leagues-classic/{league_id}/standings/")
+
+    def element_summary(self, player_id):
+        self._not_archived(f"element-summary/{player_id}/")
+
+    def event_live(self, gw):
+        self._not_archived(f"event/{gw}/live/")
+
+    def clear_cache(self):
+        with self._lock:
+            self._loaded.clear()
+
+
+def main(argv=None):
+    # python -m src.snapshot_archive record | list | stats
+    parser = argparse.ArgumentParser(description="Archive FPL snapshots for offline replay")
+    parser.add_argument('command', choices=['record', 'list', 'stats'])
+    parser.add_argument('--path', default=ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+    archive = SnapshotArchive(args.path)
+    if args.command == 'record':
+        client = get_client()
+        client.archive = archive
+        call_with_retry(client.bootstrap, True)
+        call_with_retry(client.fixtures)
+        print(f"{len(archive.entries())} pulls archived in {args.path}")
+    elif args.command == 'list':
+        for entry in archive.entries():
+            stamp = datetime.fromtimestamp(entry['at']).isoformat(timespec='seconds')
+            print(f"{stamp}  {entry['kind']:<16}  {entry.get('etag') or '-'}")
+    else:
+        print(json.dumps(archive.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from src.data_fetcher import ELEMENT_FIELDS
+from src.data_processor import column_values
+from src.team_optimizer import MAX_PER_CLUB, SQUAD_SIZE
+
+
+@dataclass
+class SnapshotDiff:
+    changed: dict = field(default_factory=dict)   # player id -> set of changed fields
+    added: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    reordered: bool = False
+    teams_changed: bool = False
+    events_changed: bool = False
+
+    @property
+    def structural(self):
+        # Anything a row-level update cannot express: the pool itself, club names or
+        # the gameweek moved, so the frame is rebuilt
+        return bool(self.added or self.removed or self.reordered or self.teams_changed or self.events_changed)
+
+    @property
+    def empty(self):
+        return not self.changed and not self.structural
+
+    def changed_ids(self):
+        return sorted(self.changed)
+
+
+def diff_snapshots(old, new):
+    # Compare two BootstrapSnapshots on the fields the pipeline reads. Rows are compared
+    # as whole tuples first; per-field detail is only worked out for rows that differ.
+    diff = SnapshotDiff()
+    old_rows = old.projection('elements')
+    new_rows = new.projection('elements')
+    id_at = ELEMENT_FIELDS.index('id')
+    old_ids = [row[id_at] for row in old_rows]
+    new_ids = [row[id_at] for row in new_rows]
+    if old_ids == new_ids:
+        pairs = ((a, b) for a, b in zip(old_rows, new_rows) if a != b)
+    else:
+        old_by_id = dict(zip(old_ids, old_rows))
+        diff.added = [i for i in new_ids if i not in old_by_id]
+        diff.removed = sorted(set(old_ids) - set(new_ids))
+        diff.reordered = not diff.added and not diff.removed
+        pairs = ((old_by_id[row[id_at]], row) for row in new_rows
+                 if row[id_at] in old_by_id and old_by_id[row[id_at]] != row)
+    for before, after in pairs:
+        diff.changed[after[id_at]] = {f for f, a, b in zip(ELEMENT_FIELDS, before, after) if a != b}
+    diff.teams_changed = old.projection('teams') != new.projection('teams')
+    diff.events_changed = old.projection('events') != new.projection('events')
+    return diff
+
+
+def changed_rows(frame, diff):
+    # Row positions of the changed players in a frame built from the same element order
+    ids = column_values(frame, 'id')
+    return np.flatnonzero(np.isin(ids, np.fromiter(diff.changed, dtype=np.int64, count=len(diff.changed))))
+
+
+def squad_affected(old_frame, new_frame, rows, selection, max_per_club=MAX_PER_CLUB):
+    # Whether the previous optimal squad can have stopped being optimal. It can if a
+    # changed player is in it, or if a changed outsider got better (more points or
+    # cheaper) without being dominated: at least as many points for no more money by
+    # enough squad members at the same position and club that any squad holding the
+    # outsider leaves one of them out. Swapping that one in keeps the budget, the club
+    # count and the formation, and loses no points. Returns the first reason.
+    squad = set(selection.indices)
+    old_points = column_values(old_frame, 'expected_points').astype(float)
+    new_points = column_values(new_frame, 'expected_points').astype(float)
+    old_costs = column_values(old_frame, 'cost').astype(float)
+    new_costs = column_values(new_frame, 'cost').astype(float)
+    positions = column_values(new_frame, 'position').astype(str)
+    old_positions = column_values(old_frame, 'position').astype(str)
+    clubs = column_values(new_frame, 'team')
+    old_clubs = column_values(old_frame, 'team')
+    squad_rows = np.asarray(selection.indices, dtype=np.int64)
+    for r in (int(r) for r in rows):
+        if r in squad:
+            return f"squad player {r} changed"
+        if positions[r] != old_positions[r] or clubs[r] != old_clubs[r]:
+            return f"player {r} changed position or club"
+        if new_points[r] <= old_points[r] and new_costs[r] >= old_costs[r]:
+            continue
+        same = squad_rows[(positions[squad_rows] == positions[r]) & (clubs[squad_rows] == clubs[r])]
+        dominating = np.count_nonzero((new_points[same] >= new_points[r]) & (new_costs[same] <= new_costs[r]))
+        if dominating < min(SQUAD_SIZE[positions[r]], max_per_club):
+            return f"player {r} became competitive"
+    return None
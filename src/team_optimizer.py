@@ -1,6 +1,41 @@
-from scipy.optimize import linprog
+from dataclasses import dataclass, field
+
+from scipy.optimize import milp, LinearConstraint, Bounds
+from scipy import sparse
 import numpy as np
 
+from src.metrics import SOLVER_RUNS, SOLVER_OUTCOMES
+from src.player_pool import as_pool, POSITIONS, POSITION_CODES
+
+SQUAD_SIZE = {'GKP': 2, 'DEF': 5, 'MID': 5, 'FWD': 3}
+# Min/max starters per position; together with 11 starters this covers every valid formation
+STARTING_LIMITS = {'GKP': (1, 1), 'DEF': (3, 5), 'MID': (2, 5), 'FWD': (1, 3)}
+STARTING_SIZE = 11
+MAX_PER_CLUB = 3
+# Bench players only score when a starter misses out, so they are worth a fraction of a starter
+BENCH_WEIGHT = 0.1
+
+
+@dataclass
+class SquadSelection:
+    squad: list
+    starters: list
+    bench: list
+    captain: dict = None
+    vice_captain: dict = None
+    total_cost: float = 0.0
+    expected_points: float = 0.0
+    status: str = ''
+    indices: list = field(default_factory=list)           # squad row positions in player_data
+    starter_indices: list = field(default_factory=list)
+    captain_index: int = None
+
+    def incumbent(self):
+        # (squad, starters, captain) row indices, as TeamOptimizer.selection_for takes them
+        captain = [self.captain_index] if self.captain_index is not None else []
+        return self.indices, self.starter_indices, captain
+
+
 class TeamOptimizer:
     def get_team_structure(self):
         # Count number of players per position in the optimized team
@@ -20,52 +55,143 @@ class TeamOptimizer:
     def select_players_based_on_performance(self):
         # Select all players with points > 0
         return [player for player in self.player_data if player.get('points', 0) > 0]
-    def __init__(self, player_data, budget, max_players_per_position):
+
+    def __init__(self, player_data, budget, max_players_per_position=None, max_per_club=MAX_PER_CLUB,
+                 bench_weight=BENCH_WEIGHT, time_limit=None, mip_gap=None):
         self.player_data = player_data
+        self.pool = as_pool(player_data)
         self.budget = budget
         # Accept dict for max_players_per_position, fallback to int for backward compatibility
-        if isinstance(max_players_per_position, dict):
+        if max_players_per_position is None:
+            self.max_players_per_position = dict(SQUAD_SIZE)
+        elif isinstance(max_players_per_position, dict):
             self.max_players_per_position = max_players_per_position
         else:
             self.max_players_per_position = {'GKP': max_players_per_position, 'DEF': max_players_per_position, 'MID': max_players_per_position, 'FWD': max_players_per_position}
+        self.max_per_club = max_per_club
+        self.bench_weight = bench_weight
+        self.time_limit = time_limit
+        self.mip_gap = mip_gap
 
-    def optimize_team(self):
-        num_players = len(self.player_data)
-        costs = np.array([player['cost'] for player in self.player_data])
-        points = np.array([player['expected_points'] for player in self.player_data])
-        
-        # Objective function: maximize points
-        c = -points
-        
-        # Constraints
-        # Budget constraint as inequality (sum(costs * x) <= budget)
-        A_ub = [costs]
-        b_ub = [self.budget]
-
-        # Position constraints as equalities
-        A_eq = []
-        b_eq = []
-        for position in ['GKP', 'DEF', 'MID', 'FWD']:
-            position_mask = np.array([player['position'] == position for player in self.player_data])
-            A_eq.append(position_mask)
-            b_eq.append(self.max_players_per_position.get(position, 0))
-
-        # Bounds for each player (0 or 1)
-        bounds = [(0, 1) for _ in range(num_players)]
-
-        # Solve the linear programming problem
-        result = linprog(
-            c,
-            A_ub=np.array(A_ub),
-            b_ub=np.array(b_ub),
-            A_eq=np.array(A_eq),
-            b_eq=np.array(b_eq),
-            bounds=bounds,
-            method='highs'
+    def _build_problem(self):
+        # Variables are laid out as [squad x (n) | starter s (n) | captain c (n)], all binary
+        pool = self.pool
+        n = len(pool)
+        # Work in tenths of a million so the budget constraint is exact
+        costs = np.round(pool.costs * 10).astype(np.int64)
+        points = pool.points
+
+        c = -np.concatenate([self.bench_weight * points, (1 - self.bench_weight) * points, points])
+
+        eye = sparse.identity(n, format='csr')
+        zeros = sparse.csr_matrix((1, n))
+        rows, lower, upper = [], [], []
+
+        def add(row_x, row_s, row_c, lo, hi):
+            rows.append(sparse.hstack([row_x, row_s, row_c]))
+            lower.append(lo)
+            upper.append(hi)
+
+        add(sparse.csr_matrix(costs), zeros, zeros, -np.inf, round(self.budget * 10))
+        for position in POSITIONS:
+            mask = sparse.csr_matrix(pool.position_mask(position).astype(float))
+            count = self.max_players_per_position.get(position, 0)
+            add(mask, zeros, zeros, count, count)
+            lo, hi = STARTING_LIMITS[position]
+            add(zeros, mask, zeros, lo, min(hi, count))
+        club_rows = sparse.csr_matrix(pool.club_masks.astype(float))
+        for club in range(club_rows.shape[0]):
+            add(club_rows[club], zeros, zeros, -np.inf, self.max_per_club)
+        ones = sparse.csr_matrix(np.ones((1, n)))
+        add(zeros, ones, zeros, STARTING_SIZE, STARTING_SIZE)
+        add(zeros, zeros, ones, 1, 1)
+
+        A = sparse.vstack(rows + [
+            sparse.hstack([-eye, eye, sparse.csr_matrix((n, n))]),   # starter => in squad
+            sparse.hstack([sparse.csr_matrix((n, n)), -eye, eye]),   # captain => starter
+        ], format='csr')
+        lower = np.concatenate([lower, np.full(2 * n, -np.inf)])
+        upper = np.concatenate([upper, np.zeros(2 * n)])
+        return c, LinearConstraint(A, lower, upper)
+
+    def solve(self):
+        n = len(self.pool)
+        c, constraints = self._build_problem()
+        options = {}
+        if self.time_limit is not None:
+            options['time_limit'] = self.time_limit
+        if self.mip_gap is not None:
+            options['mip_rel_gap'] = self.mip_gap
+
+        result = milp(c, constraints=constraints, integrality=np.ones(3 * n),
+                      bounds=Bounds(0, 1), options=options)
+        SOLVER_RUNS.inc(model='squad', outcome=SOLVER_OUTCOMES.get(result.status, 'error'))
+        # A time-limited solve can still return its best incumbent
+        if result.x is None:
+            raise ValueError("Optimization failed: " + result.message)
+
+        x = np.round(result.x).astype(bool)
+        squad_idx = np.flatnonzero(x[:n])
+        starter_idx = np.flatnonzero(x[n:2 * n])
+        captain_idx = np.flatnonzero(x[2 * n:])
+        return self._selection(squad_idx, starter_idx, captain_idx, result.message)
+
+    def selection_for(self, squad_idx, starter_idx, captain_idx, status=''):
+        # Rebuild a SquadSelection for known row indices against the current data
+        return self._selection(np.asarray(squad_idx, dtype=np.int64), np.asarray(starter_idx, dtype=np.int64),
+                               np.asarray(captain_idx, dtype=np.int64), status)
+
+    def _selection(self, squad_idx, starter_idx, captain_idx, status):
+        pool = self.pool
+        points, codes = pool.points, pool.position_codes
+        starter_set = set(starter_idx.tolist())
+        rank = np.where(codes >= 0, codes, len(POSITIONS))   # unknown positions last
+        starters = sorted(starter_idx.tolist(), key=lambda i: (rank[i], -points[i]))
+        # Bench order: reserve goalkeeper first, then outfield players by expected points
+        bench = sorted((i for i in squad_idx.tolist() if i not in starter_set),
+                       key=lambda i: (codes[i] != POSITION_CODES['GKP'], -points[i]))
+        by_points = sorted(starters, key=lambda i: -points[i])
+        captain = int(captain_idx[0]) if len(captain_idx) else (by_points[0] if by_points else None)
+        vice = next((i for i in by_points if i != captain), None)
+
+        rows = pool.rows(squad_idx)
+        by_row = dict(zip(squad_idx.tolist(), rows))
+        return SquadSelection(
+            squad=rows,
+            starters=[by_row[i] for i in starters],
+            bench=[by_row[i] for i in bench],
+            captain=by_row.get(captain),
+            vice_captain=by_row.get(vice),
+            total_cost=float(np.round(pool.costs[squad_idx] * 10).sum()) / 10,
+            expected_points=float(points[starters].sum() + (points[captain] if captain is not None else 0)),
+            status=status,
+            indices=squad_idx.tolist(),
+            starter_indices=starters,
+            captain_index=captain,
         )
 
-        if result.success:
-            selected_players = np.round(result.x).astype(int)
-            return [self.player_data[i] for i in range(num_players) if selected_players[i] == 1]
-        else:
-            raise ValueError("Optimization failed: " + result.message)
\ No newline at end of file
+    def optimize_team(self):
+        return self.solve().squad
+
+
+def best_lineup(players, points_key='expected_points'):
+    # Greedy valid XI from a squad: fill each position's minimum, then the best
+    # remaining players under the position maximums. Tracks list positions, so players
+    # are never compared field by field.
+    order = sorted(range(len(players)), key=lambda i: -float(players[i].get(points_key, 0)))
+    counts = {pos: 0 for pos in POSITIONS}
+    chosen = []
+    for i in order:
+        pos = players[i]['position']
+        if pos in counts and counts[pos] < STARTING_LIMITS[pos][0]:
+            chosen.append(i)
+            counts[pos] += 1
+    taken = set(chosen)
+    for i in order:
+        if len(chosen) >= STARTING_SIZE:
+            break
+        pos = players[i]['position']
+        if pos in counts and i not in taken and counts[pos] < STARTING_LIMITS[pos][1]:
+            chosen.append(i)
+            counts[pos] += 1
+    return [players[i] for i in chosen]
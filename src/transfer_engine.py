@@ -0,0 +1,259 @@
+from dataclasses import dataclass
+from itertools import combinations
+
+import numpy as np
+
+from src.metrics import TRANSFER_COMBINATIONS
+from src.player_pool import as_pool
+
+MAX_PER_CLUB = 3
+HIT_COST = 4
+# Leading-slot combinations expanded against the last slot at a time in multi-transfer search
+LEAD_CHUNK = 4096
+
+
+@dataclass
+class TransferOption:
+    outs: list
+    ins: list
+    gain: float
+    hit_cost: float
+    net_gain: float
+    cost_delta: float
+
+
+class TransferEngine:
+    # Scores transfers for one squad against the whole player pool. Everything the
+    # search needs is read from the PlayerPool's arrays, indexed by pool row; clubs are
+    # the pool's dense club index.
+    def __init__(self, player_data, squad_ids, bank, free_transfers=1, hit_cost=HIT_COST, max_per_club=MAX_PER_CLUB):
+        self.pool = pool = as_pool(player_data)
+        self.bank = float(bank)
+        self.free_transfers = free_transfers
+        self.hit_cost = hit_cost
+        self.max_per_club = max_per_club
+
+        self.ids = pool.ids
+        rows = pool.rows_for(list(squad_ids))
+        self.squad_rows = rows[rows >= 0]
+        self.positions = pool.position_codes
+        self.clubs = pool.club_index
+        self.costs = pool.costs
+        self.points = pool.points
+
+        self.in_squad = np.zeros(len(pool), dtype=bool)
+        self.in_squad[self.squad_rows] = True
+        self.club_counts = np.bincount(self.clubs[self.squad_rows], minlength=max(len(pool.club_ids), 1))
+
+    def gain_matrix(self, out_rows=None):
+        # Rows are outgoing squad players, columns the full pool. Illegal swaps are -inf.
+        out_rows = self.squad_rows if out_rows is None else np.asarray(out_rows, dtype=np.int64)
+        gains = self.points[None, :] - self.points[out_rows, None]
+        same_position = self.positions[None, :] == self.positions[out_rows, None]
+        affordable = self.costs[None, :] <= self.bank + self.costs[out_rows, None] + 1e-9
+        same_club = self.clubs[None, :] == self.clubs[out_rows, None]
+        club_ok = (self.club_counts[self.clubs][None, :] + 1 - same_club) <= self.max_per_club
+        legal = same_position & affordable & club_ok & ~self.in_squad[None, :]
+        return np.where(legal, gains, -np.inf)
+
+    def _candidates(self, out_row):
+        # Every in-player for out_row's position, best first. Worse players stay in: a
+        # downgrade can fund another slot's upgrade. Budget and club limits depend on the
+        # whole combination; see _legal_candidates.
+        rows = np.flatnonzero((self.positions == self.positions[out_row]) & ~self.in_squad)
+        rows = rows[np.argsort(-self.points[rows], kind='stable')]
+        return rows, self.points[rows] - self.points[out_row]
+
+    def _legal_candidates(self, outs, candidates):
+        # Drop in-players that cannot appear in any legal swap for these outs: those who
+        # cost more than the freed budget less the cheapest possible other ins, and those
+        # from a club that is already full once the outs have left. Slots of the same
+        # position keep the same rows, which _combinations' ordering rule relies on.
+        base = self.club_counts.copy()
+        np.subtract.at(base, self.clubs[list(outs)], 1)
+        budget = self.bank + self.costs[list(outs)].sum() + 1e-9
+        cheapest = np.array([self.costs[rows].min() for rows, _ in candidates])
+        masks = [(self.costs[rows] <= budget - (cheapest.sum() - cheapest[j]))
+                 & (base[self.clubs[rows]] + 1 <= self.max_per_club)
+                 for j, (rows, _) in enumerate(candidates)]
+        for j in range(len(outs)):
+            for other in range(len(outs)):
+                if self.positions[outs[other]] == self.positions[outs[j]]:
+                    masks[j] = masks[j] | masks[other]
+        return [(rows[m], gains[m]) for (rows, gains), m in zip(candidates, masks)]
+
+    def _combinations(self, outs, candidates):
+        # Broadcast every in-player choice for the leading slots of outs into a grid of
+        # (gain, spend); combinations already over budget or a club limit are -inf
+        k = len(candidates)
+        grids = []
+        for j, (rows, _) in enumerate(candidates):
+            shape = [1] * k
+            shape[j] = len(rows)
+            grids.append(rows.reshape(shape))
+
+        gain = sum(gains.reshape(g.shape) for g, (_, gains) in zip(grids, candidates))
+        spend = sum(self.costs[g] for g in grids)
+        legal = spend <= self.bank + self.costs[list(outs)].sum() + 1e-9
+
+        base = self.club_counts.copy()
+        np.subtract.at(base, self.clubs[list(outs)], 1)
+        for j in range(k):
+            club_j = self.clubs[grids[j]]
+            count = np.ones_like(club_j)
+            for other in range(k):
+                if other == j:
+                    continue
+                count = count + (self.clubs[grids[other]] == club_j)
+                # Slots for the same position are interchangeable, so keep one ordering only
+                if other > j and self.positions[outs[other]] == self.positions[outs[j]]:
+                    legal = legal & (grids[j] < grids[other])
+            legal = legal & (base[club_j] + count <= self.max_per_club)
+        return np.where(legal, gain, -np.inf), spend, grids
+
+    def _slot_bounds(self, cands, budget):
+        # For every slot, each player's gain plus the best every other slot can afford
+        # from what is left once the cheapest of the rest are paid for. Club limits and
+        # duplicates are ignored, so these never underestimate.
+        cheapest = np.array([self.costs[rows].min() for rows, _ in cands])
+        by_cost = []
+        for rows, gains in cands:
+            order = np.argsort(self.costs[rows], kind='stable')
+            by_cost.append((self.costs[rows][order], np.maximum.accumulate(gains[order])))
+        bounds = []
+        for j, (rows, gains) in enumerate(cands):
+            bound = gains.astype(float)
+            for o, (costs, best) in enumerate(by_cost):
+                if o != j:
+                    left = budget - self.costs[rows] - (cheapest.sum() - cheapest[j] - cheapest[o])
+                    at = np.searchsorted(costs, left, side='right') - 1
+                    bound = bound + np.where(at >= 0, best[np.maximum(at, 0)], -np.inf)
+            bounds.append(bound)
+        return bounds
+
+    def _search_combination(self, outs, candidates, hit, found, top_k):
+        # The top_k swaps for one set of outs, exactly. Every legal choice for all but the
+        # last slot is enumerated; each gets an upper bound from the best last-slot player
+        # it can still afford, and is expanded against the last slot in bound order until
+        # the bound falls below the current top_k.
+        cands = self._legal_candidates(outs, [candidates[o] for o in outs])
+        if any(len(rows) == 0 for rows, _ in cands):
+            return []
+        k = len(outs)
+        budget = self.bank + self.costs[list(outs)].sum() + 1e-9
+        scores = sorted((f[0] for f in found), reverse=True)
+        threshold = max(scores[top_k - 1] if len(scores) >= top_k else -np.inf, 0)
+        # Drop players who cannot reach the current top_k whatever the other slots hold,
+        # until that stops shrinking the lists
+        while True:
+            keep = [bound - hit > threshold for bound in self._slot_bounds(cands, budget)]
+            for j in range(k):
+                for other in range(k):
+                    if self.positions[outs[other]] == self.positions[outs[j]]:
+                        keep[j] = keep[j] | keep[other]
+            if all(m.all() for m in keep):
+                break
+            cands = [(rows[m], gains[m]) for (rows, gains), m in zip(cands, keep)]
+            if any(len(rows) == 0 for rows, _ in cands):
+                return []
+        base = self.club_counts.copy()
+        np.subtract.at(base, self.clubs[list(outs)], 1)
+
+        grid, spend, grids = self._combinations(outs, cands[:-1])
+        TRANSFER_COMBINATIONS.inc(grid.size, transfers=k)
+        flat = np.flatnonzero(np.isfinite(grid))
+        lead = np.stack([np.broadcast_to(g, grid.shape).reshape(-1)[flat] for g in grids], axis=1)
+        lead_gain = grid.reshape(-1)[flat]
+        lead_spend = spend.reshape(-1)[flat]
+
+        rows, gains = cands[-1]
+        by_cost = np.argsort(self.costs[rows], kind='stable')
+        best = np.maximum.accumulate(gains[by_cost])
+        at = np.searchsorted(self.costs[rows][by_cost], budget - lead_spend, side='right') - 1
+        bound = np.where(at >= 0, lead_gain + best[np.maximum(at, 0)], -np.inf) - hit
+        order = np.flatnonzero(bound > threshold)
+        order = order[np.argsort(-bound[order], kind='stable')]
+        same_position = [j for j in range(k - 1) if self.positions[outs[j]] == self.positions[outs[-1]]]
+
+        local = []
+        for chunk in range(0, len(order), LEAD_CHUNK):
+            threshold = max(scores[top_k - 1] if len(scores) >= top_k else -np.inf, 0)
+            idx = order[chunk:chunk + LEAD_CHUNK]
+            idx = idx[bound[idx] > threshold]
+            if not len(idx):
+                break
+            # Last-slot players good enough to pass the threshold are a prefix of rows
+            counts = np.searchsorted(-gains, lead_gain[idx] - hit - threshold, side='left')
+            which = np.repeat(idx, counts)
+            last = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            TRANSFER_COMBINATIONS.inc(len(last), transfers=k)
+            ins_last = rows[last]
+            club = self.clubs[ins_last]
+            taken = base[club] + 1
+            for j in range(k - 1):
+                taken = taken + (self.clubs[lead[which, j]] == club)
+            legal = (lead_spend[which] + self.costs[ins_last] <= budget) & (taken <= self.max_per_club)
+            for j in same_position:
+                legal &= lead[which, j] < ins_last
+            net = lead_gain[which] + gains[last] - hit
+            for i in np.flatnonzero(legal)[np.argsort(-net[legal], kind='stable')][:top_k]:
+                ins = tuple(int(r) for r in lead[which[i]]) + (int(ins_last[i]),)
+                local.append((float(net[i]), outs, ins))
+            local.sort(key=lambda f: -f[0])
+            del local[top_k:]
+            scores = sorted([f[0] for f in found] + [f[0] for f in local], reverse=True)
+        return local
+
+    def search(self, max_transfers=1, top_k=5, out_ids=None):
+        if out_ids is not None:
+            wanted = set(out_ids)
+            out_rows = [r for r in self.squad_rows.tolist() if self.ids[r] in wanted]
+        else:
+            out_rows = self.squad_rows.tolist()
+
+        found = []   # (net_gain, outs, ins)
+        singles = self.gain_matrix(out_rows)
+        TRANSFER_COMBINATIONS.inc(singles.size, transfers=1)
+        flat = np.argsort(-singles, axis=None)[:top_k]
+        hit = self.hit_cost * max(0, 1 - self.free_transfers)
+        for idx in flat:
+            o, i = np.unravel_index(idx, singles.shape)
+            if np.isfinite(singles[o, i]):
+                found.append((singles[o, i] - hit, (out_rows[o],), (int(i),)))
+        found.sort(key=lambda f: -f[0])
+
+        candidates = {r: self._candidates(r) for r in out_rows} if max_transfers > 1 else {}
+        improvable = [r for r in out_rows if len(candidates.get(r, ((), ()))[0])]
+        best_gain = {r: candidates[r][1][0] for r in improvable}
+        for k in range(2, max_transfers + 1):
+            hit = self.hit_cost * max(0, k - self.free_transfers)
+            # Upper bound per combination: every slot gets its best candidate with no
+            # interaction. Visiting combinations in bound order lets us stop early.
+            combos = list(combinations(improvable, k))
+            bounds = [sum(best_gain[o] for o in outs) - hit for outs in combos]
+            for b in np.argsort(bounds)[::-1]:
+                outs = combos[b]
+                threshold = found[-1][0] if len(found) >= top_k else -np.inf
+                if bounds[b] <= max(threshold, 0):
+                    break
+                found.extend(self._search_combination(outs, candidates, hit, found, top_k))
+                found.sort(key=lambda f: -f[0])
+                del found[top_k:]
+
+        found.sort(key=lambda f: -f[0])
+        found = found[:top_k]
+        needed = sorted(set(r for _, outs, ins in found for r in outs + ins))
+        rows = dict(zip(needed, self.pool.rows(needed)))
+        options = []
+        for net, outs, ins in found:
+            k = len(outs)
+            hit = self.hit_cost * max(0, k - self.free_transfers)
+            options.append(TransferOption(
+                outs=[rows[r] for r in outs],
+                ins=[rows[r] for r in ins],
+                gain=float(net + hit),
+                hit_cost=float(hit),
+                net_gain=float(net),
+                cost_delta=float(self.costs[list(ins)].sum() - self.costs[list(outs)].sum()),
+            ))
+        return options
@@ -0,0 +1,324 @@
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import milp, LinearConstraint, Bounds
+
+from src.data_processor import column_values
+from src.metrics import SOLVER_RUNS, SOLVER_OUTCOMES
+from src.player_pool import as_pool
+from src.team_optimizer import (POSITIONS, SQUAD_SIZE, STARTING_LIMITS, STARTING_SIZE,
+                                MAX_PER_CLUB, BENCH_WEIGHT)
+
+HIT_COST = 4
+MAX_FREE_TRANSFERS = 5
+MAX_HITS_PER_WEEK = 6
+# Players kept per position besides the current squad. Far below this cut-off a
+# player cannot enter an optimal plan, and it keeps an 8-week model small.
+CANDIDATES_PER_POSITION = 30
+
+
+@dataclass
+class PlannedWeek:
+    gw: int
+    transfers_in: list
+    transfers_out: list
+    free_transfers: int
+    hits: int
+    squad_ids: list
+    starter_ids: list
+    captain_id: int
+    expected_points: float
+
+
+@dataclass
+class HorizonPlan:
+    start_gw: int
+    weeks: list
+    objective: float
+    status: str
+    optimal: bool
+    solve_time: float
+    gap: float = None   # relative gap to the solver's bound; None when unknown
+    squad_history: dict = field(default_factory=dict)   # gw -> squad ids, used for warm starts
+
+
+def gameweek_points(player_frame, fixture_matrix, start_gw, horizon):
+    # [n_players, horizon] expected points. The model predicts season totals, so
+    # spread them over the gameweeks played and scale by each week's fixtures.
+    per_game = column_values(player_frame, 'expected_points').astype(float) / max(start_gw - 1, 1)
+    teams = column_values(player_frame, 'team').astype(np.int64)
+    return per_game[:, None] * fixture_matrix.multipliers(teams, start_gw, horizon)
+
+
+class TransferPlanner:
+    # Multi-gameweek transfer plan as one MILP. Per week and candidate it has squad,
+    # starter, captain, transfer-in and transfer-out binaries, plus per-week free
+    # transfers, hits and a took-a-hit flag so banking and -4 hits are modelled exactly.
+    def __init__(self, player_data, points_by_gw, squad_ids, bank, free_transfers=1, start_gw=1,
+                 hit_cost=HIT_COST, discount=1.0, bench_weight=BENCH_WEIGHT, max_per_club=MAX_PER_CLUB,
+                 candidates_per_position=CANDIDATES_PER_POSITION):
+        self.pool = pool = as_pool(player_data)
+        self.start_gw = start_gw
+        self.bank = float(bank)
+        self.free_transfers = int(min(max(free_transfers, 1), MAX_FREE_TRANSFERS))
+        self.hit_cost = hit_cost
+        self.discount = discount
+        self.bench_weight = bench_weight
+        self.max_per_club = max_per_club
+        self.horizon = points_by_gw.shape[1]
+
+        squad_rows = pool.rows_for(list(squad_ids))
+        squad_rows = squad_rows[squad_rows >= 0]
+
+        # Candidate pruning: the current squad plus the best players per position over the horizon
+        total = points_by_gw.sum(axis=1)
+        keep = set(squad_rows.tolist())
+        for position in POSITIONS:
+            rows = np.flatnonzero(pool.position_mask(position))
+            keep.update(rows[np.argsort(-total[rows])[:candidates_per_position]].tolist())
+        self.rows = np.array(sorted(keep), dtype=np.int64)
+
+        self.ids = pool.ids[self.rows]
+        self.positions = pool.column('position').astype(str)[self.rows]
+        self.clubs = pool.clubs[self.rows]
+        self.costs = np.round(pool.costs[self.rows] * 10).astype(np.int64)
+        self.points = points_by_gw[self.rows]
+        self.x0 = np.isin(self.rows, squad_rows).astype(float)
+        # Selling at current prices keeps total squad value fixed across the plan
+        self.value_cap = int(round(self.bank * 10)) + int(self.costs[self.x0 > 0].sum())
+
+    def _layout(self):
+        C = len(self.rows)
+        block = 5 * C + 3
+        return C, block
+
+    def _var(self, w, kind, idx=0):
+        C, block = self._layout()
+        offset = {'x': 0, 's': C, 'c': 2 * C, 'i': 3 * C, 'o': 4 * C, 'ft': 5 * C, 'h': 5 * C + 1, 'y': 5 * C + 2}[kind]
+        return w * block + offset + idx
+
+    def _build(self):
+        C, block = self._layout()
+        H = self.horizon
+        nvars = H * block
+        data, rows, cols, lo, hi = [], [], [], [], []
+
+        def add(var_cols, vals, l, u):
+            r = len(lo)
+            rows.extend([r] * len(var_cols))
+            cols.extend(var_cols)
+            data.extend(vals)
+            lo.append(l)
+            hi.append(u)
+
+        c = np.zeros(nvars)
+        bw = self.bench_weight
+        all_c = np.arange(C)
+        for w in range(H):
+            weight = self.discount ** w
+            pts = self.points[:, w]
+            x, s, cap = self._var(w, 'x', all_c), self._var(w, 's', all_c), self._var(w, 'c', all_c)
+            i, o = self._var(w, 'i', all_c), self._var(w, 'o', all_c)
+            ft, h = self._var(w, 'ft'), self._var(w, 'h')
+            c[x] = -weight * bw * pts
+            c[s] = -weight * (1 - bw) * pts
+            c[cap] = -weight * pts
+            c[h] = self.hit_cost
+
+            # Squad flow from the previous week (or the current squad)
+            for p in range(C):
+                if w == 0:
+                    add([x[p], i[p], o[p]], [1, -1, 1], self.x0[p], self.x0[p])
+                else:
+                    prev = self._var(w - 1, 'x', p)
+                    add([x[p], prev, i[p], o[p]], [1, -1, -1, 1], 0, 0)
+
+            add(x.tolist(), self.costs.tolist(), -np.inf, self.value_cap)
+            for position in POSITIONS:
+                members = np.flatnonzero(self.positions == position)
+                count = SQUAD_SIZE[position]
+                add(x[members].tolist(), [1] * len(members), count, count)
+                low, high = STARTING_LIMITS[position]
+                add(s[members].tolist(), [1] * len(members), low, min(high, count))
+            for club in np.unique(self.clubs):
+                members = np.flatnonzero(self.clubs == club)
+                add(x[members].tolist(), [1] * len(members), -np.inf, self.max_per_club)
+            add(s.tolist(), [1] * C, STARTING_SIZE, STARTING_SIZE)
+            add(cap.tolist(), [1] * C, 1, 1)
+            for p in range(C):
+                add([s[p], x[p]], [1, -1], -np.inf, 0)
+                add([cap[p], s[p]], [1, -1], -np.inf, 0)
+
+            # Transfers beyond the free ones are hits; unused free transfers bank up to
+            # the cap. Taking any hit (y) means no free transfers were left to bank.
+            y = self._var(w, 'y')
+            add(i.tolist() + [h, ft], [1] * C + [-1, -1], -np.inf, 0)
+            add([h, y], [1, -MAX_HITS_PER_WEEK], -np.inf, 0)
+            if w + 1 < H:
+                nxt = self._var(w + 1, 'ft')
+                add([nxt, ft] + i.tolist() + [h], [1, -1] + [1] * C + [-1], -np.inf, 1)
+                add([nxt, y], [1, MAX_FREE_TRANSFERS - 1], -np.inf, MAX_FREE_TRANSFERS)
+
+        A = sparse.csr_matrix((data, (rows, cols)), shape=(len(lo), nvars))
+        lower = np.zeros(nvars)
+        upper = np.ones(nvars)
+        integrality = np.ones(nvars)
+        for w in range(H):
+            ft, h = self._var(w, 'ft'), self._var(w, 'h')
+            lower[ft], upper[ft] = 1, MAX_FREE_TRANSFERS
+            upper[h] = MAX_HITS_PER_WEEK
+        lower[self._var(0, 'ft')] = upper[self._var(0, 'ft')] = self.free_transfers
+        return c, A, np.array(lo, dtype=float), np.array(hi, dtype=float), Bounds(lower, upper), integrality
+
+    def _warm_start_solution(self, plan):
+        # The previous plan's squads as a solution of today's model, or None once it has
+        # left the candidate pool or breaks a rule (budget, clubs, hits) on today's data.
+        # Weeks past the old horizon keep its last squad.
+        if plan is None:
+            return None
+        squads = [plan.squad_history.get(self.start_gw + w) for w in range(self.horizon)]
+        last = None
+        for w in range(self.horizon):
+            squads[w] = squads[w] if squads[w] is not None else last
+            last = squads[w]
+        if squads[0] is None:
+            return None
+        index = {pid: k for k, pid in enumerate(self.ids.tolist())}
+        if any(pid not in index for squad in squads for pid in squad):
+            return None
+        return self._fixed_solution([np.array([index[pid] for pid in squad]) for squad in squads])
+
+    def _lineup(self, members, w):
+        # Greedy XI: fill each position's minimum, then the best remaining players under the caps
+        pts = self.points[members, w]
+        order = np.argsort(-pts)
+        chosen, counts = [], {p: 0 for p in POSITIONS}
+        for k in order:
+            pos = self.positions[members[k]]
+            if counts[pos] < STARTING_LIMITS[pos][0]:
+                chosen.append(k)
+                counts[pos] += 1
+        for k in order:
+            if len(chosen) >= STARTING_SIZE:
+                break
+            pos = self.positions[members[k]]
+            if k not in chosen and counts[pos] < STARTING_LIMITS[pos][1]:
+                chosen.append(k)
+                counts[pos] += 1
+        return members[chosen]
+
+    def _fixed_solution(self, squads):
+        # Model solution for a given squad per week: the best XI and captain, with free
+        # transfers banked and hits taken as the rules dictate. None if a squad is illegal.
+        z = np.zeros(self.horizon * self._layout()[1])
+        ft, prev = self.free_transfers, self.x0 > 0
+        for w, members in enumerate(squads):
+            x = np.zeros(len(self.rows), dtype=bool)
+            x[members] = True
+            if x.sum() != len(members) or self.costs[x].sum() > self.value_cap:
+                return None
+            if any(np.count_nonzero(self.positions[x] == p) != n for p, n in SQUAD_SIZE.items()):
+                return None
+            if np.unique(self.clubs[x], return_counts=True)[1].max() > self.max_per_club:
+                return None
+            moved = int(np.count_nonzero(x & ~prev))
+            hits = max(0, moved - ft)
+            if hits > MAX_HITS_PER_WEEK:
+                return None
+            starters = self._lineup(members, w)
+            z[self._var(w, 'x', members)] = 1
+            z[self._var(w, 's', starters)] = 1
+            z[self._var(w, 'c', starters[np.argmax(self.points[starters, w])])] = 1
+            z[self._var(w, 'i', np.flatnonzero(x & ~prev))] = 1
+            z[self._var(w, 'o', np.flatnonzero(prev & ~x))] = 1
+            z[self._var(w, 'ft')] = ft
+            z[self._var(w, 'h')] = hits
+            z[self._var(w, 'y')] = hits > 0
+            ft = min(MAX_FREE_TRANSFERS, ft - (moved - hits) + 1)
+            prev = x
+        return z
+
+    def _squads(self, z):
+        C, _ = self._layout()
+        return [np.flatnonzero(z[self._var(w, 'x', np.arange(C))] > 0) for w in range(self.horizon)]
+
+    def _hold_solution(self):
+        # Feasible fallback: keep the current squad every week, banking free transfers
+        members = np.flatnonzero(self.x0 > 0)
+        return self._fixed_solution([members] * self.horizon)
+
+    def solve(self, time_budget=None, mip_gap=None, warm_start=None):
+        # Solve within the time budget. HiGHS through scipy takes no initial solution, so
+        # the previous plan (re-scored on today's data) competes with the solver's
+        # incumbent afterwards; failing both, the current squad is held.
+        started = time.time()
+        c, A, lo, hi, bounds, integrality = self._build()
+        warm = self._warm_start_solution(warm_start)
+
+        options = {}
+        if time_budget is not None:
+            options['time_limit'] = max(time_budget - (time.time() - started), 0.1)
+        if mip_gap is not None:
+            options['mip_rel_gap'] = mip_gap
+        result = milp(c, constraints=LinearConstraint(A, lo, hi), integrality=integrality,
+                      bounds=bounds, options=options)
+        SOLVER_RUNS.inc(model='planner', outcome=SOLVER_OUTCOMES.get(result.status, 'error'),
+                        warm_start=warm is not None)
+        z, optimal, status = None, False, result.message
+        if result.x is not None:
+            z, optimal = np.round(result.x), result.status == 0
+            # A time-limited incumbent can carry a weak XI or captain for its squads
+            polished = None if optimal else self._fixed_solution(self._squads(z))
+            if polished is not None and -c @ polished > -c @ z + 1e-6:
+                z = polished
+        if warm is not None and (z is None or -c @ warm > -c @ z + 1e-6):
+            z, optimal, status = warm, False, f"previous plan kept ({result.message})"
+        if z is None:
+            z = self._hold_solution()
+            if z is None:
+                raise ValueError("Planning failed: " + result.message)
+        objective = float(-c @ z)
+        # Relative distance to the solver's proven bound; 0 when solved to optimality
+        bound = getattr(result, 'mip_dual_bound', None)
+        gap = 0.0 if optimal else None
+        if not optimal and bound is not None and np.isfinite(bound):
+            gap = max(0.0, (-bound - objective) / max(abs(objective), 1.0))
+        return self._plan(z, objective, status, optimal, time.time() - started, gap)
+
+    def _plan(self, z, objective, status, optimal, elapsed, gap=None):
+        C, _ = self._layout()
+        weeks, history = [], {}
+        prev = self.x0 > 0
+        for w in range(self.horizon):
+            x = z[self._var(w, 'x', np.arange(C))] > 0
+            s = z[self._var(w, 's', np.arange(C))] > 0
+            cap = z[self._var(w, 'c', np.arange(C))] > 0
+            ins, outs = np.flatnonzero(x & ~prev), np.flatnonzero(prev & ~x)
+            gw = self.start_gw + w
+            captain = self.ids[cap][0] if cap.any() else None
+            pts = self.points[:, w]
+            weeks.append(PlannedWeek(
+                gw=gw,
+                transfers_in=self.pool.rows(self.rows[ins]),
+                transfers_out=self.pool.rows(self.rows[outs]),
+                free_transfers=int(z[self._var(w, 'ft')]),
+                hits=int(z[self._var(w, 'h')]),
+                squad_ids=self.ids[x].tolist(),
+                starter_ids=self.ids[s].tolist(),
+                captain_id=int(captain) if captain is not None else None,
+                expected_points=float(pts[s].sum() + pts[cap].sum()),
+            ))
+            history[gw] = self.ids[x].tolist()
+            prev = x
+        return HorizonPlan(
+            start_gw=self.start_gw,
+            weeks=weeks,
+            objective=objective,
+            status=status,
+            optimal=optimal,
+            solve_time=elapsed,
+            gap=gap,
+            squad_history=history,
+        )
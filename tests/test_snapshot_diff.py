@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import bootstrap_payload
+from src.data_processor import build_player_frame
+from src.player_pool import PlayerPool
+from src.snapshot_diff import squad_affected
+from src.team_optimizer import BENCH_WEIGHT, TeamOptimizer
+
+BUDGET = 100.0
+
+
+def player_frame(seed=0, n_players=150):
+    boot = bootstrap_payload(n_players, 20, seed=seed)
+    frame = build_player_frame(boot['elements'], [], boot['teams'])
+    frame['expected_points'] = frame['total_points'].astype(float)
+    return frame
+
+
+def objective(pool, selection):
+    # The squad model's objective, so a reused squad and a fresh solve compare directly
+    points = pool.points
+    captain = points[selection.captain_index] if selection.captain_index is not None else 0.0
+    return (BENCH_WEIGHT * points[selection.indices].sum()
+            + (1 - BENCH_WEIGHT) * points[selection.starter_indices].sum() + captain)
+
+
+def check_against_full_solve(old_frame, new_frame, rows, selection):
+    # When squad_affected lets the previous squad stand, it must be as good as a cold solve
+    reason = squad_affected(old_frame, new_frame, rows, selection)
+    if reason is None:
+        pool = PlayerPool.from_frame(new_frame)
+        reused = TeamOptimizer(pool, BUDGET).selection_for(*selection.incumbent())
+        full = TeamOptimizer(pool, BUDGET).solve()
+        assert objective(pool, reused) == pytest.approx(objective(pool, full), rel=1e-3)
+    return reason
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_skipped_squads_match_a_full_solve(seed):
+    old_frame = player_frame(seed)
+    selection = TeamOptimizer(PlayerPool.from_frame(old_frame), BUDGET).solve()
+    rng = np.random.default_rng(seed)
+    outsiders = np.setdiff1d(np.arange(len(old_frame)), selection.indices)
+    for _ in range(5):
+        rows = rng.choice(outsiders, size=4, replace=False)
+        new_frame = old_frame.copy()
+        new_frame.loc[rows, 'expected_points'] *= rng.uniform(0.5, 1.5, size=len(rows))
+        new_frame.loc[rows, 'cost'] -= rng.choice([0.0, 0.5, 1.0], size=len(rows))
+        check_against_full_solve(old_frame, new_frame, rows, selection)
+
+
+def test_worse_outsiders_keep_the_squad():
+    old_frame = player_frame()
+    selection = TeamOptimizer(PlayerPool.from_frame(old_frame), BUDGET).solve()
+    rows = np.setdiff1d(np.arange(len(old_frame)), selection.indices)[:10]
+    new_frame = old_frame.copy()
+    new_frame.loc[rows, 'expected_points'] *= 0.5
+    assert check_against_full_solve(old_frame, new_frame, rows, selection) is None
+
+
+def test_outsider_dominated_by_same_club_keepers_keeps_the_squad():
+    # Two cheap, high-scoring keepers from one club are certain picks; a third keeper
+    # from that club who improves but stays behind both can never displace them
+    old_frame = player_frame()
+    keepers = np.flatnonzero(old_frame['position'].to_numpy() == 'GKP')
+    first, second, outsider = keepers[:3]
+    club = old_frame.loc[first, 'team']
+    old_frame.loc[[first, second, outsider], 'team'] = club
+    old_frame.loc[[first, second], ['cost', 'expected_points']] = [4.0, 300.0]
+    old_frame.loc[outsider, ['cost', 'expected_points']] = [5.0, 10.0]
+    selection = TeamOptimizer(PlayerPool.from_frame(old_frame), BUDGET).solve()
+    assert {first, second} <= set(selection.indices)
+
+    new_frame = old_frame.copy()
+    new_frame.loc[outsider, ['cost', 'expected_points']] = [4.5, 250.0]
+    assert check_against_full_solve(old_frame, new_frame, [outsider], selection) is None
+
+    new_frame.loc[outsider, 'expected_points'] = 350.0
+    assert check_against_full_solve(old_frame, new_frame, [outsider], selection) is not None
+
+
+def test_dominating_keepers_from_another_club_do_not_count():
+    # Both squad keepers beat the outsider on points and cost, but they share a club
+    # with two cheap stars. Once the outsider is nearly as good, swapping one keeper for
+    # it frees a club place for the second star, so the old squad is no longer optimal.
+    old_frame = player_frame()
+    positions = old_frame['position'].to_numpy()
+    keepers = np.flatnonzero(positions == 'GKP')
+    first, second, outsider = keepers[:3]
+    club = old_frame.loc[first, 'team']
+    old_frame.loc[[first, second], 'team'] = club
+    old_frame.loc[outsider, 'team'] = next(c for c in old_frame['team'].unique() if c != club)
+    old_frame.loc[keepers, 'expected_points'] = 0.0
+    old_frame.loc[[first, second, outsider], 'cost'] = 4.0
+    old_frame.loc[[first, second, outsider], 'expected_points'] = [30000.0, 20000.0, 10.0]
+    stars = np.flatnonzero((old_frame['team'].to_numpy() == club) & (positions != 'GKP'))[:2]
+    old_frame.loc[stars, ['cost', 'expected_points']] = [4.0, old_frame['expected_points'].nlargest(3).iloc[-1] + 50]
+    selection = TeamOptimizer(PlayerPool.from_frame(old_frame), BUDGET).solve()
+    assert {first, second} <= set(selection.indices)
+
+    new_frame = old_frame.copy()
+    new_frame.loc[outsider, 'expected_points'] = 19999.0
+    pool = PlayerPool.from_frame(new_frame)
+    reused = TeamOptimizer(pool, BUDGET).selection_for(*selection.incumbent())
+    assert objective(pool, TeamOptimizer(pool, BUDGET).solve()) > objective(pool, reused)
+    assert squad_affected(old_frame, new_frame, [outsider], selection) is not None